@@ -0,0 +1,159 @@
+import threading
+import time
+
+import numpy as np
+from scipy import fft
+
+from robonet.buffers.buffer_objects import AudioBuffer
+from robonet.buffers.buffer_handling import pack_obj
+
+
+class SampleRingBuffer:
+    """Single-producer, single-consumer ring of audio samples.
+
+    The producer (the sounddevice callback) only ever advances write_count and the consumer only ever advances
+    read_count, so neither side needs a lock. A write that doesn't fit is dropped and counted instead of blocking.
+    """
+
+    def __init__(self, capacity, channels, dtype=np.float32):
+        self.buffer = np.zeros((capacity, channels), dtype=dtype)
+        self.capacity = capacity
+        self.write_count = 0
+        self.read_count = 0
+        self.overflows = 0
+        self.dropped_samples = 0
+
+    def available(self):
+        """Number of samples written but not yet consumed."""
+        return self.write_count - self.read_count
+
+    def write(self, samples):
+        """Copy samples in. Called from the real-time thread, so it never waits."""
+        n = len(samples)
+        if n > self.capacity - self.available():
+            self.overflows += 1
+            self.dropped_samples += n
+            return False
+        start = self.write_count % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        if first < n:
+            self.buffer[:n - first] = samples[first:]
+        self.write_count += n  # publish only after the copy is done
+        return True
+
+    def peek(self, out):
+        """Copy the oldest len(out) unread samples into out without consuming them."""
+        n = len(out)
+        start = self.read_count % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if first < n:
+            out[first:] = self.buffer[:n - first]
+
+    def advance(self, n):
+        """Consume n samples."""
+        self.read_count += min(n, self.available())
+
+
+class StftFramer:
+    """Windowed STFT of fixed size frames.
+
+    The window, frame buffer and FFT length never change, so scipy's plan cache gets hit on every frame after the
+    first, and nothing gets allocated except the output spectrum.
+    """
+
+    def __init__(self, frame_size, channels, num_bins=None):
+        self.frame_size = frame_size
+        self.num_bins = min(num_bins or frame_size // 2, frame_size // 2 + 1)
+        # periodic hann, so overlapping frames sum to a constant
+        self.window = np.hanning(frame_size + 1)[:-1].astype(np.float32)[:, np.newaxis]
+        self.frame = np.zeros((frame_size, channels), dtype=np.float32)
+
+    def transform(self):
+        """FFT the current contents of self.frame. Returns complex64 bins with shape (num_bins, channels)."""
+        np.multiply(self.frame, self.window, out=self.frame)
+        x = fft.rfft(self.frame, n=self.frame_size, axis=0, overwrite_x=True)
+        return x[:self.num_bins].astype(np.complex64, copy=False)
+
+
+class MicFftStreamer:
+    """Moves audio from the sounddevice callback to the network without doing any work in the callback.
+
+    audio_callback only copies samples into a SampleRingBuffer. run() does the overlapping STFT framing, packs
+    AudioBuffers and hands them to send. If the network stalls, stale frames get skipped rather than queued.
+    """
+
+    def __init__(self, send, sample_rate=44800, sends_per_sec=24, channels=1, frame_size=None, fft_size=1536,
+                 ring_seconds=1.0, max_backlog_frames=2, encoding=AudioBuffer.COMPLEX64, max_freq=0, stamper=None):
+        self.send = send
+        self.stamper = stamper  # a MetaStamper, to attach latency metadata to every AudioBuffer
+        self.encoding = encoding
+        self.max_freq = max_freq
+        self.sample_rate = sample_rate
+        self.sends_per_sec = sends_per_sec
+        self.hop_size = sample_rate // sends_per_sec
+        self.frame_size = frame_size or 2 * self.hop_size  # 50% overlap by default
+        self.max_backlog_frames = max_backlog_frames
+
+        self.ring = SampleRingBuffer(max(int(sample_rate * ring_seconds), 2 * self.frame_size), channels)
+        # fft_size // 2 bins are sent, 768 by default like the old callback, or frame_size // 2 with fft_size=None
+        self.framer = StftFramer(self.frame_size, channels, None if fft_size is None else fft_size // 2)
+
+        self.input_overflows = 0  # reported by portaudio
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self._stop = threading.Event()
+
+    def audio_callback(self, indata, frames, time_info, status):
+        """sounddevice InputStream callback. Must stay within the real-time budget, so only copy."""
+        if status and status.input_overflow:
+            self.input_overflows += 1
+        self.ring.write(indata)
+
+    def stats(self):
+        return {
+            'input_overflows': self.input_overflows,
+            'ring_overflows': self.ring.overflows,
+            'ring_dropped_samples': self.ring.dropped_samples,
+            'frames_sent': self.frames_sent,
+            'frames_skipped': self.frames_skipped,
+        }
+
+    def process_available(self):
+        """Send every full frame currently in the ring. Returns the number of frames sent."""
+        sent = 0
+        while self.ring.available() >= self.frame_size:
+            backlog = (self.ring.available() - self.frame_size) // self.hop_size
+            if backlog > self.max_backlog_frames:
+                skip = backlog - self.max_backlog_frames
+                self.ring.advance(skip * self.hop_size)
+                self.frames_skipped += skip
+
+            # the frame's newest sample was captured about one ring's worth of backlog ago
+            capture_time = time.monotonic() - (self.ring.available() - self.frame_size) / self.sample_rate
+            self.ring.peek(self.framer.frame)
+            self.ring.advance(self.hop_size)
+            spectrum = self.framer.transform()
+            obj = AudioBuffer(self.sample_rate, self.sends_per_sec, spectrum, self.encoding, self.max_freq)
+            meta = self.stamper.stamp(obj, capture_time=capture_time) if self.stamper is not None else None
+            self.send(pack_obj(obj, meta))
+            self.frames_sent += 1
+            sent += 1
+        return sent
+
+    def run(self):
+        """Worker loop. Sleeps until the next frame should be ready instead of spinning."""
+        while not self._stop.is_set():
+            self.process_available()
+            missing = self.frame_size - self.ring.available()
+            self._stop.wait(max(missing, 1) / self.sample_rate)
+
+    def start(self):
+        """Run the worker on a background thread."""
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
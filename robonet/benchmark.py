@@ -0,0 +1,382 @@
+"""End to end loopback benchmark, with synthetic sources instead of cameras and microphones.
+
+Synthetic MJPEG, audio and IMU sources go through the real send path (pack_obj with MessageMeta, BurstSender) and the
+real receive path (receive_objs with a LatencyMonitor) into a null sink, over 127.0.0.1 like localhost_pair, on any
+transport in transport.TRANSPORTS. Run it before and after a performance change:
+
+    python -m robonet.benchmark --transport udp --seconds 10 --json before.json
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+import zmq
+
+from robonet import instrumentation
+from robonet.audio import MicFftStreamer
+from robonet.buffers.buffer_handling import pack_obj
+from robonet.buffers.buffer_objects import AudioBuffer, IMUBuffer, MJpegCamFrame
+from robonet.impairment import ImpairedDish, Impairment
+from robonet.latency import LatencyMonitor, MetaStamper
+from robonet.receive_callbacks import receive_objs
+from robonet.transport import open_pair
+from robonet.util import BurstSender
+
+
+class StageTimer:
+    """Wall and CPU time per named stage, for one thread. Nested stages aren't counted in their parent."""
+
+    def __init__(self):
+        self.wall = {}
+        self.cpu = {}
+        self.calls = {}
+        self._stack = []  # [name, wall start, cpu start, child wall, child cpu]
+
+    def start(self, name):
+        self._stack.append([name, time.perf_counter(), time.thread_time(), 0.0, 0.0])
+
+    def stop(self):
+        name, wall_start, cpu_start, child_wall, child_cpu = self._stack.pop()
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+        self.wall[name] = self.wall.get(name, 0.0) + wall - child_wall
+        self.cpu[name] = self.cpu.get(name, 0.0) + cpu - child_cpu
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self._stack:
+            self._stack[-1][3] += wall
+            self._stack[-1][4] += cpu
+
+    def timed(self, name, fn):
+        """fn wrapped so every call counts towards stage name."""
+        def timed_fn(*args, **kwargs):
+            self.start(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.stop()
+        return timed_fn
+
+    def report(self, seconds):
+        return {name: {'cpu_s': self.cpu[name], 'wall_s': self.wall[name], 'calls': self.calls[name],
+                       'cpu_percent': 100 * self.cpu[name] / seconds}
+                for name in self.wall}
+
+
+class SyntheticMjpeg:
+    """A looping sequence of generated JPEG frames, like a USB camera in MJPEG mode. Encoded up front."""
+
+    name = 'mjpeg'
+    obj_name = 'MJpegCamFrame'
+
+    def __init__(self, fps=30, width=640, height=480, quality=80, sequence_length=30, stream_id=0):
+        self.rate = fps
+        self.stream_id = stream_id
+        y, x = np.mgrid[0:height, 0:width]
+        rng = np.random.default_rng(0)
+        self.frames = []
+        for i in range(sequence_length):
+            img = np.stack([(x + 8 * i) % 256, (y + 4 * i) % 256, (x + y) % 256], axis=-1).astype(np.uint8)
+            noise = rng.integers(0, 32, (height // 4, width // 4, 3), dtype=np.uint8)
+            img[:height // 4, :width // 4] += noise  # some texture, so frames are camera sized
+            self.frames.append(cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+        self.index = 0
+
+    def emit(self, send, stamper, timer):
+        timer.start('mjpeg.pack')
+        obj = MJpegCamFrame(0, 0, self.frames[self.index], self.stream_id, time.monotonic())
+        self.index = (self.index + 1) % len(self.frames)
+        message = pack_obj(obj, stamper.stamp(obj))
+        timer.stop()
+        send(message)
+
+
+class SyntheticAudio:
+    """A chirp fed through MicFftStreamer one hop at a time, as the sounddevice callback would."""
+
+    name = 'audio'
+    obj_name = 'AudioBuffer'
+
+    def __init__(self, sends_per_sec=24, sample_rate=48000, channels=1, encoding=AudioBuffer.LOG_U8):
+        self.rate = sends_per_sec
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.encoding = encoding
+        self.streamer = None
+        self.t = 0
+
+    def emit(self, send, stamper, timer):
+        if self.streamer is None:
+            self.streamer = MicFftStreamer(send, self.sample_rate, self.rate, self.channels, encoding=self.encoding,
+                                           stamper=stamper)
+        timer.start('audio.stft+pack')
+        n = self.streamer.hop_size
+        t = (self.t + np.arange(n)) / self.sample_rate
+        self.t += n
+        chirp = np.sin(2 * np.pi * (200 + 2000 * (t % 1.0)) * t).astype(np.float32)
+        self.streamer.audio_callback(np.repeat(chirp[:, None], self.channels, axis=1), n, None, None)
+        self.streamer.process_available()
+        timer.stop()
+
+
+class SyntheticImu:
+    """Accelerometer, gyroscope and magnetometer readings at a fixed rate."""
+
+    name = 'imu'
+    obj_name = 'IMUBuffer'
+
+    def __init__(self, hz=200):
+        self.rate = hz
+        self.n = 0
+
+    def emit(self, send, stamper, timer):
+        timer.start('imu.pack')
+        a = self.n / self.rate
+        self.n += 1
+        obj = IMUBuffer((np.sin(a), np.cos(a), 9.81), (0.01, 0.02, np.sin(3 * a)), (0.3, 0.0, 0.5))
+        message = pack_obj(obj, stamper.stamp(obj))
+        timer.stop()
+        send(message)
+
+
+class _CountingDish:
+    """Counts what comes out of a dish, and times recv as its own stage."""
+
+    def __init__(self, dish, timer):
+        self.dish = dish
+        self.timer = timer
+        self.messages = 0
+        self.bytes = 0
+        if hasattr(dish, 'drain'):
+            self.drain = self._drain
+        if hasattr(dish, 'fileno'):
+            self.fileno = dish.fileno
+
+    def recv(self, *args, **kwargs):
+        self.timer.start('receive.recv')
+        try:
+            msg = self.dish.recv(*args, **kwargs)
+        finally:
+            self.timer.stop()
+        self.messages += 1
+        self.bytes += len(msg)
+        return msg
+
+    def _drain(self, feed, timeout=0.0):
+        """drain, for dishes that have it. The stage includes reassembly, which happens inside."""
+        def counted_feed(buffer, start, end):
+            self.messages += 1
+            self.bytes += end - start
+            feed(buffer, start, end)
+        self.timer.start('receive.drain')
+        try:
+            return self.dish.drain(counted_feed, timeout)
+        finally:
+            self.timer.stop()
+
+    def __getattr__(self, name):
+        return getattr(self.dish, name)
+
+    def __setattr__(self, name, value):
+        if name == 'rcvtimeo':
+            self.dish.rcvtimeo = value
+        else:
+            super().__setattr__(name, value)
+
+
+def run_benchmark(sources, seconds=5.0, transport='inproc', drain_seconds=0.5, impairment=None, part_size=None,
+                  queue_handlers=False, checksum=False):
+    """Stream sources from a sender thread to a receiver thread for some seconds, and report what arrived.
+
+    An Impairment puts an ImpairedDish in front of the receiver. part_size overrides the transport's fragment size,
+    to compare fragmentation strategies. queue_handlers runs the sink on worker threads, like receive_objs would,
+    and checksum sends every part with a CRC32.
+    """
+    ctx = zmq.Context()
+    receive_radio, receive_dish = open_pair(ctx, transport, 'server', '127.0.0.1', '127.0.0.1')
+    raw_receive_dish = receive_dish
+    if impairment is not None:
+        receive_dish = ImpairedDish(receive_dish, impairment)
+    send_radio, send_dish = open_pair(ctx, transport, 'client', '127.0.0.1', '127.0.0.1')
+
+    latency = LatencyMonitor()
+    instrumentation.reset()
+    send_timer, receive_timer = StageTimer(), StageTimer()
+    received = {}
+    stop = threading.Event()
+
+    def sink(obj):
+        received[obj.__class__.__name__] = received.get(obj.__class__.__name__, 0) + 1
+
+    handlers = {name: receive_timer.timed('sink', sink) for name in ('MJpegCamFrame', 'AudioBuffer', 'IMUBuffer')}
+    counting_dish = _CountingDish(receive_dish, receive_timer)
+
+    receive_seconds = []
+    receive_errors = []  # what ended the receiver, if it didn't get to the end, to raise on this thread
+
+    def receive():
+        start = time.monotonic()
+        receive_timer.start('receive.loop')  # reassembly, unpacking and latency records, plus the loop's own idling
+        try:
+            asyncio.run(receive_objs(handlers, latency, stop=stop, queue_handlers=queue_handlers)(receive_radio,
+                                                                                                   counting_dish))
+        except Exception as e:
+            receive_errors.append(e)
+            return
+        receive_timer.stop()
+        receive_seconds.append(time.monotonic() - start)
+
+    receiver = threading.Thread(target=receive, daemon=True)
+    receiver.start()
+    time.sleep(0.1)  # let the receiver get to its first recv, so no early frames are lost to connecting
+
+    stamper = MetaStamper()
+    sent_bytes = {source.name: 0 for source in sources}
+    sent_messages = {source.name: 0 for source in sources}
+    burst = send_timer.timed('send', BurstSender(send_radio, part_size=part_size, checksum=checksum))
+
+    def sender_for(source):
+        def send(message):
+            sent_bytes[source.name] += len(message)
+            sent_messages[source.name] += 1
+            burst(message)
+        return send
+
+    sends = {source.name: sender_for(source) for source in sources}
+    start = time.monotonic()
+    due = {source.name: start for source in sources}
+    while True:
+        source = min(sources, key=lambda s: due[s.name])
+        now = time.monotonic()
+        if due[source.name] - start >= seconds:
+            break
+        if due[source.name] > now:
+            time.sleep(due[source.name] - now)
+        source.emit(sends[source.name], stamper, send_timer)
+        due[source.name] += 1.0 / source.rate
+    elapsed = time.monotonic() - start
+
+    time.sleep(drain_seconds)
+    stop.set()
+    receiver.join()
+    for sock in (receive_radio, raw_receive_dish, send_radio, send_dish):
+        sock.close(linger=0)
+    ctx.term()
+    if receive_errors:
+        raise receive_errors[0]
+    if not receive_seconds:
+        raise RuntimeError("The benchmark's receiver stopped without finishing")
+
+    streams = {}
+    latency_snapshot = latency.snapshot()
+    for key, stats in latency_snapshot.items():
+        streams[key] = {
+            'received': stats['received'],
+            'lost': stats['lost'],
+            'loss_rate': stats['loss_rate'],
+            'fps': stats['received'] / elapsed,
+            'p50_ms': stats['send_to_receive_ms']['p50'],
+            'p99_ms': stats['send_to_receive_ms']['p99'],
+            'capture_p99_ms': stats['capture_to_receive_ms']['p99'],
+        }
+    goodput = 0.0  # bytes of whole messages handled, at each source's mean message size
+    for source in sources:
+        stream = streams.get(f"{source.obj_name}/0")
+        sent = sent_messages[source.name]
+        if sent:
+            completeness = min(stream['received'] / sent, 1.0) if stream else 0.0
+            goodput += completeness * sent_bytes[source.name]
+            if stream:
+                stream['completeness'] = completeness
+    return {
+        'transport': transport,
+        'part_size': part_size,
+        'impairment': None if impairment is None else vars(impairment),
+        'link': None if impairment is None else receive_dish.link.stats,
+        'goodput_mb_per_s': goodput / elapsed / 1e6,
+        'seconds': elapsed,
+        'sent': {name: {'messages': sent_messages[name], 'fps': sent_messages[name] / elapsed,
+                        'mb_per_s': sent_bytes[name] / elapsed / 1e6} for name in sent_bytes},
+        'received_mb_per_s': counting_dish.bytes / elapsed / 1e6,
+        'received_datagrams': counting_dish.messages,
+        'handled': received,
+        'streams': streams,
+        'stages': dict(send_timer.report(elapsed), **receive_timer.report(receive_seconds[0])),
+        'instrumentation': instrumentation.snapshot() if instrumentation.enabled() else None,
+    }
+
+
+def print_report(report):
+    print(f"{report['transport']}, {report['seconds']:.1f}s, received {report['received_mb_per_s']:.1f} MB/s, "
+          f"goodput {report['goodput_mb_per_s']:.1f} MB/s")
+    if report['link'] is not None:
+        print("  link " + ", ".join(f"{name} {count}" for name, count in report['link'].items()))
+    for name, sent in report['sent'].items():
+        print(f"  sent {name:<8} {sent['fps']:8.1f}/s {sent['mb_per_s']:8.2f} MB/s")
+    for key, stream in report['streams'].items():
+        print(f"  recv {key:<16} {stream['fps']:8.1f}/s  p50 {stream['p50_ms']:7.2f}ms  p99 {stream['p99_ms']:7.2f}ms"
+              f"  loss {stream['loss_rate'] * 100:5.1f}%  complete {stream.get('completeness', 0) * 100:5.1f}%")
+    for name, stage in report['stages'].items():
+        print(f"  stage {name:<16} cpu {stage['cpu_percent']:5.1f}%  {stage['calls']} calls")
+    if report['instrumentation'] is not None:
+        instrumentation.print_snapshot(report['instrumentation'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transport', default='inproc')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--mjpeg-fps', type=float, default=30, help="0 turns the source off")
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--audio-rate', type=float, default=24, help="spectra per second, 0 turns the source off")
+    parser.add_argument('--imu-hz', type=float, default=200, help="0 turns the source off")
+    parser.add_argument('--part-size', type=int, help="fragment size, instead of the transport's own")
+    parser.add_argument('--loss', type=float, default=0.0, help="random loss, 0 to 1")
+    parser.add_argument('--burst-rate', type=float, default=0.0, help="chance per datagram of a loss burst starting")
+    parser.add_argument('--burst-length', type=float, default=1.0, help="mean datagrams lost per burst")
+    parser.add_argument('--reorder', type=float, default=0.0, help="chance a datagram is overtaken")
+    parser.add_argument('--duplicate', type=float, default=0.0, help="chance a datagram arrives twice")
+    parser.add_argument('--delay-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--bandwidth-mbps', type=float, help="link bandwidth cap")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--checksum', action='store_true', help="CRC32 every part")
+    parser.add_argument('--queue-handlers', action='store_true', help="run handlers on their own threads")
+    parser.add_argument('--instrument', action='store_true', help="also time the library's own stages")
+    parser.add_argument('--json', help="also write the report here")
+    args = parser.parse_args(argv)
+    if args.instrument:
+        instrumentation.enable()
+
+    impairment = None
+    if args.loss or args.burst_rate or args.reorder or args.duplicate or args.delay_ms or args.jitter_ms \
+            or args.bandwidth_mbps:
+        impairment = Impairment(loss=args.loss, p_bad=args.burst_rate, p_good=1 / max(args.burst_length, 1),
+                                reorder=args.reorder, duplicate=args.duplicate, delay=args.delay_ms / 1000,
+                                jitter=args.jitter_ms / 1000,
+                                bandwidth=args.bandwidth_mbps * 1e6 if args.bandwidth_mbps else None, seed=args.seed)
+
+    sources = []
+    if args.mjpeg_fps:
+        sources.append(SyntheticMjpeg(args.mjpeg_fps, args.width, args.height))
+    if args.audio_rate:
+        sources.append(SyntheticAudio(int(args.audio_rate)))
+    if args.imu_hz:
+        sources.append(SyntheticImu(args.imu_hz))
+
+    report = run_benchmark(sources, args.seconds, args.transport, impairment=impairment, part_size=args.part_size,
+                           queue_handlers=args.queue_handlers, checksum=args.checksum)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
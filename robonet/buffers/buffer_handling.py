@@ -1,14 +1,40 @@
+import logging
+
 from robonet.buffers.buffer_objects import *  # needed for handling classes
+from robonet import instrumentation
+
+_pack_stage = instrumentation.stage('pack')
+_log = instrumentation.sampled_logger(__name__)
+
+
+# Class names can't be empty, so a zero class name length at the start of a message means metadata comes first.
+META_MARKER = struct.pack('!I', 0)
+META_FORMAT = '!IIdd'  # stream_id, seq, capture_time, send_time
+META_SIZE = len(META_MARKER) + struct.calcsize(META_FORMAT)
+
+
+class MessageMeta:
+    """Per-message metadata the codec can attach to any object without the buffer class knowing about it."""
+
+    def __init__(self, stream_id: int, seq: int, capture_time: float, send_time: float):
+        self.stream_id = stream_id
+        self.seq = seq
+        self.capture_time = capture_time  # sender's time.monotonic() when the data was captured
+        self.send_time = send_time  # sender's time.monotonic() when the message was packed
 
 
 # Packing Function
-def pack_obj(obj):
+def pack_obj(obj, meta=None):
     """Pack any object into a byte string for sending over a network."""
+    start = _pack_stage.begin()
     class_name = obj.__class__.__name__
     obj_dict = obj.__dict__
     type_list = obj.__class__.type_list
 
     message = struct.pack('!I', len(class_name)) + class_name.encode('utf-8')
+    if meta is not None:
+        message = META_MARKER + struct.pack(META_FORMAT, meta.stream_id, meta.seq & 0xFFFFFFFF, meta.capture_time,
+                                            meta.send_time) + message
 
     for key, value in obj_dict.items():
         key_encoded = key.encode('utf-8')
@@ -18,38 +44,56 @@ def pack_obj(obj):
         message += struct.pack('!I', len(key_encoded)) + key_encoded
         message += struct.pack('!I', type_index)
 
-        # Pack the value using the corresponding class method
-        message += obj.__class__.pack_type(value, type_index)
+        # Pack the value using the corresponding method. Through the instance, so packing can depend on other fields.
+        message += obj.pack_type(value, type_index)
 
+    _pack_stage.end(start)
     return message
 
 
 # Unpacking Function
 def unpack_obj(message):
     """Unpack the message into the correct class based on the class name."""
+    return unpack_obj_with_meta(message)[0]
+
+
+def unpack_header(message):
+    """Read just the class name and MessageMeta (None if absent) off a message, and the offset its fields start at."""
     offset = 0
+    meta = None
     class_name_len = struct.unpack_from('!I', message, offset)[0]
     offset += 4
+    if class_name_len == 0:
+        meta = MessageMeta(*struct.unpack_from(META_FORMAT, message, offset))
+        offset = META_SIZE
+        class_name_len = struct.unpack_from('!I', message, offset)[0]
+        offset += 4
+    check_length(message, offset, class_name_len, 'class name')
     try:
-        class_name = message[offset:offset + class_name_len].decode('utf-8')
+        class_name = bytes(message[offset:offset + class_name_len]).decode('utf-8')
     except UnicodeDecodeError:
-        print(f"Received non-utf class name: {message[offset:offset + class_name_len]}")
-    offset += class_name_len
+        raise TypeError(f"Received non-utf class name: {bytes(message[offset:offset + class_name_len])}")
+    return class_name, meta, offset + class_name_len
+
+
+def unpack_obj_with_meta(message):
+    """Unpack the message, and return it along with its MessageMeta, or None if the sender didn't attach any."""
+    class_name, meta, offset = unpack_header(message)
 
-    # Check if class exists in the global scope
-    if class_name in globals():
-        obj_class = globals()[class_name]
-    else:
+    # Check if class exists in the global scope. Only buffer classes, not whatever else the name could point to.
+    obj_class = globals().get(class_name)
+    if not isinstance(obj_class, type) or not hasattr(obj_class, 'unpack_type'):
         raise TypeError(f"Unknown class name: {class_name}")
 
     obj_dict = {}
     while offset < len(message):
         key_len = struct.unpack_from('!I', message, offset)[0]
         offset += 4
+        check_length(message, offset, key_len, 'key')
         try:
-            key = message[offset:offset + key_len].decode('utf-8')
+            key = bytes(message[offset:offset + key_len]).decode('utf-8')
         except UnicodeDecodeError:
-            print(f"Received non-utf key name: {message[offset:offset + key_len]}")
+            _log(logging.WARNING, 'key', "Received non-utf key name: %r", bytes(message[offset:offset + key_len]))
             offset += key_len
             continue
         offset += key_len
@@ -67,4 +111,4 @@ def unpack_obj(message):
     received_obj = obj_class.__new__(obj_class)
     received_obj.__dict__.update(obj_dict)
 
-    return received_obj
+    return received_obj, meta
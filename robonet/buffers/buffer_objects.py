@@ -1,8 +1,55 @@
 import struct
+import cv2
 import numpy as np
 from typing import List, Optional, Tuple
 import numpy.typing as npt
 
+# Sanity bounds for lengths and shapes read off the wire, so a corrupted header can't ask for gigabytes or spin
+# through billions of items before the decode fails anyway.
+MAX_DIMS = 32  # numpy's own limit
+MAX_ELEMENTS = 1 << 28
+
+
+def check_length(data, offset, length, what='field'):
+    """Raise ValueError unless length bytes from offset are inside data."""
+    if offset + length > len(data):
+        raise ValueError(f"{what} of {length} bytes at {offset} runs past the end of a {len(data)} byte message")
+
+
+def unpack_shape(data, offset, shape_len):
+    """Unpack shape_len dimensions. Returns (shape, element count, offset after the shape), checked against bounds."""
+    if shape_len > MAX_DIMS:
+        raise ValueError(f"Shape with {shape_len} dimensions")
+    shape = struct.unpack_from(f'!{shape_len}I', data, offset)
+    flat_size = 1
+    for dim in shape:  # python ints, where np.prod would overflow quietly
+        flat_size *= dim
+    if flat_size > MAX_ELEMENTS:
+        raise ValueError(f"Shape {shape} has more than {MAX_ELEMENTS} elements")
+    return shape, flat_size, offset + 4 * shape_len
+
+
+# Tensor element types, by the code packed in front of each tensor. Always little endian on the wire.
+TENSOR_DTYPES = [np.dtype(t).newbyteorder('<') for t in (
+    np.float32, np.float16, np.float64, np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32, np.int64,
+    np.uint64, np.bool_)]
+
+
+def tensor_dtype_code(dtype):
+    try:
+        return TENSOR_DTYPES.index(np.dtype(dtype).newbyteorder('<'))
+    except ValueError:
+        raise TypeError(f"Unsupported tensor dtype {dtype}") from None
+
+
+def unpack_tensor_header(data, offset):
+    """Unpack a tensor's dtype code and shape. Returns (dtype, shape, element count, offset after them)."""
+    code, shape_len = struct.unpack_from('!BI', data, offset)
+    if code >= len(TENSOR_DTYPES):
+        raise TypeError(f"Unknown tensor dtype code {code}")
+    shape, flat_size, offset = unpack_shape(data, offset + 5, shape_len)
+    return TENSOR_DTYPES[code], shape, flat_size, offset
+
 
 class WifiSetupInfo:
     """Wi-Fi info buffer object. Needs to be the same on both sides."""
@@ -30,13 +77,66 @@ class WifiSetupInfo:
         if type_index == 0:  # String (str)
             value_len = struct.unpack_from('!I', data, offset)[0]
             offset += 4
-            value = data[offset:offset + value_len].decode('utf-8')
+            check_length(data, offset, value_len, 'string')
+            value = bytes(data[offset:offset + value_len]).decode('utf-8')
             return value, offset + value_len
         else:
             raise TypeError("Unsupported type for WifiSetupInfo")
 
 
+class Capabilities:
+    """What one end of a link supports. Exchanged in the handshake so both ends settle on the same settings."""
+
+    type_list = [int, str]
+
+    def __init__(self, codec_version: int = 1, mtu: int = 4096, fec: int = 0, compression: str = "none"):
+        self.codec_version = codec_version
+        self.mtu = mtu  # largest fragment payload we want to send or receive
+        self.fec = fec  # forward error correction parity parts per message, 0 for none
+        self.compression = compression  # supported compressions, comma separated, most preferred first
+
+    def negotiate(self, other):
+        """The settings both ends support. Gives the same answer on both ends, whichever end calls it.
+
+        The compression is the one both ends like best, by its place in the two preference lists added together,
+        with ties going to the first by name.
+        """
+        ours, theirs = self.compression.split(','), other.compression.split(',')
+        common = sorted((ours.index(c) + theirs.index(c), c) for c in set(ours) & set(theirs))
+        compression = common[0][1] if common else "none"
+        return Capabilities(min(self.codec_version, other.codec_version), min(self.mtu, other.mtu),
+                            min(self.fec, other.fec), compression)
+
+    @staticmethod
+    def pack_type(value, type_index):
+        """Pack the value based on the type index."""
+        if type_index == 0:  # Integer (int)
+            return struct.pack('!I', value)
+        elif type_index == 1:  # String (str)
+            encoded_value = value.encode('utf-8')
+            return struct.pack('!I', len(encoded_value)) + encoded_value
+        else:
+            raise TypeError("Unsupported type for Capabilities")
+
+    @staticmethod
+    def unpack_type(data, offset, type_index):
+        """Unpack the value based on the type index."""
+        if type_index == 0:  # Integer (int)
+            value = struct.unpack_from('!I', data, offset)[0]
+            return value, offset + 4
+        elif type_index == 1:  # String (str)
+            value_len = struct.unpack_from('!I', data, offset)[0]
+            offset += 4
+            check_length(data, offset, value_len, 'string')
+            value = bytes(data[offset:offset + value_len]).decode('utf-8')
+            return value, offset + value_len
+        else:
+            raise TypeError("Unsupported type for Capabilities")
+
+
 class TensorBuffer:
+    """Whole tensors of any TENSOR_DTYPES type. robonet.tensor_sync sends just what changed, as TensorDeltas."""
+
     type_list = [List[npt.NDArray]]
 
     def __init__(self, tensors: List[npt.NDArray]):
@@ -45,61 +145,148 @@ class TensorBuffer:
     @staticmethod
     def pack_type(value, type_index):
         """Pack the value based on the type index."""
-        if type_index == 0:  # np.ndarray for audio data
-            i = len(value)
-            num_tensors = struct.pack('!I', i)
-            channel_bytes = []
+        if type_index == 0:  # list of np.ndarray
+            packed = [struct.pack('!I', len(value))]
             for v in value:
+                code = tensor_dtype_code(v.dtype)
                 shape = v.shape
-                flat_data = v.flatten()
-                shape_packed = struct.pack(f'!{len(shape)}I', *shape)
-                data_packed = flat_data.tobytes()
-                channel_bytes.extend([struct.pack('!I', len(shape)), shape_packed, data_packed])
-            return num_tensors + b''.join(channel_bytes)
+                packed.extend([struct.pack(f'!BI{len(shape)}I', code, len(shape), *shape),
+                               np.ascontiguousarray(v, dtype=TENSOR_DTYPES[code]).tobytes()])
+            return b''.join(packed)
         else:
             raise TypeError("Unsupported type for TensorBuffer")
 
     @staticmethod
     def unpack_type(data, offset, type_index):
         """Unpack the value based on the type index."""
-        if type_index == 0:  # np.ndarray
+        if type_index == 0:  # list of np.ndarray
             num_tensors = struct.unpack_from('!I', data, offset)[0]
             offset += 4
             value_arrays = []
             for i in range(num_tensors):
-                shape_len = struct.unpack_from('!I', data, offset)[0]
-                offset += 4
-                shape = struct.unpack_from(f'!{shape_len}I', data, offset)
-                offset += 4 * shape_len
-                flat_size = np.prod(shape)
-                flat_data = data[offset:offset + flat_size * 4]
-                offset += 4 * flat_size
-                value_arrays.append(np.frombuffer(flat_data, dtype=np.float32).reshape(shape))
+                dtype, shape, flat_size, offset = unpack_tensor_header(data, offset)
+                check_length(data, offset, flat_size * dtype.itemsize, 'tensor')
+                value_arrays.append(np.frombuffer(data, dtype=dtype, count=flat_size, offset=offset).reshape(shape))
+                offset += flat_size * dtype.itemsize
             return value_arrays, offset
         else:
             raise TypeError("Unsupported type for TensorBuffer")
 
 
+class TensorDelta:
+    """The blocks of a list of tensors that changed since the last TensorDelta. See robonet.tensor_sync.
+
+    Each tensor is cut into block_size element blocks of its flattened data, the last one zero padded, and blocks
+    holds (shape, block indices, changed blocks) for each tensor, the changed blocks as an array of shape
+    (len(indices), block_size). A full one has every block, and no indices.
+    """
+
+    type_list = [int, bool, List[Tuple[Tuple[int, ...], npt.NDArray, npt.NDArray]]]
+
+    def __init__(self, stream_id: int = 0, seq: int = 0, full: bool = True, block_size: int = 256,
+                 blocks: List[Tuple[Tuple[int, ...], npt.NDArray, npt.NDArray]] = None):
+        self.stream_id = stream_id
+        self.seq = seq  # counts up by one with each delta of the stream, so the receiver can tell it missed one
+        self.full = full
+        self.block_size = block_size
+        self.blocks = blocks or []
+
+    def pack_type(self, value, type_index):
+        """Pack the value based on the type index. block_size and full go in front of the blocks, like the
+        AudioBuffer encoding, so unpacking them doesn't depend on the order of the fields."""
+        if type_index == 0:  # Integer (int)
+            return struct.pack('!I', value)
+        elif type_index == 1:  # Boolean (bool)
+            return struct.pack('!?', value)
+        elif type_index == 2:  # blocks
+            packed = [struct.pack('!I?I', self.block_size, self.full, len(value))]
+            for shape, indices, blocks in value:
+                code = tensor_dtype_code(blocks.dtype)
+                packed.append(struct.pack(f'!BI{len(shape)}II', code, len(shape), *shape, len(blocks)))
+                if not self.full:
+                    packed.append(np.ascontiguousarray(indices, dtype='<u4').tobytes())
+                packed.append(np.ascontiguousarray(blocks, dtype=TENSOR_DTYPES[code]).tobytes())
+            return b''.join(packed)
+        else:
+            raise TypeError("Unsupported type for TensorDelta")
+
+    @staticmethod
+    def unpack_type(data, offset, type_index):
+        """Unpack the value based on the type index."""
+        if type_index == 0:  # Integer (int)
+            value = struct.unpack_from('!I', data, offset)[0]
+            return value, offset + 4
+        elif type_index == 1:  # Boolean (bool)
+            value = struct.unpack_from('!?', data, offset)[0]
+            return value, offset + 1
+        elif type_index == 2:  # blocks
+            block_size, full, num_tensors = struct.unpack_from('!I?I', data, offset)
+            offset += 9
+            if not 0 < block_size <= MAX_ELEMENTS:
+                raise ValueError(f"Block size {block_size}")
+            value = []
+            for i in range(num_tensors):
+                dtype, shape, flat_size, offset = unpack_tensor_header(data, offset)
+                count = struct.unpack_from('!I', data, offset)[0]
+                offset += 4
+                num_blocks = -(-flat_size // block_size)
+                if count > num_blocks or full and count != num_blocks:
+                    raise ValueError(f"{count} blocks of {block_size} for a tensor of shape {shape}")
+                if full:
+                    indices = np.arange(count, dtype=np.uint32)
+                else:
+                    check_length(data, offset, 4 * count, 'block indices')
+                    indices = np.frombuffer(data, dtype='<u4', count=count, offset=offset)
+                    offset += 4 * count
+                    if count and indices.max() >= num_blocks:
+                        raise ValueError(f"Block index {indices.max()} of a tensor with {num_blocks} blocks")
+                check_length(data, offset, count * block_size * dtype.itemsize, 'blocks')
+                blocks = np.frombuffer(data, dtype=dtype, count=count * block_size, offset=offset)
+                offset += count * block_size * dtype.itemsize
+                value.append((shape, indices, blocks.reshape(count, block_size)))
+            return value, offset
+        else:
+            raise TypeError("Unsupported type for TensorDelta")
+
+
 # Define the CamFrame class
 class CVCamFrame:
     """Camera frame alongside other info."""
 
+    # Image encodings. Anything but RAW is compressed with OpenCV on pack and decoded back to an ndarray on unpack.
+    RAW = 0
+    JPEG = 1
+    WEBP = 2
+    PNG = 3  # lossless, and keeps uint16 images like depth maps intact
+
     type_list = [np.ndarray, int]  # np.ndarray and int types in CamFrame
 
-    def __init__(self, cv_image: np.ndarray, brightness: int, exposure: int):
+    def __init__(self, cv_image: np.ndarray, brightness: int, exposure: int, encoding: int = RAW, quality: int = 90):
         self.cv_image = cv_image
         self.brightness = brightness
         self.exposure = exposure
+        self.encoding = encoding
+        self.quality = quality  # 0-100 for JPEG and WEBP. PNG ignores it.
 
-    @staticmethod
-    def pack_type(value, type_index):
+    def pack_type(self, value, type_index):
         """Pack the value based on the type index."""
         if type_index == 0:  # np.ndarray
             shape = value.shape
-            flat_data = value.flatten()
-            shape_packed = struct.pack(f'!{len(shape)}I', *shape)
-            data_packed = flat_data.tobytes()
-            return struct.pack('!I', len(shape)) + shape_packed + data_packed
+            header = struct.pack('!BI', self.encoding, len(shape)) + struct.pack(f'!{len(shape)}I', *shape)
+            if self.encoding == CVCamFrame.RAW:
+                flat_data = value.flatten()
+                return header + flat_data.tobytes()
+            elif self.encoding == CVCamFrame.JPEG:
+                ok, encoded = cv2.imencode('.jpg', value, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            elif self.encoding == CVCamFrame.WEBP:
+                ok, encoded = cv2.imencode('.webp', value, [cv2.IMWRITE_WEBP_QUALITY, max(self.quality, 1)])
+            elif self.encoding == CVCamFrame.PNG:
+                ok, encoded = cv2.imencode('.png', value, [cv2.IMWRITE_PNG_COMPRESSION, 1])  # favor speed
+            else:
+                raise TypeError(f"Unsupported image encoding {self.encoding} for CVCamFrame")
+            if not ok:
+                raise ValueError(f"OpenCV couldn't encode a {value.dtype} image of shape {shape}")
+            return header + struct.pack('!I', len(encoded)) + encoded.tobytes()
         elif type_index == 1:  # Integer (int)
             return struct.pack('!I', value)
         else:
@@ -109,14 +296,24 @@ class CVCamFrame:
     def unpack_type(data, offset, type_index):
         """Unpack the value based on the type index."""
         if type_index == 0:  # np.ndarray
-            shape_len = struct.unpack_from('!I', data, offset)[0]
-            offset += 4
-            shape = struct.unpack_from(f'!{shape_len}I', data, offset)
-            offset += 4 * shape_len
-            flat_size = np.prod(shape)
-            flat_data = np.frombuffer(data[offset:offset + flat_size], dtype=np.uint8)
-            offset += flat_size
-            value = flat_data.reshape(shape)
+            encoding, shape_len = struct.unpack_from('!BI', data, offset)
+            offset += 5
+            shape, flat_size, offset = unpack_shape(data, offset, shape_len)
+            if encoding == CVCamFrame.RAW:
+                check_length(data, offset, flat_size, 'image')
+                flat_data = np.frombuffer(data[offset:offset + flat_size], dtype=np.uint8)
+                offset += flat_size
+                value = flat_data.reshape(shape)
+            else:
+                encoded_len = struct.unpack_from('!I', data, offset)[0]
+                offset += 4
+                check_length(data, offset, encoded_len, 'encoded image')
+                encoded = np.frombuffer(data, dtype=np.uint8, count=encoded_len, offset=offset)
+                offset += encoded_len
+                value = cv2.imdecode(encoded, cv2.IMREAD_UNCHANGED)
+                if value is None:
+                    raise ValueError(f"OpenCV couldn't decode a CVCamFrame with encoding {encoding}")
+                value = value.reshape(shape)  # imdecode drops single channel dimensions
             return value, offset
         elif type_index == 1:  # Integer (int)
             value = struct.unpack_from('!I', data, offset)[0]
@@ -129,12 +326,14 @@ class MJpegCamFrame:
     # todo: mjpeg has 8x8 ffts, which should be easy to translate directly into image pyramids, potentially on the gpu
     #  so parallelize 'opencv/modules/imgcodecs/src/grfmt_jpeg.cpp' into glsl and send the mjpeg directly into the glsl vulkan kernel
     #  mjpegs are fairly standard in cameras, so until we're making camera FPGAs, it's the fastest method
-    type_list = [bytes, int]  # np.ndarray and int types in CamFrame
+    type_list = [bytes, int, float]  # np.ndarray and int types in CamFrame
 
-    def __init__(self, brightness: int, exposure: int, mjpeg: bytes):
+    def __init__(self, brightness: int, exposure: int, mjpeg: bytes, stream_id: int = 0, capture_time: float = 0.0):
         self.brightness = brightness
         self.exposure = exposure
         self.mjpeg = mjpeg
+        self.stream_id = stream_id  # which camera this came from, when one robot sends several
+        self.capture_time = capture_time  # time.monotonic() on the sender when the frame was captured
 
     @staticmethod
     def pack_type(value, type_index):
@@ -145,6 +344,8 @@ class MJpegCamFrame:
             return packed_bytes
         elif type_index == 1:  # Integer (int)
             return struct.pack('!I', value)
+        elif type_index == 2:  # Float (double, so monotonic timestamps keep their precision)
+            return struct.pack('!d', value)
         else:
             raise TypeError("Unsupported type for CamFrame")
 
@@ -154,35 +355,70 @@ class MJpegCamFrame:
         if type_index == 0:  # np.ndarray
             bytes_len = struct.unpack_from('!I', data, offset)[0]
             offset += 4
+            check_length(data, offset, bytes_len, 'mjpeg')
             value = data[offset:offset+bytes_len]
             offset = offset+bytes_len
             return value, offset
         elif type_index == 1:  # Integer (int)
             value = struct.unpack_from('!I', data, offset)[0]
             return value, offset + 4
+        elif type_index == 2:  # Float (double)
+            value = struct.unpack_from('!d', data, offset)[0]
+            return value, offset + 8
         else:
             raise TypeError("Unsupported type for MJpegCamFrame")
 
 class AudioBuffer:
     """Buffer class to handle packing and unpacking fft audio data"""
 
+    # Spectrum encodings. The encoding is packed in front of the bins, so the receiver never needs to be told.
+    COMPLEX64 = 0  # raw complex64 bins, 8 bytes per bin
+    COMPLEX32 = 1  # float16 real and imaginary parts, 4 bytes per bin
+    LOG_U8 = 2  # uint8 log magnitude and uint8 phase, 2 bytes per bin
+    LOG_U16 = 3  # uint16 log magnitude and uint16 phase, 4 bytes per bin
+
+    LOG_DYNAMIC_RANGE = np.log(1e6)  # magnitudes more than 120dB below the peak quantize to the floor
+
     type_list = [List[npt.NDArray[np.complex64]], int]  # np.ndarray to store audio data
 
-    def __init__(self, sample_rate: int = 44800, samples_per_sec:int=24, fft_data: List[npt.NDArray[np.complex64]] = None):
+    def __init__(self, sample_rate: int = 44800, samples_per_sec:int=24, fft_data: List[npt.NDArray[np.complex64]] = None,
+                 encoding: int = COMPLEX64, max_freq: int = 0):
         self.sample_rate = sample_rate
         self.samples_per_sec = samples_per_sec
         self.fft_data = fft_data
+        self.encoding = encoding
+        self.max_freq = max_freq  # bins above this frequency aren't sent. 0 sends everything.
 
-    @staticmethod
-    def pack_type(value, type_index):
+    def pack_type(self, value, type_index):
         """Pack the value based on the type index."""
         if type_index == 0:  # np.ndarray for audio data
+            total_bins = value.shape[0]
+            if self.max_freq:
+                bin_hz = self.sample_rate / (2 * total_bins)  # bins cover 0 to nyquist
+                value = value[:min(total_bins, int(np.ceil(self.max_freq / bin_hz)))]
+            value = np.ascontiguousarray(value, dtype=np.complex64)
             shape = value.shape
-            flat_data = value.flatten()
-            shape_packed = struct.pack(f'!{len(shape)}I', *shape)
-            data_packed = flat_data.tobytes()
-            channel_bytes = [struct.pack('!I', len(shape)), shape_packed, data_packed]
-            return b''.join(channel_bytes)
+            header = [struct.pack('!BII', self.encoding, total_bins, len(shape)),
+                      struct.pack(f'!{len(shape)}I', *shape)]
+
+            if self.encoding == AudioBuffer.COMPLEX64:
+                data_packed = [value.tobytes()]
+            elif self.encoding == AudioBuffer.COMPLEX32:
+                data_packed = [value.view(np.float32).astype(np.float16).tobytes()]
+            elif self.encoding in (AudioBuffer.LOG_U8, AudioBuffer.LOG_U16):
+                q_dtype = np.uint8 if self.encoding == AudioBuffer.LOG_U8 else np.uint16
+                q_max = np.iinfo(q_dtype).max
+                log_mag = np.log(np.abs(value) + np.finfo(np.float32).tiny)
+                hi = float(log_mag.max()) if log_mag.size else 0.0
+                lo = max(float(log_mag.min()) if log_mag.size else 0.0, hi - AudioBuffer.LOG_DYNAMIC_RANGE)
+                step = (hi - lo) / q_max if hi > lo else 1.0
+                q_mag = np.rint((np.maximum(log_mag, lo) - lo) / step).astype(q_dtype)
+                q_phase = np.rint((np.angle(value) + np.pi) * ((q_max + 1) / (2 * np.pi))).astype(np.int64)
+                q_phase = (q_phase % (q_max + 1)).astype(q_dtype)
+                data_packed = [struct.pack('!ff', lo, step), q_mag.tobytes(), q_phase.tobytes()]
+            else:
+                raise TypeError(f"Unsupported spectrum encoding {self.encoding} for AudioBuffer")
+            return b''.join(header + data_packed)
         elif type_index == 1:
             return struct.pack('!I', value)
         else:
@@ -192,16 +428,38 @@ class AudioBuffer:
     def unpack_type(data, offset, type_index):
         """Unpack the value based on the type index."""
         if type_index == 0:  # np.ndarray
-            shape_len = struct.unpack_from('!I', data, offset)[0]
-            offset += 4
-            shape = struct.unpack_from(f'!{shape_len}I', data, offset)
-            offset += 4 * shape_len
-            flat_size = np.prod(shape)
-            flat_data = data[offset:offset + flat_size * 8]
-            offset += 8 * flat_size
-            flat_data = flat_data[0:(len(flat_data)//8)*8]  # if we're missing data, truncate
-            value_arrays = np.frombuffer(flat_data, dtype=np.complex64).reshape(shape)
-            return value_arrays, offset
+            encoding, total_bins, shape_len = struct.unpack_from('!BII', data, offset)
+            offset += 9
+            shape, flat_size, offset = unpack_shape(data, offset, shape_len)
+            if not shape or total_bins * (flat_size // max(shape[0], 1)) > MAX_ELEMENTS:
+                raise ValueError(f"Spectrum of {total_bins} bins and shape {shape}")
+
+            if encoding == AudioBuffer.COMPLEX64:
+                value = np.frombuffer(data, dtype=np.complex64, count=flat_size, offset=offset)
+                offset += 8 * flat_size
+            elif encoding == AudioBuffer.COMPLEX32:
+                value = np.frombuffer(data, dtype=np.float16, count=2 * flat_size, offset=offset)
+                value = value.astype(np.float32).view(np.complex64)
+                offset += 4 * flat_size
+            elif encoding in (AudioBuffer.LOG_U8, AudioBuffer.LOG_U16):
+                q_dtype = np.uint8 if encoding == AudioBuffer.LOG_U8 else np.uint16
+                q_max = np.iinfo(q_dtype).max
+                lo, step = struct.unpack_from('!ff', data, offset)
+                offset += 8
+                q = np.frombuffer(data, dtype=q_dtype, count=2 * flat_size, offset=offset).astype(np.float32)
+                offset += 2 * flat_size * q_dtype().itemsize
+                # magnitude and phase in one pass: exp(log_mag + i*phase)
+                value = np.exp((lo + step * q[:flat_size]) + 1j * (q[flat_size:] * (2 * np.pi / (q_max + 1)) - np.pi))
+                value = value.astype(np.complex64)
+            else:
+                raise TypeError(f"Unsupported spectrum encoding {encoding} for AudioBuffer")
+
+            value = value.reshape(shape)
+            if shape[0] < total_bins:  # bins above max_freq were cut off. pad so handlers see the same shape.
+                padded = np.zeros((total_bins,) + tuple(shape[1:]), dtype=np.complex64)
+                padded[:shape[0]] = value
+                value = padded
+            return value, offset
         elif type_index == 1:  # Integer (int)
             value = struct.unpack_from('!I', data, offset)[0]
             return value, offset + 4
@@ -266,6 +524,7 @@ class TemperatureMonitorBuffer:
         if type_index == 0:  # List of floats (temperatures)
             list_length = struct.unpack_from('!I', data, offset)[0]  # Unpack list length
             offset += 4
+            check_length(data, offset, 4 * list_length, 'temperature list')
             temperatures = []
             for _ in range(list_length):
                 temp = struct.unpack_from('!f', data, offset)[0]  # Unpack each float
@@ -313,3 +572,42 @@ class IMUBuffer:
                 return value, offset
         else:
             raise TypeError(f"Unsupported type for {IMUBuffer.__name__}")
+
+
+class LinkProbe:
+    """Timestamped ping or pong for measuring the link. Small enough to always fit in one part."""
+
+    type_list = [int, float, bool]
+
+    def __init__(self, seq: int, send_time: float, is_pong: bool = False, reply_time: float = 0.0):
+        self.seq = seq
+        self.send_time = send_time  # pinger's time.monotonic() when the ping was sent. pongs echo it back.
+        self.is_pong = is_pong
+        self.reply_time = reply_time  # ponger's time.monotonic() when the pong was sent
+
+    @staticmethod
+    def pack_type(value, type_index):
+        """Pack the value based on the type index."""
+        if type_index == 0:  # Integer (int)
+            return struct.pack('!I', value)
+        elif type_index == 1:  # Float (double)
+            return struct.pack('!d', value)
+        elif type_index == 2:  # Boolean
+            return struct.pack('!?', value)
+        else:
+            raise TypeError("Unsupported type for LinkProbe")
+
+    @staticmethod
+    def unpack_type(data, offset, type_index):
+        """Unpack the value based on the type index."""
+        if type_index == 0:  # Integer (int)
+            value = struct.unpack_from('!I', data, offset)[0]
+            return value, offset + 4
+        elif type_index == 1:  # Float (double)
+            value = struct.unpack_from('!d', data, offset)[0]
+            return value, offset + 8
+        elif type_index == 2:  # Boolean
+            value = struct.unpack_from('!?', data, offset)[0]
+            return value, offset + 1
+        else:
+            raise TypeError("Unsupported type for LinkProbe")
@@ -5,6 +5,10 @@ import struct
 import cv2
 import numpy as np
 
+from robonet import instrumentation
+
+_get_frame_stage = instrumentation.stage('camera.get_frame')
+
 
 class CameraPack:
     def __init__(self, device='/dev/video0', width=320, height=240):
@@ -13,15 +17,21 @@ class CameraPack:
         self.height = height
         self.test_variable = b'small byte array'  # Example test variable
 
-    def get_packed_frame(self):
+    def get_jpeg(self):
+        """Get the next frame's jpeg bytes, or None if the camera gave us a broken frame."""
+        start = _get_frame_stage.begin()
         frame_bytes = self.camera.get_frame()
         a = frame_bytes.find(b'\xff\xd8')
         b = frame_bytes.find(b'\xff\xd9')
+        _get_frame_stage.end(start)
         if a != -1 and b != -1:
-            jpg = frame_bytes[a:b + 2]
+            return frame_bytes[a:b + 2]
         else:
-            jpg = None
+            return None
+
+    def get_packed_frame(self):
         """Pack the camera resolution, frame length, frame bytes, and test variable into a UDP message."""
+        jpg = self.get_jpeg()
         # Convert width, height, and frame_bytes length into byte format
         if jpg is not None:
             frame_length_bytes = struct.pack('!Q', len(jpg))  # Frame length (8 bytes unsigned int)
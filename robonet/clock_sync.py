@@ -0,0 +1,140 @@
+"""The other end's clock in terms of ours, from the timestamps LinkMonitor's pings and pongs already carry.
+
+    sync = ClockSync()
+    link_monitor = LinkMonitor(clock_sync=sync)
+    latency_monitor = LatencyMonitor(to_local_time=sync.to_local_time)
+
+and the robot's capture and send times compare directly with the base station's receive times.
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class ClockSync:
+    """Estimates the offset and drift of the other end's clock, NTP style.
+
+    Each ping/pong exchange gives t0, our clock when the ping went out, t1, theirs when they answered, and t3, ours
+    when the pong came back. If the path is the same length both ways, their clock read t1 at our (t0 + t3) / 2, so
+    that's the offset, give or take half the round trip. The exchange with the lowest round trip bounds it tightest,
+    so it anchors the estimate, and drift is a least squares fit through the exchanges with a round trip close to the
+    lowest, once they span min_drift_span seconds. Until then drift is taken as anything up to max_drift.
+
+    If exchanges keep disagreeing with the estimate by more than their round trip allows, the other end's clock has
+    jumped (it restarted, say), and the estimate starts over.
+    """
+
+    def __init__(self, window=64, startup_samples=8, startup_interval=0.05, min_drift_span=10.0, max_drift=100e-6,
+                 rtt_margin=0.002, jump_samples=3, clock=time.monotonic):
+        self.startup_samples = startup_samples  # exchanges to do quickly at the start, before pinging at the usual rate
+        self.startup_interval = startup_interval
+        self.min_drift_span = min_drift_span
+        self.max_drift = max_drift  # seconds per second. Crystals are good to 50ppm or so, each end.
+        self.rtt_margin = rtt_margin  # exchanges within this of the lowest round trip go into the drift fit
+        self.jump_samples = jump_samples
+        self.clock = clock
+        self.samples = deque(maxlen=window)  # (our time, offset, round trip)
+        self.samples_taken = 0
+        self.resets = 0
+        self.ref_time = None  # our time of the anchoring exchange
+        self.ref_offset = 0.0
+        self.ref_error = float('inf')
+        self.drift = 0.0
+        self.drift_error = max_drift
+        self._disagreeing = 0
+        self._lock = threading.Lock()
+
+    @property
+    def synced(self):
+        return self.ref_time is not None
+
+    def add_exchange(self, t0, t1, t3):
+        """Our ping send time, their reply time and our pong receive time, for one exchange."""
+        rtt = t3 - t0
+        if rtt < 0:
+            return
+        local_time = (t0 + t3) / 2
+        offset = t1 - local_time
+        with self._lock:
+            if self.synced:
+                expected, error = self._offset_at(local_time)
+                if abs(offset - expected) > error + rtt / 2:
+                    self._disagreeing += 1
+                    if self._disagreeing < self.jump_samples:
+                        return
+                    self.samples.clear()
+                    self.resets += 1
+                self._disagreeing = 0
+            self.samples.append((local_time, offset, rtt))
+            self.samples_taken += 1
+            self._update()
+
+    def _update(self):
+        samples = np.array(self.samples)
+        times, offsets, rtts = samples[:, 0], samples[:, 1], samples[:, 2]
+        best = int(np.argmin(rtts))
+        self.ref_time, self.ref_offset, self.ref_error = times[best], offsets[best], rtts[best] / 2
+        self.drift, self.drift_error = 0.0, self.max_drift
+
+        good = rtts <= rtts[best] + self.rtt_margin
+        times, offsets = times[good], offsets[good]
+        if len(times) >= 3 and times.max() - times.min() >= self.min_drift_span:
+            centered = times - times.mean()
+            drift, intercept = np.polyfit(centered, offsets, 1)
+            residuals = offsets - (intercept + drift * centered)
+            stderr = np.sqrt(residuals @ residuals / (len(times) - 2) / (centered @ centered))
+            self.drift = float(drift)
+            self.drift_error = float(min(max(3 * stderr, 1e-7), self.max_drift))
+
+    def _offset_at(self, local_time):
+        age = abs(local_time - self.ref_time)
+        return self.ref_offset + self.drift * (local_time - self.ref_time), self.ref_error + self.drift_error * age
+
+    def offset_at(self, local_time=None):
+        """(their clock minus ours, error bound) at one of our times, now by default. (0, inf) before any exchange."""
+        if local_time is None:
+            local_time = self.clock()
+        with self._lock:
+            if not self.synced:
+                return 0.0, float('inf')
+            return self._offset_at(local_time)
+
+    def to_local_time_with_error(self, remote_time):
+        """(our time, error bound) for one of their timestamps."""
+        with self._lock:
+            if not self.synced:
+                return remote_time, float('inf')
+            local_time = remote_time - self.ref_offset
+            offset, error = self._offset_at(local_time)  # drift moves the offset a hair between the two times
+            return remote_time - offset, error
+
+    def to_local_time(self, remote_time):
+        """One of their timestamps on our clock. Passed through as it is until the first exchange."""
+        return self.to_local_time_with_error(remote_time)[0]
+
+    def to_remote_time(self, local_time):
+        offset, _ = self.offset_at(local_time)
+        return local_time + offset
+
+    def ping_interval(self, interval):
+        """How long to wait before the next ping, given the usual interval: shorter until startup_samples are in."""
+        return self.startup_interval if self.samples_taken < self.startup_samples else interval
+
+    def snapshot(self):
+        offset, error = self.offset_at()
+        with self._lock:
+            min_rtt = min(rtt for _, _, rtt in self.samples) if self.samples else None
+            return {
+                'synced': self.synced,
+                'offset_ms': offset * 1000,
+                'error_ms': error * 1000,
+                'drift_ppm': self.drift * 1e6,
+                'drift_error_ppm': self.drift_error * 1e6,
+                'samples': len(self.samples),
+                'samples_taken': self.samples_taken,
+                'min_rtt_ms': None if min_rtt is None else min_rtt * 1000,
+                'resets': self.resets,
+            }
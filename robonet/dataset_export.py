@@ -0,0 +1,207 @@
+"""Turns recordings into training arrays: one .npy per stream per segment, decoded in a process pool.
+
+For each stream, out_dir/<stream>/NNNNNN.npy holds the decoded messages of segment NNNNNN stacked into one fixed
+shape array, and NNNNNN.timestamps.npy their recorded timestamps. Timestamps come from the recorder's clock for
+every stream, so streams line up with each other. manifest.json lists what's been exported, so running the export
+again only decodes segments that have been closed since.
+
+    python -m robonet.dataset_export recordings/field_test datasets/field_test --streams MJpegCamFrame/0
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from robonet.buffers.buffer_handling import unpack_obj
+from robonet.recording import Segment, list_segments, load_streams
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def decode_mjpeg(obj, image_size=None):
+    img = cv2.imdecode(np.frombuffer(obj.mjpeg, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Corrupt JPEG")
+    if image_size is not None and (img.shape[1], img.shape[0]) != image_size:
+        img = cv2.resize(img, image_size, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def decode_cv_frame(obj, image_size=None):
+    img = obj.cv_image
+    if image_size is not None and (img.shape[1], img.shape[0]) != image_size:
+        img = cv2.resize(img, image_size, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def decode_audio(obj, image_size=None):
+    return np.asarray(obj.fft_data, dtype=np.complex64)
+
+
+def decode_imu(obj, image_size=None):
+    return np.array([obj.accel_data or (np.nan,) * 3, obj.gyro_data or (np.nan,) * 3, obj.mag_data or (np.nan,) * 3],
+                    dtype=np.float32)
+
+
+# class name -> decode(obj, image_size) returning one fixed shape array per message
+DECODERS = {
+    'MJpegCamFrame': decode_mjpeg,
+    'CVCamFrame': decode_cv_frame,
+    'AudioBuffer': decode_audio,
+    'IMUBuffer': decode_imu,
+}
+
+
+def stream_dir_name(stream):
+    return stream.replace('/', '_')
+
+
+def segment_closed(segment):
+    """Recorders truncate a segment's log to what's in it when they close it. Until then it's preallocated."""
+    return len(segment.index) and os.path.getsize(segment.log_path) == int(segment.index['length'].sum())
+
+
+def export_segment(recording_dir, number, streams, out_dir, image_size=None):
+    """Decode the wanted streams of one segment into .npy files. Runs in a worker process.
+
+    streams maps stream name -> stream number. Returns {stream name: manifest entry}. Messages that fail to decode,
+    or don't match the shape of the stream's first message, are skipped and counted.
+    """
+    segment = Segment(recording_dir, number)
+    results = {}
+    for name, stream_number in streams.items():
+        positions = np.flatnonzero(segment.index['stream'] == stream_number)
+        if not len(positions):
+            continue
+        decode = DECODERS[name.split('/')[0]]
+        stream_dir = os.path.join(out_dir, stream_dir_name(name))
+        os.makedirs(stream_dir, exist_ok=True)
+        data_path = os.path.join(stream_dir, f"{number:06d}.npy")
+
+        out = None
+        kept = []
+        skipped = 0
+        for i in positions:
+            try:
+                value = decode(unpack_obj(bytes(segment.message(i))), image_size)
+            except (ValueError, TypeError, cv2.error):
+                skipped += 1
+                continue
+            if out is None:
+                out = np.lib.format.open_memmap(data_path + '.tmp', 'w+', value.dtype, (len(positions),) + value.shape)
+            elif value.shape != out.shape[1:]:
+                skipped += 1
+                continue
+            out[len(kept)] = value
+            kept.append(i)
+        if out is None:
+            results[name] = {'count': 0, 'skipped': skipped}
+            continue
+
+        if skipped:  # trim the unused rows
+            trimmed = np.lib.format.open_memmap(data_path + '.trim', 'w+', out.dtype, (len(kept),) + out.shape[1:])
+            trimmed[:] = out[:len(kept)]
+            trimmed.flush()
+            del trimmed
+            os.replace(data_path + '.trim', data_path + '.tmp')
+        out.flush()
+        shape, dtype = list(out.shape[1:]), str(out.dtype)
+        del out
+        os.replace(data_path + '.tmp', data_path)
+        np.save(os.path.join(stream_dir, f"{number:06d}.timestamps.npy"), segment.index['timestamp'][kept])
+        results[name] = {'count': len(kept), 'skipped': skipped, 'shape': shape, 'dtype': dtype}
+    segment.close()
+    return results
+
+
+def _worker_init():
+    cv2.setNumThreads(1)  # one process per core already, opencv's own threads would just fight them
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'segments': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir, manifest):
+    tmp_path = os.path.join(out_dir, MANIFEST_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_FILE))
+
+
+def export(recording_dir, out_dir, streams=None, processes=None, image_size=None):
+    """Export every closed segment not yet in the manifest, one segment per worker. Returns the manifest.
+
+    streams is a list of stream names, all decodable streams by default. image_size (width, height) resizes camera
+    frames, for recordings where the resolution changed.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    recorded_streams = load_streams(recording_dir)
+    wanted = {name: number for name, number in recorded_streams.items()
+              if (streams is None or name in streams) and name.split('/')[0] in DECODERS}
+
+    todo = []
+    for number in list_segments(recording_dir):
+        done = manifest['segments'].get(str(number), {})
+        missing = {name: n for name, n in wanted.items() if name not in done}
+        if not missing:
+            continue
+        segment = Segment(recording_dir, number)
+        closed = segment_closed(segment)
+        segment.close()
+        if closed:
+            todo.append((number, missing))
+
+    with ProcessPoolExecutor(processes, initializer=_worker_init) as pool:
+        futures = {pool.submit(export_segment, recording_dir, number, missing, out_dir, image_size): (number, missing)
+                   for number, missing in todo}
+        for future in as_completed(futures):
+            number, missing = futures[future]
+            entry = manifest['segments'].setdefault(str(number), {})
+            results = future.result()
+            for name in missing:  # streams with nothing in this segment are done too
+                entry[name] = results.get(name, {'count': 0, 'skipped': 0})
+            save_manifest(out_dir, manifest)  # after every segment, so an interrupted export resumes from here
+    return manifest
+
+
+def load_stream(out_dir, stream):
+    """(list of read-only memmaps, one per segment, and all their timestamps concatenated) for a stream."""
+    manifest = load_manifest(out_dir)
+    stream_dir = os.path.join(out_dir, stream_dir_name(stream))
+    arrays, timestamps = [], []
+    for number in sorted(manifest['segments'], key=int):
+        if manifest['segments'][number].get(stream, {}).get('count'):
+            arrays.append(np.load(os.path.join(stream_dir, f"{int(number):06d}.npy"), mmap_mode='r'))
+            timestamps.append(np.load(os.path.join(stream_dir, f"{int(number):06d}.timestamps.npy")))
+    return arrays, np.concatenate(timestamps) if timestamps else np.empty(0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('recording_dir')
+    parser.add_argument('out_dir')
+    parser.add_argument('--streams', nargs='*')
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--image-size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'))
+    args = parser.parse_args(argv)
+    manifest = export(args.recording_dir, args.out_dir, args.streams, args.processes,
+                      tuple(args.image_size) if args.image_size else None)
+    totals = {}
+    for entry in manifest['segments'].values():
+        for name, stream in entry.items():
+            totals[name] = totals.get(name, 0) + stream['count']
+    print(f"Exported {len(manifest['segments'])} segments: {totals}")
+
+
+if __name__ == '__main__':
+    main()
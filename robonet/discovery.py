@@ -0,0 +1,250 @@
+"""Fast peer discovery over plain UDP sockets.
+
+Speaks the same datagrams as ZMQ's udp RADIO/DISH (a group length byte, the group, then the body), so either end
+can still be the old zmq based discovery in util.py.
+"""
+
+import abc
+import json
+import os
+import select
+import socket
+import struct
+import time
+
+DISCOVERY_GROUP = 'discovery'
+MULTICAST_ADDR = '239.0.0.1'
+SERVER_PORT = 9998
+CLIENT_PORT = 9999
+PING = 'PING from server'
+PING_RESPONSE = 'PING_RESPONSE from client'
+DEFAULT_CACHE_PATH = os.path.expanduser('~/.cache/robonet/peers.json')
+
+
+def pack_udp_group(group, payload):
+    """Frame a datagram the way a ZMQ udp RADIO does."""
+    group = group.encode('utf-8')
+    return bytes([len(group)]) + group + payload
+
+
+def unpack_udp_group(datagram):
+    """Split a ZMQ udp RADIO datagram into (group, payload)."""
+    group_len = datagram[0]
+    return bytes(datagram[1:1 + group_len]).decode('utf-8'), datagram[1 + group_len:]
+
+
+def is_multicast(addr):
+    return 224 <= int(addr.split('.')[0]) <= 239
+
+
+def open_udp_socket(port, group_addr=MULTICAST_ADDR, bind_addr=''):
+    """Non-blocking UDP socket bound to port, joined to group_addr if it's a multicast address."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((bind_addr, port))
+    if is_multicast(group_addr):
+        membership = struct.pack('4s4s', socket.inet_aton(group_addr), socket.inet_aton('0.0.0.0'))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    sock.setblocking(False)
+    return sock
+
+
+class PeerCache:
+    """Remembers the last peer IP for each role, so a restart can probe it directly."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self.peers = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.peers = json.load(f)
+            except (OSError, ValueError):
+                self.peers = {}
+
+    def get(self, role):
+        return self.peers.get(role)
+
+    def set(self, role, ip):
+        self.peers[role] = ip
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump(self.peers, f)
+
+
+class Backoff:
+    """Fast at first, then slower: 10ms, 20ms, 40ms... up to max_interval."""
+
+    def __init__(self, initial_interval=0.01, max_interval=1.0):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.interval = initial_interval
+
+    def next(self):
+        interval = self.interval
+        self.interval = min(self.interval * 2, self.max_interval)
+        return interval
+
+    def reset(self):
+        self.interval = self.initial_interval
+
+
+class _DiscoveryEndpoint(abc.ABC):
+    role = None
+    peer_role = None
+
+    def __init__(self, local_ip, listen_port, peer_port, group_addr=MULTICAST_ADDR, cache=None, backoff=None,
+                 bind_addr=''):
+        self.local_ip = local_ip
+        self.listen_port = listen_port
+        # '' for every address. Unicast goes to the most specific binding, so next to a DISH bound to local_ip on
+        # listen_port (a session rediscovering its peer), this has to be local_ip too, or the DISH gets the replies.
+        self.bind_addr = bind_addr
+        self.peer_port = peer_port
+        self.group_addr = group_addr
+        self.cache = cache if cache is not None else PeerCache(None)
+        self.backoff = backoff or Backoff()
+        self.last_duration = None  # seconds the last discover() took
+        self.peer_was_cached = False  # whether the last peer found was the one in the cache
+
+    def _send(self, sock, text, addr):
+        try:
+            sock.sendto(pack_udp_group(DISCOVERY_GROUP, text.encode('utf-8')), (addr, self.peer_port))
+        except OSError as e:
+            print(f"Discovery send to {addr} failed: {e}")
+
+    def _recv_all(self, sock):
+        """Every (message, sender_ip) waiting on the socket."""
+        messages = []
+        while True:
+            try:
+                datagram, (sender_ip, _) = sock.recvfrom(2048)
+            except BlockingIOError:
+                return messages
+            try:
+                group, payload = unpack_udp_group(datagram)
+                if group == DISCOVERY_GROUP:
+                    messages.append((payload.decode('utf-8'), sender_ip))
+            except (IndexError, UnicodeDecodeError):
+                pass  # not ours
+
+    def _targets(self):
+        last_peer = self.cache.get(self.peer_role)
+        return [last_peer, self.group_addr] if last_peer else [self.group_addr]
+
+    def _open_sockets(self):
+        """The socket to probe from and listen on, and, when that's bound to one address, one for the group.
+
+        A socket bound to a unicast address never gets multicast datagrams, so the group needs a socket of its own.
+        """
+        socks = [open_udp_socket(self.listen_port, self.group_addr, self.bind_addr)]
+        if self.bind_addr and is_multicast(self.group_addr):
+            socks.append(open_udp_socket(self.listen_port, self.group_addr, self.group_addr))
+        return socks
+
+    def _wait(self, socks, timeout):
+        """Every (message, sender_ip) that arrives on socks within timeout."""
+        readable, _, _ = select.select(socks, [], [], timeout)
+        return [message for sock in readable for message in self._recv_all(sock)]
+
+    def discover(self, timeout=None):
+        """Run discovery until the peer is found. Returns the peer IP, or None on timeout."""
+        start = time.monotonic()
+        self.backoff.reset()
+        socks = self._open_sockets()
+        try:
+            peer_ip = self._discover(socks, start, timeout)
+        finally:
+            for sock in socks:
+                sock.close()
+        self.last_duration = time.monotonic() - start
+        if peer_ip is not None:
+            self.peer_was_cached = peer_ip == self.cache.get(self.peer_role)
+            self.cache.set(self.peer_role, peer_ip)
+            print(f"Discovered {self.peer_role} {peer_ip} in {self.last_duration * 1000:.1f}ms")
+        return peer_ip
+
+    @abc.abstractmethod
+    def _discover(self, socks, start, timeout):
+        """Probe from socks[0] until the peer answers on any of socks or timeout passes. Returns its IP, or None."""
+
+
+class DiscoveryServer(_DiscoveryEndpoint):
+    """Pings for a client, directly at the last known client first, and returns the first client that answers."""
+
+    role = 'server'
+    peer_role = 'client'
+
+    def __init__(self, local_ip, listen_port=SERVER_PORT, peer_port=CLIENT_PORT, **kwargs):
+        super().__init__(local_ip, listen_port, peer_port, **kwargs)
+
+    def _discover(self, socks, start, timeout):
+        sock = socks[0]
+        ping = f"{PING}: {self.local_ip}"
+        next_ping = start
+        while timeout is None or time.monotonic() - start < timeout:
+            now = time.monotonic()
+            if now >= next_ping:
+                for addr in self._targets():
+                    self._send(sock, ping, addr)
+                next_ping = now + self.backoff.next()
+
+            for message, sender_ip in self._wait(socks, max(next_ping - time.monotonic(), 0)):
+                if message.startswith(PING_RESPONSE):
+                    client_ip = message.split(":")[-1].strip()
+                    self._send(sock, ping, client_ip)  # in case the client found us through its cache
+                    return client_ip
+        return None
+
+
+class DiscoveryClient(_DiscoveryEndpoint):
+    """Answers pings as soon as they arrive. Also tells the last known server it's back, so it needn't wait."""
+
+    role = 'client'
+    peer_role = 'server'
+
+    def __init__(self, local_ip, listen_port=CLIENT_PORT, peer_port=SERVER_PORT, **kwargs):
+        super().__init__(local_ip, listen_port, peer_port, **kwargs)
+
+    def _targets(self):
+        last_peer = self.cache.get(self.peer_role)
+        return [last_peer] if last_peer else []
+
+    def _discover(self, socks, start, timeout):
+        sock = socks[0]
+        response = f"{PING_RESPONSE}: {self.local_ip}"
+        next_hello = start
+        while timeout is None or time.monotonic() - start < timeout:
+            now = time.monotonic()
+            if now >= next_hello:
+                for addr in self._targets():
+                    self._send(sock, response, addr)
+                next_hello = now + self.backoff.next()
+
+            for message, sender_ip in self._wait(socks, max(next_hello - time.monotonic(), 0)):
+                if message.startswith(PING):
+                    server_ip = message.split(":")[-1].strip()
+                    self._send(sock, response, server_ip)
+                    self._send(sock, response, self.group_addr)  # the old zmq server only listens on multicast
+                    return server_ip
+        return None
+
+
+class TimeToFirstFrame:
+    """Measures from construction (i.e. before discovery) until the first object reaches a handler."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.start = clock()
+        self.elapsed = None
+
+    def wrap(self, handler):
+        def first_frame_handler(obj):
+            if self.elapsed is None:
+                self.elapsed = self.clock() - self.start
+                print(f"Time to first frame: {self.elapsed * 1000:.1f}ms")
+            handler(obj)
+
+        return first_frame_handler
@@ -0,0 +1,54 @@
+"""Encode CVCamFrames on all of the robot's cores without reordering them."""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from robonet.buffers.buffer_handling import pack_obj
+
+
+def _pack_in_worker(obj, meta):
+    return pack_obj(obj, meta)
+
+
+class FrameEncoderPool:
+    """Packs objects in worker processes and hands the packed messages back in the order they were submitted.
+
+    Meant for CVCamFrames with a JPEG/WEBP/PNG encoding, where pack_obj spends nearly all its time in cv2.imencode.
+    At most max_pending frames are in flight; submitting another waits for the oldest one.
+    """
+
+    def __init__(self, processes=None, max_pending=None):
+        processes = processes or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(processes)
+        self.max_pending = max_pending or 2 * processes
+        self.pending = deque()
+
+    def submit(self, obj, meta=None):
+        """Queue obj for packing. Returns the packed messages that are ready now, oldest first."""
+        if len(self.pending) >= self.max_pending:
+            self.pending[0].result()  # backpressure, so a slow link can't queue unbounded frames
+        self.pending.append(self.executor.submit(_pack_in_worker, obj, meta))
+        return self.ready()
+
+    def ready(self):
+        """Packed messages that are done, stopping at the first one that isn't, so order is kept."""
+        done = []
+        while self.pending and self.pending[0].done():
+            done.append(self.pending.popleft().result())
+        return done
+
+    def drain(self):
+        """Wait for and return everything still in flight."""
+        done = [future.result() for future in self.pending]
+        self.pending.clear()
+        return done
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,150 @@
+"""Runs obj handlers on their own threads, behind bounded queues, so a slow handler can't stall the receive loop.
+
+    handlers = QueuedHandlers({'MJpegCamFrame': display, 'AudioBuffer': to_nnet}, maxsize=4,
+                              batch_sizes={'AudioBuffer': 16})
+    receive_objs(handlers, ...)
+    handlers.stats()  # per handler lag, drops and queue depth
+
+When a queue is full the policy decides: 'drop-oldest' makes room by dropping the oldest queued object (the default,
+right for video, where only the latest frame matters), 'drop-newest' drops the object coming in, and 'block' makes the
+receive loop wait, which pushes the loss down into the socket's buffers instead.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from robonet import instrumentation
+from robonet.stats import Histogram, log_bucket_edges
+
+POLICIES = ('drop-oldest', 'drop-newest', 'block')
+
+_log = instrumentation.sampled_logger(__name__)
+
+
+class HandlerQueue:
+    """Callable that queues objects for handler, which a worker thread calls with them in order.
+
+    With batch_size above 1 the handler gets a list of everything queued, up to batch_size objects, instead of one
+    object at a time. Lag is how long an object waited in the queue before the handler got it.
+    """
+
+    def __init__(self, handler, name='handler', maxsize=8, policy='drop-oldest', batch_size=1, clock=time.monotonic):
+        if policy not in POLICIES:
+            raise ValueError(f"policy should be one of {POLICIES}, not {policy}")
+        if maxsize < 1 or batch_size < 1:
+            raise ValueError("maxsize and batch_size should be at least 1")
+        self.handler = handler
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.batch_size = batch_size
+        self.clock = clock
+        self.queued = 0
+        self.handled = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.lag_ms = Histogram(log_bucket_edges(0.01, 10000))
+        self._stage = instrumentation.stage('worker.' + name)
+        self._queue = deque()  # (time queued, obj)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"{name} worker", daemon=True)
+        self._thread.start()
+
+    def __call__(self, obj):
+        now = self.clock()
+        with self._cond:
+            if self._closed:  # the worker may be gone already
+                self.dropped += 1
+                return
+            if len(self._queue) >= self.maxsize:
+                if self.policy == 'drop-newest':
+                    self.dropped += 1
+                    return
+                if self.policy == 'drop-oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._queue) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+                    if self._closed:  # woken by close()
+                        self.dropped += 1
+                        return
+            self._queue.append((now, obj))
+            self.queued += 1
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify_all()
+
+    def _take(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._cond.notify_all()  # room for a blocked receive loop
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            now = self.clock()
+            for queued_time, _ in batch:
+                self.lag_ms.record((now - queued_time) * 1000)
+            start = self._stage.begin()
+            try:
+                if self.batch_size > 1:
+                    self.handler([obj for _, obj in batch])
+                else:
+                    self.handler(batch[0][1])
+            except Exception as e:  # one bad object shouldn't take the worker down with it
+                self.errors += 1
+                _log(logging.ERROR, self.name, "%s handler failed: %r", self.name, e)
+            self._stage.end(start)
+            self.handled += len(batch)
+
+    def depth(self):
+        return len(self._queue)
+
+    def stats(self):
+        return {
+            'queued': self.queued,
+            'handled': self.handled,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'depth': self.depth(),
+            'max_depth': self.max_depth,
+            'lag_ms': self.lag_ms.snapshot(),
+        }
+
+    def close(self, timeout=None):
+        """Let the worker finish what's queued, then stop it. Objects handed over after this are dropped."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+
+class QueuedHandlers(dict):
+    """obj_handlers for receive_objs with every handler behind its own HandlerQueue.
+
+    maxsize and policy apply to all of them. batch_sizes maps class names to batch sizes for handlers that take
+    lists. Handlers that are already HandlerQueues are used as they are.
+    """
+
+    def __init__(self, obj_handlers, maxsize=8, policy='drop-oldest', batch_sizes=None):
+        batch_sizes = batch_sizes or {}
+        super().__init__({
+            name: handler if isinstance(handler, HandlerQueue)
+            else HandlerQueue(handler, name, maxsize, policy, batch_sizes.get(name, 1))
+            for name, handler in obj_handlers.items()})
+
+    def stats(self):
+        return {name: queue.stats() for name, queue in self.items()}
+
+    def close(self, timeout=None):
+        for queue in self.values():
+            queue.close(timeout)
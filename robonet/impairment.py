@@ -0,0 +1,209 @@
+"""Bad network conditions on one machine: loss, bursty loss, reordering, duplication, delay, jitter and a bandwidth cap.
+
+ImpairedDish wraps the receiving end of any transport in-process, and UdpImpairmentRelay sits between two UDP
+endpoints as a separate hop. Both run datagrams through an ImpairedLink, which does the actual deciding.
+"""
+
+import heapq
+import itertools
+import random
+import select
+import socket
+import threading
+import time
+
+import zmq
+
+
+class Impairment:
+    """What to do to the datagrams crossing a link. The defaults do nothing.
+
+    Loss is Gilbert-Elliott: the link flips between a good state, losing loss of its datagrams, and a bad state,
+    losing burst_loss of them. It goes bad with probability p_bad and recovers with probability p_good per datagram,
+    so bursts are 1 / p_good datagrams long on average. With p_bad=0 it's plain random loss.
+    """
+
+    def __init__(self, loss=0.0, p_bad=0.0, p_good=1.0, burst_loss=1.0, reorder=0.0, reorder_delay=0.005,
+                 duplicate=0.0, delay=0.0, jitter=0.0, bandwidth=None, max_queue_delay=0.2, seed=None):
+        self.loss = loss
+        self.p_bad = p_bad
+        self.p_good = p_good
+        self.burst_loss = burst_loss
+        self.reorder = reorder  # chance a datagram is held back by reorder_delay seconds, so later ones overtake it
+        self.reorder_delay = reorder_delay
+        self.duplicate = duplicate
+        self.delay = delay  # seconds
+        self.jitter = jitter  # seconds, uniformly added on top of delay. Like netem, this alone reorders datagrams.
+        self.bandwidth = bandwidth  # bits per second, None for unlimited
+        self.max_queue_delay = max_queue_delay  # datagrams that would wait longer than this for bandwidth are dropped
+        self.seed = seed
+
+
+class ImpairedLink:
+    """Decides the fate of each datagram pushed in, and hands back the surviving ones when they're due."""
+
+    def __init__(self, impairment, clock=time.monotonic):
+        self.impairment = impairment
+        self.clock = clock
+        self.random = random.Random(impairment.seed)
+        self.bad = False
+        self.link_free = 0.0  # when the bandwidth capped link has sent everything queued so far
+        self.in_flight = []  # heap of (deliver time, order, datagram)
+        self._order = itertools.count()
+        self.stats = {'pushed': 0, 'delivered': 0, 'lost': 0, 'burst_lost': 0, 'queue_dropped': 0,
+                      'duplicated': 0, 'reordered': 0}
+
+    def _lost(self):
+        imp = self.impairment
+        if self.bad:
+            self.bad = self.random.random() >= imp.p_good
+        else:
+            self.bad = self.random.random() < imp.p_bad
+        if self.random.random() < (imp.burst_loss if self.bad else imp.loss):
+            self.stats['burst_lost' if self.bad else 'lost'] += 1
+            return True
+        return False
+
+    def _schedule(self, datagram, now):
+        imp = self.impairment
+        depart = now
+        if imp.bandwidth:
+            start = max(now, self.link_free)
+            if start - now > imp.max_queue_delay:
+                self.stats['queue_dropped'] += 1
+                return
+            self.link_free = depart = start + len(datagram) * 8 / imp.bandwidth
+        deliver = depart + imp.delay + self.random.uniform(0, imp.jitter)
+        if imp.reorder and self.random.random() < imp.reorder:
+            deliver += imp.reorder_delay
+            self.stats['reordered'] += 1
+        heapq.heappush(self.in_flight, (deliver, next(self._order), datagram))
+
+    def push(self, datagram, now=None):
+        now = self.clock() if now is None else now
+        self.stats['pushed'] += 1
+        if self._lost():
+            return
+        self._schedule(datagram, now)
+        if self.impairment.duplicate and self.random.random() < self.impairment.duplicate:
+            self.stats['duplicated'] += 1
+            self._schedule(datagram, now)
+
+    def next_due(self):
+        """When the next datagram is due, or None if nothing is in flight."""
+        return self.in_flight[0][0] if self.in_flight else None
+
+    def pop_due(self, now=None):
+        """The next datagram that's due by now, or None."""
+        now = self.clock() if now is None else now
+        if self.in_flight and self.in_flight[0][0] <= now:
+            self.stats['delivered'] += 1
+            return heapq.heappop(self.in_flight)[2]
+        return None
+
+
+class _Datagram:
+    """What recv(copy=False) returns, like a zmq Frame."""
+
+    def __init__(self, data):
+        self.bytes = data
+
+    def __len__(self):
+        return len(self.bytes)
+
+
+class ImpairedDish:
+    """Wraps a dish so everything received through it crosses an ImpairedLink first. Same recv/rcvtimeo as a dish."""
+
+    def __init__(self, dish, impairment, clock=time.monotonic):
+        self.dish = dish
+        self.link = ImpairedLink(impairment, clock)
+        self.clock = clock
+        self.rcvtimeo = -1
+
+    def _pull(self, timeout):
+        """Push what arrives within timeout seconds (None waits forever) into the link."""
+        self.dish.rcvtimeo = -1 if timeout is None else int(max(timeout, 0) * 1000)
+        try:
+            msg = self.dish.recv(copy=False)
+        except zmq.Again:
+            return
+        self.link.push(msg if isinstance(msg, bytes) else msg.bytes)
+        while True:  # and whatever else is already waiting
+            try:
+                msg = self.dish.recv(zmq.NOBLOCK, copy=False)
+            except zmq.Again:
+                return
+            self.link.push(msg if isinstance(msg, bytes) else msg.bytes)
+
+    def recv(self, flags=0, copy=True):
+        timeout = 0 if flags & zmq.NOBLOCK else self.rcvtimeo
+        deadline = None if timeout < 0 else self.clock() + timeout / 1000
+        while True:
+            now = self.clock()
+            datagram = self.link.pop_due(now)
+            if datagram is None and deadline is not None and now >= deadline:
+                self._pull(0)
+                datagram = self.link.pop_due()
+                if datagram is None:
+                    raise zmq.Again()
+            if datagram is not None:
+                return datagram if copy else _Datagram(datagram)
+            waits = [t - now for t in (self.link.next_due(), deadline) if t is not None]
+            self._pull(min(waits) if waits else None)
+
+    def join(self, group):
+        self.dish.join(group)
+
+    def close(self, linger=None):
+        self.dish.close(linger=linger)
+
+
+class UdpImpairmentRelay:
+    """Forwards UDP datagrams arriving on listen_port to forward_addr, through an ImpairedLink, on its own thread.
+
+    Point the sender's RADIO at the relay's port instead of at the receiver, and the receiver sees an impaired link.
+    """
+
+    def __init__(self, listen_port, forward_addr, impairment, listen_addr='127.0.0.1'):
+        self.forward_addr = forward_addr
+        self.link = ImpairedLink(impairment)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((listen_addr, listen_port))
+        self.sock.setblocking(False)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self, timeout):
+        """Take in what arrives within timeout seconds, and forward everything that's due."""
+        due = self.link.next_due()
+        if due is not None:
+            timeout = min(timeout, max(due - time.monotonic(), 0))
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        if readable:
+            while True:
+                try:
+                    datagram, _ = self.sock.recvfrom(65535)
+                except BlockingIOError:
+                    break
+                self.link.push(datagram)
+        while True:
+            datagram = self.link.pop_due()
+            if datagram is None:
+                return
+            self.sock.sendto(datagram, self.forward_addr)
+
+    def run(self):
+        while not self._stop.is_set():
+            self.poll(0.05)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sock.close()
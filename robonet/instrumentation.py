@@ -0,0 +1,234 @@
+"""Stage timers, counters and histograms for the hot paths, and sampled logging for per-message events.
+
+Everything is off until enable() is called, or ROBONET_INSTRUMENT=1 is set, and while it's off every hook is one
+attribute check. The send and receive paths time these stages:
+
+    camera.get_frame   CameraPack.get_jpeg, waiting for a frame and cutting the JPEG out of it
+    pack               pack_obj
+    send               BurstSender, fragmenting and sending one message
+    reassemble         MessageHandler.transition, for each part received. Includes unpack and the handler when
+                       the part completes a message.
+    unpack             unpack_obj in the receive loop
+    handler.<Class>    the obj handler each class is passed on to
+
+Read them back with snapshot(), or every few seconds with a SnapshotExporter:
+
+    instrumentation.enable()
+    SnapshotExporter(5.0, sink=print_snapshot).start()
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from robonet.stats import Histogram, log_bucket_edges
+
+STAGE_EDGES_US = log_bucket_edges(1, 1e6, per_decade=10)  # 1us to 1s
+
+
+class Stage:
+    """Times a named stage into a histogram of microseconds.
+
+    begin() returns a start time, or 0 while disabled, and end(start) records it. Passing the start around rather
+    than keeping it on the stage lets any number of threads time the same stage at once.
+    """
+
+    __slots__ = ('registry', 'name', 'histogram')
+
+    def __init__(self, registry, name, edges=STAGE_EDGES_US):
+        self.registry = registry
+        self.name = name
+        self.histogram = Histogram(edges)
+
+    def begin(self):
+        return time.perf_counter_ns() if self.registry.enabled else 0
+
+    def end(self, start):
+        if start:
+            self.histogram.record((time.perf_counter_ns() - start) / 1000)
+
+    def wrap(self, fn):
+        """fn, with every call timed as this stage."""
+        def timed(*args, **kwargs):
+            start = self.begin()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.end(start)
+        return timed
+
+
+class Counter:
+    __slots__ = ('registry', 'name', 'value')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+        self.value = 0
+
+    def add(self, n=1):
+        if self.registry.enabled:
+            self.value += n
+
+
+class Registry:
+    """Named stages, counters and histograms, created on first use and kept for the life of the process.
+
+    Updates aren't locked: under heavy contention a count can go missing now and then, which is fine for profiling
+    and much cheaper than a lock per message.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()  # only for creating things
+
+    def stage(self, name, edges=STAGE_EDGES_US):
+        stage = self.stages.get(name)
+        if stage is None:
+            with self._lock:
+                stage = self.stages.setdefault(name, Stage(self, name, edges))
+        return stage
+
+    def counter(self, name):
+        counter = self.counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self.counters.setdefault(name, Counter(self, name))
+        return counter
+
+    def histogram(self, name, edges):
+        """A Histogram to record() into. Check enabled before recording, it doesn't."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram(edges))
+        return histogram
+
+    def snapshot(self):
+        return {
+            'time': time.time(),
+            'enabled': self.enabled,
+            'stages_us': {name: stage.histogram.snapshot() for name, stage in list(self.stages.items())},
+            'counters': {name: counter.value for name, counter in list(self.counters.items())},
+            'histograms': {name: histogram.snapshot() for name, histogram in list(self.histograms.items())},
+        }
+
+    def reset(self):
+        for stage in list(self.stages.values()):
+            stage.histogram.reset()
+        for counter in list(self.counters.values()):
+            counter.value = 0
+        for histogram in list(self.histograms.values()):
+            histogram.reset()
+
+
+registry = Registry(os.environ.get('ROBONET_INSTRUMENT', '') not in ('', '0'))
+stage = registry.stage
+counter = registry.counter
+histogram = registry.histogram
+snapshot = registry.snapshot
+reset = registry.reset
+
+
+def enable():
+    registry.enabled = True
+
+
+def disable():
+    registry.enabled = False
+
+
+def enabled():
+    return registry.enabled
+
+
+def print_snapshot(snap):
+    """One line per stage and the non-zero counters."""
+    for name, stage_stats in snap['stages_us'].items():
+        if stage_stats['count']:
+            print(f"  {name:<24} {stage_stats['count']:8d} calls  mean {stage_stats['mean']:9.1f}us  "
+                  f"p50 {stage_stats['p50']:9.1f}us  p99 {stage_stats['p99']:9.1f}us")
+    counters = ", ".join(f"{name} {value}" for name, value in snap['counters'].items() if value)
+    if counters:
+        print(f"  {counters}")
+
+
+def json_lines_sink(path):
+    """Sink for SnapshotExporter that appends each snapshot to path as a line of json."""
+    def write(snap):
+        with open(path, 'a') as f:
+            f.write(json.dumps(snap) + '\n')
+    return write
+
+
+class SnapshotExporter:
+    """Hands a snapshot to sink every interval seconds on its own thread, and on demand with export().
+
+    With reset=True each snapshot covers only the interval since the last one.
+    """
+
+    def __init__(self, interval, sink=print_snapshot, registry=registry, reset=False):
+        self.interval = interval
+        self.sink = sink
+        self.registry = registry
+        self.reset = reset
+        self._stop = threading.Event()
+        self._thread = None
+
+    def export(self):
+        snap = self.registry.snapshot()
+        if self.reset:
+            self.registry.reset()
+        self.sink(snap)
+        return snap
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class SampledLog:
+    """Logs an event at most once per interval seconds per key, and says how many were left out in between.
+
+    For things that can happen on every message, like a corrupted part, where printing each one would cost more
+    than handling the message. Nothing is formatted unless the logger would emit the level.
+    """
+
+    def __init__(self, logger, interval=1.0, clock=time.monotonic):
+        self.logger = logger
+        self.interval = interval
+        self.clock = clock
+        self._last = {}  # key -> [time last logged, events left out since]
+
+    def __call__(self, level, key, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = self.clock()
+        last = self._last.get(key)
+        if last is not None and now - last[0] < self.interval:
+            last[1] += 1
+            return
+        if last is not None and last[1]:
+            msg += " (%d more since the last one)"
+            args += (last[1],)
+        self._last[key] = [now, 0]
+        self.logger.log(level, msg, *args)
+
+
+def sampled_logger(name, interval=1.0):
+    return SampledLog(logging.getLogger(name), interval)
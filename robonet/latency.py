@@ -0,0 +1,132 @@
+"""End to end latency and loss tracking from the MessageMeta that pack_obj can attach to messages."""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from robonet.buffers.buffer_handling import MessageMeta
+from robonet.stats import Histogram, log_bucket_edges
+
+LATENCY_EDGES_MS = log_bucket_edges(0.1, 10000)  # 100us to 10s
+GAP_EDGES = [1, 2, 3, 4, 6, 8, 12, 16, 32, 64, 128, 256]  # lost messages in a row
+
+
+class MetaStamper:
+    """Sender side. Numbers each stream's messages and timestamps them."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._next_seq = {}
+
+    def stamp(self, obj, stream_id=None, capture_time=None):
+        """Make the MessageMeta for obj. stream_id and capture_time default to obj's own fields, if it has them."""
+        if stream_id is None:
+            stream_id = getattr(obj, 'stream_id', 0)
+        key = (obj.__class__.__name__, stream_id)
+        seq = self._next_seq.get(key, 0)
+        self._next_seq[key] = (seq + 1) & 0xFFFFFFFF
+
+        send_time = self.clock()
+        if capture_time is None:
+            capture_time = getattr(obj, 'capture_time', 0.0) or send_time
+        return MessageMeta(stream_id, seq, capture_time, send_time)
+
+
+class StreamLatency:
+    """Latency histograms and sequence tracking for one stream.
+
+    Seqs skipped over are counted as lost, and remembered, up to missing_window of the most recent, so one that
+    turns up late is taken back off the loss count. A seq that's behind and wasn't missing is a duplicate.
+    """
+
+    def __init__(self, missing_window=1024):
+        self.capture_to_receive = Histogram(LATENCY_EDGES_MS)
+        self.send_to_receive = Histogram(LATENCY_EDGES_MS)
+        self.capture_to_send = Histogram(LATENCY_EDGES_MS)
+        self.gaps = Histogram(GAP_EDGES)
+        self.expected_seq = None
+        self.received = 0
+        self.lost = 0
+        self.late = 0  # reordered, arrived after a later seq
+        self.duplicates = 0
+        self.missing_window = missing_window
+        self.missing = OrderedDict()  # skipped seqs that might still turn up, oldest first
+
+    def record(self, meta, capture_time, send_time, receive_time):
+        self.received += 1
+        self.capture_to_receive.record((receive_time - capture_time) * 1000)
+        self.send_to_receive.record((receive_time - send_time) * 1000)
+        self.capture_to_send.record((meta.send_time - meta.capture_time) * 1000)
+
+        if self.expected_seq is not None:
+            gap = (meta.seq - self.expected_seq) & 0xFFFFFFFF
+            if gap >= 0x80000000:  # behind what we expected
+                if not self.missing.pop(meta.seq, False):
+                    self.duplicates += 1
+                else:
+                    self.late += 1
+                    self.lost -= 1  # it was counted as lost when we skipped over it
+                return
+            if gap:
+                self.lost += gap
+                self.gaps.record(gap)
+                for skipped in range(max(gap - self.missing_window, 0), gap):
+                    self.missing[(self.expected_seq + skipped) & 0xFFFFFFFF] = True
+                while len(self.missing) > self.missing_window:
+                    self.missing.popitem(last=False)
+        self.expected_seq = (meta.seq + 1) & 0xFFFFFFFF
+
+    def loss_rate(self):
+        total = self.received + self.lost
+        return self.lost / total if total else 0.0
+
+    def snapshot(self):
+        return {
+            'received': self.received,
+            'lost': self.lost,
+            'late': self.late,
+            'duplicates': self.duplicates,
+            'loss_rate': self.loss_rate(),
+            'capture_to_receive_ms': self.capture_to_receive.snapshot(),
+            'send_to_receive_ms': self.send_to_receive.snapshot(),
+            'capture_to_send_ms': self.capture_to_send.snapshot(),
+            'loss_gaps': self.gaps.snapshot(),
+        }
+
+
+class LatencyMonitor:
+    """Receiver side. Per stream latency and loss, queryable while the receive loop is running.
+
+    Sender timestamps are from the sender's monotonic clock, so they only compare directly with ours when both ends
+    are on the same machine. Otherwise pass to_local_time, mapping a sender timestamp onto our clock.
+    """
+
+    def __init__(self, clock=time.monotonic, to_local_time=None):
+        self.clock = clock
+        self.to_local_time = to_local_time
+        self.streams = {}
+        self._lock = threading.Lock()
+
+    def record(self, obj_name, meta, receive_time=None):
+        if receive_time is None:
+            receive_time = self.clock()
+        capture_time, send_time = meta.capture_time, meta.send_time
+        if self.to_local_time is not None:
+            capture_time, send_time = self.to_local_time(capture_time), self.to_local_time(send_time)
+
+        key = f"{obj_name}/{meta.stream_id}"
+        with self._lock:
+            stream = self.streams.get(key)
+            if stream is None:
+                stream = self.streams[key] = StreamLatency()
+            stream.record(meta, capture_time, send_time, receive_time)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: stream.snapshot() for key, stream in self.streams.items()}
+
+    def dump(self, path):
+        """Write the current snapshot as json."""
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
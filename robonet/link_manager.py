@@ -0,0 +1,128 @@
+"""NetworkManager profiles for the ad hoc link, created once and reused, with every nmcli phase timed."""
+
+import logging
+import subprocess
+import time
+
+from robonet.instrumentation import sampled_logger
+
+_log = sampled_logger(__name__)
+
+
+def run_command(args):
+    """Run a command and return its stdout. Raises subprocess.CalledProcessError if it fails."""
+    return subprocess.run(args, check=True, capture_output=True, text=True).stdout
+
+
+class LinkManager:
+    """Sets up the ad hoc Wi-Fi link described by a WifiSetupInfo.
+
+    The profile is only created the first time, or modified in one nmcli call if its settings drifted. For a known
+    robot, connecting is a single `nmcli con up`. All nmcli calls go through runner, so tests can fake nmcli.
+    """
+
+    def __init__(self, device=None, runner=run_command, prefix=24):
+        self.runner = runner
+        self.prefix = prefix
+        self.timings = {}  # phase name -> seconds, for the most recent run of each phase
+        self.connected = None  # name of the ad hoc connection connect() brought up
+        self.device = device or self.wifi_devices()[0]
+
+    def _run(self, phase, args):
+        start = time.monotonic()
+        try:
+            return self.runner(args)
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0.0) + time.monotonic() - start
+
+    def wifi_devices(self):
+        output = self._run('devices', ['nmcli', '-t', '-f', 'DEVICE,TYPE', 'device'])
+        devices = [line.split(':')[0] for line in output.splitlines() if line.endswith(':wifi')]
+        if not devices:
+            raise RuntimeError("No wifi devices found by nmcli")
+        return devices
+
+    def active_connection(self):
+        """Name of the connection currently up on our device, so it can be restored later."""
+        output = self._run('active', ['nmcli', '-t', '-g', 'GENERAL.CONNECTION', 'device', 'show', self.device])
+        return output.strip() or None
+
+    def profile_settings(self, wifi_obj, ip):
+        return {
+            'connection.interface-name': self.device,
+            'connection.autoconnect': 'yes',
+            '802-11-wireless.ssid': wifi_obj.ssid,
+            '802-11-wireless.mode': 'adhoc',
+            'ipv4.method': 'manual',
+            'ipv4.addresses': f"{ip}/{self.prefix}",
+            'ipv6.method': 'ignore',
+        }
+
+    def existing_settings(self, name, keys):
+        """The profile's current values for keys, or None if there's no such profile."""
+        try:
+            output = self._run('check', ['nmcli', '-t', '-g', ','.join(keys), 'connection', 'show', name])
+        except subprocess.CalledProcessError:
+            return None  # exit code 10: no such connection
+        values = output.splitlines()
+        return dict(zip(keys, values + [''] * (len(keys) - len(values))))
+
+    def ensure_profile(self, wifi_obj, ip):
+        """Make sure a profile named after the ssid exists with the right settings. Returns what it had to do."""
+        name = wifi_obj.ssid
+        wanted = self.profile_settings(wifi_obj, ip)
+        existing = self.existing_settings(name, list(wanted))
+
+        try:
+            if existing is None:
+                args = ['nmcli', 'connection', 'add', 'type', 'wifi', 'con-name', name, 'ifname', self.device,
+                        'ssid', wifi_obj.ssid]
+                for key, value in wanted.items():
+                    args.extend([key, value])
+                self._run('create', args)
+                return 'created'
+
+            changed = {key: value for key, value in wanted.items() if existing.get(key) != value}
+            if not changed:
+                return 'reused'
+            args = ['nmcli', 'connection', 'modify', name]
+            for key, value in changed.items():
+                args.extend([key, value])
+            self._run('modify', args)
+            return 'modified'
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Setting up the ad hoc profile {name} failed: {e.stderr}")
+
+    def up(self, name):
+        try:
+            self._run('up', ['nmcli', 'connection', 'up', name])
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"nmcli couldn't bring up {name}: {e.stderr}")
+
+    def down(self, name):
+        try:
+            self._run('down', ['nmcli', 'connection', 'down', name])
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"nmcli couldn't bring down {name}: {e.stderr}")
+
+    def connect(self, wifi_obj, ip):
+        """Switch our device to the ad hoc link, creating or fixing its profile only if needed."""
+        self.timings = {}
+        action = self.ensure_profile(wifi_obj, ip)
+        self.up(wifi_obj.ssid)
+        self.connected = wifi_obj.ssid
+        _log(logging.INFO, 'connected', "Ad hoc link %s up (%s profile): %s", wifi_obj.ssid, action,
+             ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.timings.items()))
+        return action
+
+    def restore(self, connection):
+        """Go back to a previous connection, or, if there wasn't one, take the ad hoc connection down.
+
+        Bringing the previous connection up replaces the ad hoc one, so that needs no separate `con down`. Without
+        one, the ad hoc profile would stay up, and with autoconnect on it would come back after a reboot too.
+        """
+        if connection:
+            self.up(connection)
+        elif self.connected is not None:
+            self.down(self.connected)
+        self.connected = None
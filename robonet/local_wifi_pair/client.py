@@ -1,16 +1,21 @@
 import zmq
 
-from robonet.util import get_local_ip, client_unicast_communication, client_udp_discovery
+from robonet.discovery import DiscoveryClient, PeerCache
+from robonet.session import supervised_client_communication
+from robonet.util import get_local_ip
 
 
-def run_client(callback):
-    """Main function to run the client."""
+def run_client(callback, link_monitor=None):
+    """Main function to run the client.
+
+    Callbacks that only transmit need a link_monitor (and one on the server) to notice the server dropping out.
+    """
     ctx = zmq.Context()
 
     local_ip = get_local_ip()
-    server_ip = client_udp_discovery(ctx, local_ip)
+    server_ip = DiscoveryClient(local_ip, cache=PeerCache()).discover()
 
-    client_unicast_communication(ctx, local_ip, server_ip, callback)
+    supervised_client_communication(ctx, local_ip, server_ip, callback, link_monitor=link_monitor)
 
     ctx.term()
 
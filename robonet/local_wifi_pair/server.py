@@ -1,17 +1,19 @@
 """Server communicating through UDP without disconnecting from the local Wi-Fi."""
 
 import zmq
-from robonet.util import get_local_ip, server_udp_discovery, server_unicast_communication
+from robonet.discovery import DiscoveryServer, PeerCache
+from robonet.session import supervised_server_communication
+from robonet.util import get_local_ip
 
 
-def run(callback):
+def run(callback, link_monitor=None):
     """Main function to run the server."""
     ctx = zmq.Context.instance()
 
     local_ip = get_local_ip()
-    client_ip = server_udp_discovery(ctx, local_ip)
+    client_ip = DiscoveryServer(local_ip, cache=PeerCache()).discover()
 
-    server_unicast_communication(ctx, local_ip, client_ip, callback)
+    supervised_server_communication(ctx, local_ip, client_ip, callback, link_monitor=link_monitor)
 
     ctx.term()
 
@@ -3,11 +3,11 @@ import zmq
 from robonet.util import get_local_ip, client_unicast_communication, client_udp_discovery
 
 
-def run_client(callback):
-    """Main function to run the client."""
+def run_client(callback, transport='udp'):
+    """Main function to run the client. transport='shm' skips the network stack entirely."""
     ctx = zmq.Context()
 
-    client_unicast_communication(ctx, '127.0.0.1', '127.0.0.1', callback)
+    client_unicast_communication(ctx, '127.0.0.1', '127.0.0.1', callback, transport)
 
     ctx.term()
 
@@ -4,11 +4,11 @@ import zmq
 from robonet.util import get_local_ip, server_udp_discovery, server_unicast_communication
 
 
-def run(callback):
-    """Main function to run the server."""
+def run(callback, transport='udp'):
+    """Main function to run the server. transport='shm' skips the network stack entirely."""
     ctx = zmq.Context.instance()
 
-    server_unicast_communication(ctx, '127.0.0.1', '127.0.0.1', callback)
+    server_unicast_communication(ctx, '127.0.0.1', '127.0.0.1', callback, transport)
 
     ctx.term()
 
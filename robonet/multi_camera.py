@@ -0,0 +1,155 @@
+"""Capture from several cameras in one process and share one unicast channel between them."""
+
+import logging
+import threading
+import time
+
+from robonet.buffers.buffer_objects import MJpegCamFrame
+from robonet.buffers.buffer_handling import pack_obj
+from robonet.instrumentation import sampled_logger
+from robonet.util import BurstSender
+
+_log = sampled_logger(__name__)
+
+
+def open_cameras(devices, width=320, height=240):
+    """Open a CameraPack for every V4L2 device path."""
+    from robonet.camera import CameraPack  # only needed with real cameras
+
+    return [CameraPack(device, width, height) for device in devices]
+
+
+class CameraStream:
+    """Latest frame and send statistics for one camera."""
+
+    def __init__(self, camera, stream_id, weight=1):
+        self.camera = camera
+        self.stream_id = stream_id
+        self.weight = weight
+        self.current_weight = 0  # smooth weighted round robin state
+        self.latest = None  # (jpeg, capture_time) waiting to be sent
+        self.frames_captured = 0
+        self.frames_sent = 0
+        self.frames_replaced = 0  # captured, then replaced by a newer frame before it could be sent
+        self.capture_errors = 0
+
+
+class MultiCameraSender:
+    """Drives N cameras from one process, each on its own stream_id.
+
+    Every camera gets a capture thread that only keeps its newest frame. The cameras free-run, so their captures
+    aren't aligned: a frame's capture_time is the shared clock read as its camera hands it over, which puts every
+    camera's frames on one timeline, later than the exposure by however long the camera takes, and up to a frame
+    interval apart from the nearest frame of another camera. The send loop picks cameras with smooth weighted round
+    robin, so a camera with weight 2 gets twice the bandwidth of one with weight 1 when the link is the bottleneck.
+
+    A camera whose get_jpeg() raises is logged, counted in its capture_errors, and retried after retry_interval.
+    """
+
+    def __init__(self, cameras, weights=None, clock=time.monotonic, stamper=None, link_monitor=None,
+                 retry_interval=0.1):
+        weights = weights or [1] * len(cameras)
+        self.streams = [CameraStream(camera, stream_id, weight)
+                        for stream_id, (camera, weight) in enumerate(zip(cameras, weights))]
+        self.clock = clock
+        self.stamper = stamper  # a MetaStamper, to attach latency metadata to every frame
+        self.link_monitor = link_monitor  # a LinkMonitor, to measure the link between frames
+        self.retry_interval = retry_interval
+        self._frame_ready = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def capture_once(self, stream):
+        """Grab one frame from a camera. Blocks for as long as the camera does."""
+        jpg = stream.camera.get_jpeg()
+        capture_time = self.clock()
+        if not jpg:
+            return False
+        with self._frame_ready:
+            if stream.latest is not None:
+                stream.frames_replaced += 1
+            stream.latest = (jpg, capture_time)
+            stream.frames_captured += 1
+            self._frame_ready.notify()
+        return True
+
+    def _capture_loop(self, stream):
+        while not self._stop.is_set():
+            try:
+                self.capture_once(stream)
+            except Exception as e:  # a camera unplugged or misbehaving shouldn't end its stream for good
+                stream.capture_errors += 1
+                _log(logging.ERROR, f'capture {stream.stream_id}', "Camera %d capture failed: %r", stream.stream_id, e)
+                self._stop.wait(self.retry_interval)
+
+    def start(self):
+        for stream in self.streams:
+            thread = threading.Thread(target=self._capture_loop, args=(stream,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        with self._frame_ready:
+            self._frame_ready.notify_all()
+
+    def next_frame(self, timeout=None):
+        """Take the next frame to send, or None if no camera has a new frame within timeout."""
+        with self._frame_ready:
+            ready = [s for s in self.streams if s.latest is not None]
+            if not ready and not self._stop.is_set():
+                self._frame_ready.wait(timeout)
+                ready = [s for s in self.streams if s.latest is not None]
+            if not ready:
+                return None
+
+            total_weight = sum(s.weight for s in ready)
+            for s in ready:
+                s.current_weight += s.weight
+            stream = max(ready, key=lambda s: s.current_weight)
+            stream.current_weight -= total_weight
+
+            jpg, capture_time = stream.latest
+            stream.latest = None
+            stream.frames_sent += 1
+        return MJpegCamFrame(0, 0, jpg, stream.stream_id, capture_time)
+
+    def stats(self):
+        return {s.stream_id: {'captured': s.frames_captured, 'sent': s.frames_sent, 'replaced': s.frames_replaced,
+                              'capture_errors': s.capture_errors}
+                for s in self.streams}
+
+    def run(self, unicast_radio, unicast_dish=None):
+        """Transmit callback loop. Sends every camera's frames over the one radio until stopped."""
+        send = BurstSender(unicast_radio)
+        if self.link_monitor is not None:
+            self.link_monitor.attach(send)
+        self.start()
+        try:
+            while not self._stop.is_set():
+                if self.link_monitor is not None and unicast_dish is not None:
+                    self.link_monitor.poll(unicast_dish)
+                    self.link_monitor.maybe_ping()
+                frame = self.next_frame(timeout=0.1 if self.link_monitor is not None else 1.0)
+                if frame is None:
+                    continue
+                meta = self.stamper.stamp(frame) if self.stamper is not None else None
+                send(pack_obj(frame, meta))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+def route_by_stream(stream_handlers, default=None):
+    """Make an obj handler that passes each object on to the handler registered for its stream_id."""
+    def handle(obj):
+        stream_id = getattr(obj, 'stream_id', 0)
+        handler = stream_handlers.get(stream_id, default)
+        if handler is not None:
+            handler(obj)
+        else:
+            _log(logging.WARNING, f'no handler {stream_id}', "no handler for %s stream %d", obj.__class__.__name__,
+                 stream_id)
+
+    return handle
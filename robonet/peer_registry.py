@@ -0,0 +1,165 @@
+"""Base station side of many robots: discovery, per robot reassembly, and sending to any subset of robots."""
+
+import itertools
+import logging
+import select
+import threading
+import time
+
+from robonet.buffers.buffer_handling import pack_obj
+from robonet.discovery import (CLIENT_PORT, DISCOVERY_GROUP, MULTICAST_ADDR, PING, PING_RESPONSE, SERVER_PORT,
+                               open_udp_socket, pack_udp_group, unpack_udp_group)
+from robonet.instrumentation import sampled_logger
+from robonet.receive_callbacks import make_byte_handler
+from robonet.util import MessageHandler, chunk_message, send_burst
+
+_log = sampled_logger(__name__)
+
+
+class _PeerRadio:
+    """Looks like a RADIO connected to one robot, so send_burst can send through the registry's socket."""
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+
+    def send(self, data, group='direct'):
+        self.sock.sendto(pack_udp_group(group, data), self.addr)
+
+
+class Peer:
+    """One robot, with its own reassembly state and its own handlers."""
+
+    def __init__(self, peer_id, ip, sock, port):
+        self.peer_id = peer_id
+        self.ip = ip
+        self.namespace = f"robot{peer_id}"
+        self.radio = _PeerRadio(sock, (ip, port))
+        self.obj_handlers = {}
+        self.reassembly = None
+        self.first_seen = self.last_seen = time.monotonic()
+        self.messages_received = 0
+        self.bytes_received = 0
+
+
+class PeerRegistry:
+    """Keeps discovering robots in the background and receives from all of them on one socket.
+
+    Robots don't need to change: they discover the base station as usual and send to its unicast port with their
+    RADIO. Datagrams are told apart by sender IP, and the ZMQ group tells discovery from data. Everything runs on one
+    thread with one socket, however many robots there are.
+
+    make_obj_handlers(peer) is called once per new robot and returns that robot's {class name: handler} dict, so
+    every robot gets its own handler instances (its own windows, models, state...) under peer.namespace.
+    """
+
+    def __init__(self, local_ip, make_obj_handlers, port=SERVER_PORT, robot_port=CLIENT_PORT,
+                 group_addr=MULTICAST_ADDR, ping_interval=1.0, on_new_peer=None):
+        self.local_ip = local_ip
+        self.make_obj_handlers = make_obj_handlers
+        self.port = port
+        self.robot_port = robot_port
+        self.group_addr = group_addr
+        self.ping_interval = ping_interval
+        self.on_new_peer = on_new_peer
+
+        self.peers = {}  # ip -> Peer
+        self.unknown_datagrams = 0
+        self._peer_ids = itertools.count()
+        self._send_lock = threading.Lock()
+        self._message_uids = itertools.count()
+        self._stop = threading.Event()
+        self._thread = None
+        self.sock = open_udp_socket(port, group_addr)
+
+    def _register(self, ip):
+        peer = self.peers.get(ip)
+        if peer is None:
+            peer = Peer(next(self._peer_ids), ip, self.sock, self.robot_port)
+            peer.obj_handlers = self.make_obj_handlers(peer)
+            # drops and counts messages that don't unpack, so one robot's lost part can't stop the loop
+            peer.reassembly = MessageHandler(make_byte_handler(peer.obj_handlers))
+            self.peers[ip] = peer
+            _log(logging.INFO, 'registered ' + ip, "Registered %s at %s", peer.namespace, ip)
+            if self.on_new_peer is not None:
+                self.on_new_peer(peer)
+        # answer directly, so a robot that found us through its cache knows we heard it
+        self._send_discovery(f"{PING}: {self.local_ip}", ip)
+        return peer
+
+    def _send_discovery(self, text, addr):
+        try:
+            self.sock.sendto(pack_udp_group(DISCOVERY_GROUP, text.encode('utf-8')), (addr, self.robot_port))
+        except OSError as e:
+            _log(logging.WARNING, 'discovery send', "Discovery send to %s failed: %s", addr, e)
+
+    def handle_datagram(self, datagram, sender_ip):
+        try:
+            group, payload = unpack_udp_group(datagram)
+        except (IndexError, UnicodeDecodeError):
+            self.unknown_datagrams += 1
+            return
+
+        if group == DISCOVERY_GROUP:
+            message = payload.decode('utf-8', errors='replace')
+            if message.startswith(PING_RESPONSE):
+                self._register(message.split(":")[-1].strip())
+            return
+
+        peer = self.peers.get(sender_ip)
+        if peer is None:
+            self.unknown_datagrams += 1
+            return
+        peer.last_seen = time.monotonic()
+        peer.messages_received += 1
+        peer.bytes_received += len(payload)
+        peer.reassembly.transition(payload)
+
+    def poll(self, timeout):
+        """Handle every datagram that arrives within timeout."""
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        if not readable:
+            return
+        while True:
+            try:
+                datagram, (sender_ip, _) = self.sock.recvfrom(65535)
+            except BlockingIOError:
+                return
+            self.handle_datagram(datagram, sender_ip)
+
+    def run(self):
+        """Discovery and receive loop."""
+        next_ping = time.monotonic()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now >= next_ping:
+                self._send_discovery(f"{PING}: {self.local_ip}", self.group_addr)
+                next_ping = now + self.ping_interval
+            self.poll(min(max(next_ping - time.monotonic(), 0), 0.1))  # wake up now and then to check _stop
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sock.close()
+
+    def select_peers(self, peer_ids=None):
+        """Peers with the given ids, or all of them."""
+        peers = list(self.peers.values())
+        if peer_ids is None:
+            return peers
+        return [p for p in peers if p.peer_id in peer_ids]
+
+    def send(self, message, peer_ids=None):
+        """Send packed bytes to some or all robots."""
+        uid = bytes([next(self._message_uids) % 256])
+        parts = chunk_message(message)
+        for peer in self.select_peers(peer_ids):
+            send_burst(self._send_lock, peer.radio, uid, parts)
+
+    def send_obj(self, obj, peer_ids=None):
+        self.send(pack_obj(obj), peer_ids)
@@ -1,23 +1,35 @@
+import logging
+import struct
 import time
 
 import cv2
 import numpy as np
 import zmq
 
-from robonet import camera
-from robonet.buffers.buffer_handling import unpack_obj
-from robonet.buffers.buffer_objects import AudioBuffer
+from robonet import instrumentation
+from robonet.buffers.buffer_handling import unpack_obj, unpack_obj_with_meta
+from robonet.handler_queues import QueuedHandlers
+from robonet.util import BufferedMessageHandler, BurstSender, MessageHandler
+from robonet.buffers.buffer_objects import AudioBuffer, MJpegCamFrame
 
-from displayarray import display
 import asyncio
 
+_log = instrumentation.sampled_logger(__name__)
+_unpack_stage = instrumentation.stage('unpack')
+_received_messages = instrumentation.counter('receive.messages')
+_received_bytes = instrumentation.counter('receive.bytes')
+_corrupt_messages = instrumentation.counter('receive.corrupt')
+_unknown_messages = instrumentation.counter('receive.unknown')
+
 def display_mjpg_cv(displayer):
+    from robonet import camera  # needs PyV4L2Cam, so only when displaying
+
     def display_mjpeg(unicast_radio, unicast_dish):
         while True:
             try:
                 direct_message = f"Direct message from server"
                 unicast_radio.send(direct_message.encode("utf-8"), group="direct")
-                print(f"Sent: {direct_message}")
+                _log(logging.DEBUG, 'sent', "Sent: %s", direct_message)
 
                 try:
                     msg = unicast_dish.recv(copy=False)
@@ -35,15 +47,26 @@ def display_mjpg_cv(displayer):
                         if img is not None and img.size > 0:
                             displayer.update(img, 'Camera Stream')
                     except cv2.error as e:
-                        print(f"OpenCV error: {e}")
+                        _log(logging.WARNING, 'opencv', "OpenCV error: %s", e)
                 except zmq.Again:
-                    print("No direct message yet")
+                    _log(logging.DEBUG, 'waiting', "No direct message yet")
                     time.sleep(1.0 / 120)
             except KeyboardInterrupt:
                 break
 
     return display_mjpeg
 
+def display_mjpg_streams(displayer):
+    """MJpegCamFrame handler that shows each camera stream in its own window."""
+    from robonet import camera
+
+    def display_frame(obj: MJpegCamFrame):
+        img = camera.CameraPack.to_cv2_image(obj.mjpeg)
+        if img is not None and img.size > 0:
+            displayer.update(img, f'Camera {obj.stream_id}')
+
+    return display_frame
+
 def create_pyramid(x, min_size=1):
     pyramid = [x]
     current = x
@@ -84,97 +107,92 @@ def display_fftnet(displayer):
 
     return fft_to_nnet
 
-class MessageHandler:
-    def __init__(self, handle_byte_obj):
-        self.state = self.wait_for_start  # Set initial state as the wait_for_start function
-        self.message_uid = None
-        self.message_parts = []
-        self.handle_byte_obj = handle_byte_obj
-
-    def reset(self):
-        """Reset the state machine to the initial state."""
-        self.state = self.wait_for_start
-        self.message_uid = None
-        self.message_parts = []
-
-    def transition(self, msg):
-        """Call the current state's handler."""
-        self.state(msg)
-
-    def wait_for_start(self, msg):
-        """Handles the initial state waiting for the start part."""
-        part_type = msg[0:1]
-        uid_byte = msg[1:2]
-        payload = msg[2:]
-
-        if part_type == b'\x01':  # Start part
-            self.message_uid = uid_byte
-            self.message_parts = [payload]
-            self.state = self.receive_parts  # Transition to RECEIVE_PARTS state
-            return True  # block
-        elif part_type == b'\x04':  # Tiny message
-            self.handle_byte_obj(msg[2:])
-            self.reset()
-            return False  # non-block
-        else:
-            print("Start byte corrupted or missing. Dropping message.")
-            self.reset()
-            return False  # non-block
-
-    def receive_parts(self, msg):
-        """Handles receiving parts of a message."""
-        part_type = msg[0:1]
-        uid_byte = msg[1:2]
-        payload = msg[2:]
-
-        if uid_byte == self.message_uid:
-            if part_type == b'\x02':  # Middle part
-                self.message_parts.append(payload)
-                return True  # block
-            elif part_type == b'\x03':  # End part
-                self.message_parts.append(payload)
-                full_message = b''.join(self.message_parts)
-                self.handle_byte_obj(full_message)
-                self.reset()
-                return False  # non-block
-            elif part_type == b'\x01':  # New message, part missed
-                print('New multi-part message received in the middle of another. Handling what we have.')
-                full_message = b''.join(self.message_parts)
-                self.handle_byte_obj(full_message)
-                self.message_uid = uid_byte
-                self.message_parts = [payload]
-                return True  # block
-            elif part_type == b'\x04':  # Tiny message (end missed)
-                print('New single-part message received in the middle of another. Handling what we have.')
-                full_message = b''.join(self.message_parts)
-                self.handle_byte_obj(full_message)
-                self.handle_byte_obj(msg[1:])
-                self.reset()
-                return False  # non-block
-        else:
-            print('Messages corrupted or interleaved. Handling what we have.')
-            self.handle_message_corruption()
-
-    def handle_message_corruption(self):
-        """Handles corrupted messages."""
-        full_message = b''.join(self.message_parts)
-        self.handle_byte_obj(full_message)
-        self.reset()
-        return False  # non-block
+def make_byte_handler(obj_handlers, latency_monitor=None, message_sinks=()):
+    """Handler for whole packed messages, that unpacks them and passes them on to obj_handlers by class name.
 
-
-def receive_objs(obj_handlers):
+    Every message_sink (a Recorder, say) is also called with the packed message, once it has unpacked, so sinks only
+    ever see messages that made it through intact.
+    """
     def handle_byte_obj(msg):
-        obj = unpack_obj(msg)
-        if obj.__class__.__name__ in obj_handlers:
-            obj_handlers[obj.__class__.__name__](obj)
+        _received_messages.add()
+        _received_bytes.add(len(msg))
+        start = _unpack_stage.begin()
+        try:
+            obj, meta = unpack_obj_with_meta(msg)
+        except (ValueError, TypeError, struct.error, IndexError, UnicodeDecodeError) as e:
+            _corrupt_messages.add()
+            _log(logging.WARNING, 'corrupt', "Dropping corrupted message (%s)", e)  # parts lost or mixed up in transit
+            return
+        _unpack_stage.end(start)
+        for sink in message_sinks:
+            sink(msg)
+        name = obj.__class__.__name__
+        if meta is not None and latency_monitor is not None:
+            latency_monitor.record(name, meta)
+        if name in obj_handlers:
+            if instrumentation.registry.enabled:
+                handler_stage = instrumentation.stage('handler.' + name)
+                start = handler_stage.begin()
+                obj_handlers[name](obj)
+                handler_stage.end(start)
+            else:
+                obj_handlers[name](obj)
         else:
-            print(f"unknown obj {obj.__class__.__name__}")
+            _unknown_messages.add()
+            _log(logging.WARNING, 'unknown ' + name, "unknown obj %s", name)
+
+    return handle_byte_obj
+
+
+def receive_objs(obj_handlers, latency_monitor=None, link_monitor=None, stop=None, message_sinks=(),
+                 queue_handlers=False):
+    """Receive loop that unpacks objects and passes them on to obj_handlers by class name.
+
+    If a LatencyMonitor is given, messages that carry MessageMeta get their latency and loss recorded.
+    If a LinkMonitor is given, it pings the other end through the radio and answers its pings.
+    If a threading.Event is given as stop, the loop returns once it's set.
+    message_sinks get every reassembled message that unpacks, still packed, e.g. a recording.Recorder.
+    With queue_handlers, every handler runs on its own worker thread behind a queue of 8, dropping the oldest object
+    when it falls behind. For other sizes and policies, or to read the queues' stats, pass a
+    handler_queues.QueuedHandlers as obj_handlers instead.
+    """
+    own_queues = None
+    if queue_handlers and not isinstance(obj_handlers, QueuedHandlers):
+        obj_handlers = own_queues = QueuedHandlers(obj_handlers)
+    if link_monitor is not None:
+        obj_handlers = dict(obj_handlers, **link_monitor.obj_handlers())  # pongs are answered right away
+    handle_byte_obj = make_byte_handler(obj_handlers, latency_monitor, message_sinks)
+
+    async def drain_objs(unicast_radio, unicast_dish):
+        """For dishes with drain(), like udp_transport.UdpDish: every waiting part at once, without copying them.
+
+        While nothing is waiting, the event loop watches the dish's socket, so other coroutines keep running.
+        """
+        handler = BufferedMessageHandler(handle_byte_obj)
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        fileno = unicast_dish.fileno()
+        loop.add_reader(fileno, readable.set)
+        try:
+            while stop is None or not stop.is_set():
+                if link_monitor is not None:
+                    link_monitor.maybe_ping()
+                readable.clear()
+                if unicast_dish.drain(handler.feed):
+                    await asyncio.sleep(0)
+                    continue
+                try:
+                    await asyncio.wait_for(readable.wait(), 0.01)  # back every 10ms at most, for pings and stop
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            loop.remove_reader(fileno)
 
-    async def receive_some_obj(unicast_radio, unicast_dish):
+    async def recv_objs(unicast_radio, unicast_dish):
         handler = MessageHandler(handle_byte_obj)
-
-        while True:
+        while stop is None or not stop.is_set():
+            if link_monitor is not None:
+                link_monitor.maybe_ping()
             message_parts = []
             try:
                 msg = unicast_dish.recv(copy=False)
@@ -188,5 +206,17 @@ def receive_objs(obj_handlers):
                 #print("No direct message yet")
                 await asyncio.sleep(0) # thread switch
 
+    async def receive_some_obj(unicast_radio, unicast_dish):
+        if link_monitor is not None:
+            link_monitor.attach(BurstSender(unicast_radio))
+        try:
+            if hasattr(unicast_dish, 'drain') and hasattr(unicast_dish, 'fileno'):
+                await drain_objs(unicast_radio, unicast_dish)
+            else:
+                await recv_objs(unicast_radio, unicast_dish)
+        finally:
+            if own_queues is not None:
+                own_queues.close()
+
     return receive_some_obj
 
@@ -0,0 +1,342 @@
+"""Records packed messages to segmented, memory-mapped logs, with a timestamp index per segment.
+
+A recording is a directory of segments. NNNNNN.log holds messages back to back, exactly as pack_obj made them, and
+NNNNNN.idx is an array of INDEX_DTYPE records, one per message, in the order they were recorded. streams.json maps
+stream names ("ClassName/stream_id") to the stream numbers used in the index.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from robonet import instrumentation
+from robonet.buffers.buffer_handling import unpack_header
+
+INDEX_DTYPE = np.dtype([('stream', '<u4'), ('length', '<u4'), ('timestamp', '<f8'), ('offset', '<u8')])
+STREAMS_FILE = 'streams.json'
+UNKNOWN_STREAM = 'unknown'  # messages whose header doesn't decode
+
+_log = instrumentation.sampled_logger(__name__)
+
+
+def segment_paths(directory, number):
+    return os.path.join(directory, f"{number:06d}.log"), os.path.join(directory, f"{number:06d}.idx")
+
+
+def stream_name(message):
+    """'ClassName/stream_id' for a packed message, from its header alone. UNKNOWN_STREAM if that doesn't decode."""
+    try:
+        class_name, meta, _ = unpack_header(message)
+    except (ValueError, TypeError, struct.error):
+        return UNKNOWN_STREAM
+    return f"{class_name}/{meta.stream_id if meta is not None else 0}"
+
+
+class _SegmentWriter:
+    """One segment being written: a preallocated, mmap'd log file and an append-only index file."""
+
+    def __init__(self, directory, number, size):
+        self.number = number
+        log_path, idx_path = segment_paths(directory, number)
+        self.log_file = open(log_path, 'w+b')
+        self.log_file.truncate(size)
+        self.log = mmap.mmap(self.log_file.fileno(), size)
+        self.idx_file = open(idx_path, 'ab', buffering=0)  # one write per batch, visible to readers right away
+        self.size = size
+        self.used = 0
+
+    def fits(self, length):
+        return self.used + length <= self.size
+
+    def write(self, batch):
+        """Copy a batch of (stream, timestamp, message) into the log and index them in one index write."""
+        index = np.empty(len(batch), INDEX_DTYPE)
+        for i, (stream, timestamp, message) in enumerate(batch):
+            length = len(message)
+            self.log[self.used:self.used + length] = message
+            index[i] = (stream, length, timestamp, self.used)
+            self.used += length
+        self.idx_file.write(index.tobytes())  # after the data, so a reader never indexes past what's written
+
+    def sync(self):
+        self.log.flush()
+        os.fsync(self.idx_file.fileno())
+
+    def close(self):
+        self.sync()
+        self.log.close()
+        self.log_file.truncate(self.used)
+        self.log_file.close()
+        self.idx_file.close()
+
+
+class Recorder:
+    """Message sink that records to a directory, without ever blocking whoever calls record().
+
+    record() only queues the message. A writer thread takes everything queued at once, copies it into the current
+    segment's mmap and appends the index entries in a single write. fsync is 'always' (after every batch),
+    'interval' (every fsync_interval seconds) or 'never' (left to the OS, and to close()). If the writer falls more
+    than max_pending_bytes behind, new messages are dropped and counted rather than queued without bound.
+    Messages whose header doesn't decode are recorded under UNKNOWN_STREAM.
+
+    If writing fails (the disk filled up, say), the writer stops, error holds the exception, and from then on
+    messages are dropped and counted. close() raises it.
+
+    Timestamps are the index find() searches, so they never go backwards, within a recording or after an earlier
+    one in the same directory. When clock steps back (NTP fixing a Pi without an RTC, say), timestamps carry on
+    from the last one at clock's pace. A timestamp passed to record() that's older than the last is recorded as
+    the last. Either way it's counted in clamped.
+    """
+
+    def __init__(self, directory, segment_size=256 * 1024 * 1024, fsync='interval', fsync_interval=1.0,
+                 max_pending_bytes=256 * 1024 * 1024, clock=time.time):
+        if fsync not in ('always', 'interval', 'never'):
+            raise ValueError(f"fsync should be 'always', 'interval' or 'never', not {fsync}")
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_pending_bytes = max_pending_bytes
+        self.clock = clock
+        os.makedirs(directory, exist_ok=True)
+
+        self.streams = load_streams(directory)
+        self.recorded = 0
+        self.dropped = 0
+        self.clamped = 0
+        self.bytes_recorded = 0
+        self.error = None
+        self._pending = deque()
+        self._pending_bytes = 0
+        self._wake = threading.Condition()
+        self._closed = False
+        self._segment = None
+        existing = list_segments(directory)
+        self._next_segment = existing[-1] + 1 if existing else 0  # carry on after an earlier recording
+        self._last_timestamp = last_timestamp(directory, existing)
+        self._clock_offset = 0.0  # added to clock(), for the steps back it has taken
+        self._last_sync = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, message, stream=None, timestamp=None):
+        """Queue a packed message. stream defaults to the message's own 'ClassName/stream_id'."""
+        if stream is None:
+            stream = stream_name(message)
+        with self._wake:  # stamped and queued in one go, so the queue is in timestamp order
+            if self.error is not None or self._pending_bytes + len(message) > self.max_pending_bytes:
+                self.dropped += 1
+                return
+            if timestamp is None:
+                timestamp = self.clock() + self._clock_offset
+                if timestamp < self._last_timestamp:
+                    self._clock_offset += self._last_timestamp - timestamp
+            if timestamp < self._last_timestamp:
+                timestamp = self._last_timestamp
+                self.clamped += 1
+            self._last_timestamp = timestamp
+            self._pending.append((stream, timestamp, message))
+            self._pending_bytes += len(message)
+            self._wake.notify()
+
+    __call__ = record
+
+    def _stream_number(self, name):
+        number = self.streams.get(name)
+        if number is None:
+            number = self.streams[name] = len(self.streams)
+            tmp_path = os.path.join(self.directory, STREAMS_FILE + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(self.streams, f, indent=2)
+            os.replace(tmp_path, os.path.join(self.directory, STREAMS_FILE))
+        return number
+
+    def _take_batch(self):
+        with self._wake:
+            while not self._pending and not self._closed:
+                self._wake.wait(self.fsync_interval if self.fsync == 'interval' else None)
+                if self.fsync == 'interval':
+                    break
+            batch = list(self._pending)
+            self._pending.clear()
+            self._pending_bytes = 0
+            return batch
+
+    def _new_segment(self, min_size):
+        if self._segment is not None:
+            self._segment.close()
+        self._segment = _SegmentWriter(self.directory, self._next_segment, max(self.segment_size, min_size))
+        self._next_segment += 1
+
+    def _write(self, batch):
+        run, run_bytes = [], 0  # messages going into the current segment
+        for stream, timestamp, message in batch:
+            if self._segment is None or not self._segment.fits(run_bytes + len(message)):
+                if run:
+                    self._segment.write(run)
+                    run, run_bytes = [], 0
+                if self._segment is None or not self._segment.fits(len(message)):
+                    self._new_segment(len(message))
+            run.append((self._stream_number(stream), timestamp, message))
+            run_bytes += len(message)
+        if run:
+            self._segment.write(run)
+        self.recorded += len(batch)
+        self.bytes_recorded += sum(len(message) for _, _, message in batch)
+
+    def _run(self):
+        try:
+            self._write_until_closed()
+        except Exception as e:  # keep record() from queueing for a writer that's gone
+            with self._wake:
+                self.error = e
+                self.dropped += len(self._pending)
+                self._pending.clear()
+                self._pending_bytes = 0
+            _log(logging.ERROR, 'write', "Recording to %s failed, dropping messages from now on: %r",
+                 self.directory, e)
+
+    def _write_until_closed(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+            now = time.monotonic()
+            if self._segment is not None and (
+                    self.fsync == 'always' and batch
+                    or self.fsync == 'interval' and now - self._last_sync >= self.fsync_interval):
+                self._segment.sync()
+                self._last_sync = now
+            if self._closed and not self._pending:
+                return
+
+    def close(self):
+        """Write everything queued, sync and close the segment."""
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+        self._thread.join()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+        if self.error is not None:
+            raise RuntimeError(f"Recording to {self.directory} failed") from self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_streams(directory):
+    path = os.path.join(directory, STREAMS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def list_segments(directory):
+    """Segment numbers in the directory, in order."""
+    return sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith('.idx'))
+
+
+def last_timestamp(directory, numbers):
+    """Timestamp of the last message in the last of the segments numbers that has any, or -inf."""
+    for number in reversed(numbers):
+        idx_path = segment_paths(directory, number)[1]
+        count = os.path.getsize(idx_path) // INDEX_DTYPE.itemsize
+        if count:
+            last = np.fromfile(idx_path, INDEX_DTYPE, 1, offset=(count - 1) * INDEX_DTYPE.itemsize)
+            return float(last['timestamp'][0])
+    return float('-inf')
+
+
+class Segment:
+    """A recorded segment, mapped read-only. Its index is re-read by refresh() while it's still being written."""
+
+    def __init__(self, directory, number):
+        self.number = number
+        self.log_path, self.idx_path = segment_paths(directory, number)
+        self.log = None
+        self.index = np.empty(0, INDEX_DTYPE)
+        self.refresh()
+
+    def refresh(self):
+        count = os.path.getsize(self.idx_path) // INDEX_DTYPE.itemsize
+        if count > len(self.index):
+            self.index = np.fromfile(self.idx_path, INDEX_DTYPE, count)
+            if self.log is None:  # a live segment's log is preallocated, so one mapping covers everything indexed
+                with open(self.log_path, 'rb') as f:
+                    self.log = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def start_time(self):
+        return float(self.index['timestamp'][0]) if len(self.index) else float('inf')
+
+    @property
+    def end_time(self):
+        return float(self.index['timestamp'][-1]) if len(self.index) else float('-inf')
+
+    def find(self, timestamp):
+        """Position of the first message recorded at or after timestamp."""
+        return int(np.searchsorted(self.index['timestamp'], timestamp, side='left'))
+
+    def message(self, i):
+        """Message i as a zero-copy memoryview into the mapped log. unpack_obj wants bytes(), which copies."""
+        entry = self.index[i]
+        offset = int(entry['offset'])
+        return memoryview(self.log)[offset:offset + int(entry['length'])]
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+
+
+class Recording:
+    """Reads a recording directory. Finding a timestamp is a binary search over segments, then within one."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = []
+        self.streams = {}
+        self.refresh()
+
+    def refresh(self):
+        """Pick up new segments, messages and streams if the recording is still being written."""
+        self.streams = load_streams(self.directory)
+        known = {segment.number for segment in self.segments}
+        for segment in self.segments[-1:]:
+            segment.refresh()
+        for number in list_segments(self.directory):
+            if number not in known:
+                self.segments.append(Segment(self.directory, number))
+
+    def stream_numbers(self, names):
+        """Index stream numbers for stream names, skipping names that were never recorded."""
+        return [self.streams[name] for name in names if name in self.streams]
+
+    def find(self, timestamp):
+        """(segment position, message position) of the first message at or after timestamp."""
+        starts = np.array([segment.start_time for segment in self.segments])
+        i = max(int(np.searchsorted(starts, timestamp, side='right')) - 1, 0)
+        while i < len(self.segments) and self.segments[i].end_time < timestamp:
+            i += 1
+        if i == len(self.segments):
+            return i, 0
+        return i, self.segments[i].find(timestamp)
+
+    def __len__(self):
+        return sum(len(segment.index) for segment in self.segments)
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
@@ -0,0 +1,142 @@
+"""Plays recordings back into receive handlers or out through a transport, at recorded pace, N times it, or flat out.
+
+    python -m robonet.replay recordings/field_test --speed 0            # decode everything as fast as possible
+    python -m robonet.replay recordings/field_test --to 192.168.2.1 --transport udp --streams MJpegCamFrame/0
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from robonet.receive_callbacks import make_byte_handler
+from robonet.recording import Recording
+from robonet.util import BurstSender
+
+
+class Replayer:
+    """Reads a Recording through its mmaps and hands each message, as bytes, to a sink.
+
+    speed 1.0 keeps the recorded timing, 2.0 plays twice as fast, and 0 doesn't wait at all. streams limits playback
+    to some stream names, and seek() starts it from a timestamp.
+    """
+
+    def __init__(self, recording, speed=1.0, streams=None, clock=time.monotonic, sleep=time.sleep):
+        self.recording = recording if isinstance(recording, Recording) else Recording(recording)
+        self.speed = speed
+        self.clock = clock
+        self.sleep = sleep
+        self.wanted = None if streams is None else np.array(self.recording.stream_numbers(streams), dtype=np.uint32)
+        self.position = (0, 0)  # (segment, message)
+        self.played = 0
+        self.bytes_played = 0
+        self.behind = 0.0  # worst lag behind the schedule, in seconds, when the sink can't keep up
+
+    def seek(self, timestamp):
+        self.position = self.recording.find(timestamp)
+
+    def messages(self, end=None):
+        """(stream number, timestamp, memoryview) from the current position, up to timestamp end."""
+        segment_i, message_i = self.position
+        for segment in self.recording.segments[segment_i:]:
+            index = segment.index
+            positions = np.arange(message_i, len(index))
+            if self.wanted is not None:
+                positions = positions[np.isin(index['stream'][message_i:], self.wanted)]
+            if end is not None:
+                positions = positions[index['timestamp'][positions] < end]
+            for i in positions:
+                self.position = (segment_i, int(i) + 1)
+                yield int(index['stream'][i]), float(index['timestamp'][i]), segment.message(i)
+            segment_i, message_i = segment_i + 1, 0
+            self.position = (segment_i, 0)
+
+    def play(self, sink, end=None):
+        """Send everything from the current position up to timestamp end to sink(message). Returns how many."""
+        played = 0
+        start_wall = start_time = None
+        for _, timestamp, view in self.messages(end):
+            if self.speed:
+                if start_wall is None:
+                    start_wall, start_time = self.clock(), timestamp
+                wait = start_wall + (timestamp - start_time) / self.speed - self.clock()
+                if wait > 0:
+                    self.sleep(wait)
+                else:
+                    self.behind = max(self.behind, -wait)
+            message = bytes(view)
+            sink(message)
+            played += 1
+            self.bytes_played += len(message)
+        self.played += played
+        return played
+
+
+def handler_sink(obj_handlers, latency_monitor=None):
+    """Sink that unpacks into obj_handlers, exactly as receive_objs would."""
+    return make_byte_handler(obj_handlers, latency_monitor)
+
+
+def radio_sink(radio):
+    """Sink that sends through a radio from transport.open_pair, fragmented as any sender would."""
+    return BurstSender(radio)
+
+
+class _CountEverything(dict):
+    """obj_handlers that accepts every class and just counts it."""
+
+    def __init__(self):
+        super().__init__()
+        self.counts = {}
+
+    def __contains__(self, name):
+        return True
+
+    def __missing__(self, name):
+        def count(obj):
+            self.counts[name] = self.counts.get(name, 0) + 1
+        return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--speed', type=float, default=1.0, help="1 is recorded pace, 0 is as fast as possible")
+    parser.add_argument('--streams', nargs='*', help="stream names like MJpegCamFrame/0, all of them by default")
+    parser.add_argument('--start', type=float, help="timestamp to seek to")
+    parser.add_argument('--end', type=float, help="timestamp to stop at")
+    parser.add_argument('--to', help="send to this IP instead of decoding locally")
+    parser.add_argument('--transport', default='udp')
+    args = parser.parse_args(argv)
+
+    replayer = Replayer(args.directory, args.speed, args.streams)
+    if args.start is not None:
+        replayer.seek(args.start)
+
+    if args.to:
+        import zmq
+        from robonet.transport import open_pair
+        from robonet.util import get_local_ip
+        ctx = zmq.Context()
+        radio, dish = open_pair(ctx, args.transport, 'client', get_local_ip(), args.to)
+        sink = radio_sink(radio)
+    else:
+        handlers = _CountEverything()
+        sink = handler_sink(handlers)
+
+    start = time.monotonic()
+    played = replayer.play(sink, args.end)
+    seconds = time.monotonic() - start
+    print(f"Replayed {played} messages, {replayer.bytes_played / 1e6:.1f} MB in {seconds:.2f}s: "
+          f"{played / max(seconds, 1e-9):.0f} msg/s, {replayer.bytes_played / 1e6 / max(seconds, 1e-9):.1f} MB/s, "
+          f"at most {replayer.behind * 1000:.1f}ms behind")
+    if args.to:
+        radio.close()
+        dish.close()
+        ctx.term()
+    else:
+        print(handlers.counts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Keeps a unicast session alive across link loss, without restarting either process."""
+
+import logging
+import threading
+import time
+
+import zmq
+
+from robonet.discovery import Backoff, DiscoveryClient, DiscoveryServer, PeerCache
+from robonet.instrumentation import sampled_logger
+from robonet.util import BurstSender
+
+_log = sampled_logger(__name__)
+
+
+class SwappableSocket:
+    """Stands in for a zmq socket that the SessionSupervisor can replace under a running callback loop.
+
+    zmq sockets belong to one thread, so the replacement is only queued here, and the old socket gets closed and the
+    new one opened on the next send or recv. Every send and recv holds lock, so the SessionSupervisor can use the
+    socket from its own thread too, and BurstSenders on it send whole bursts under it.
+    """
+
+    def __init__(self, make_socket, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.RLock()
+        self._sock = make_socket()
+        self._pending = None
+        self._rcvtimeo = None
+        self.last_recv = None  # clock() of the last successful recv
+        self.receiving = False  # whether the callback loop has called recv
+
+    def replace(self, make_socket):
+        """Queue a new socket. Safe to call from any thread."""
+        self._pending = make_socket
+
+    def _current(self):
+        """The socket to use, after any queued replacement. Call with the lock held."""
+        make_socket, self._pending = self._pending, None
+        if make_socket is not None:
+            self._sock.close(linger=0)
+            self._sock = make_socket()
+            if self._rcvtimeo is not None:
+                self._sock.rcvtimeo = self._rcvtimeo
+        return self._sock
+
+    def send(self, *args, **kwargs):
+        with self.lock:
+            return self._current().send(*args, **kwargs)
+
+    def recv(self, *args, **kwargs):
+        with self.lock:
+            self.receiving = True
+            msg = self._current().recv(*args, **kwargs)
+        self.last_recv = self.clock()
+        return msg
+
+    @property
+    def rcvtimeo(self):
+        return self._sock.rcvtimeo
+
+    @rcvtimeo.setter
+    def rcvtimeo(self, value):
+        self._rcvtimeo = value
+        self._sock.rcvtimeo = value
+
+    def close(self, linger=None):
+        with self.lock:
+            self._sock.close(linger=linger)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+def unicast_socket_factories(ctx, local_ip, local_port, peer_port):
+    """Makes (radio, dish) socket makers for a peer IP, set up like util.server/client_unicast_communication."""
+    def factories(peer_ip):
+        def make_radio():
+            radio = ctx.socket(zmq.RADIO)
+            radio.setsockopt(zmq.LINGER, 0)
+            radio.setsockopt(zmq.CONFLATE, 1)
+            radio.connect(f"udp://{peer_ip}:{peer_port}")
+            return radio
+
+        def make_dish():
+            dish = ctx.socket(zmq.DISH)
+            dish.setsockopt(zmq.LINGER, 0)
+            dish.setsockopt(zmq.CONFLATE, 1)
+            dish.rcvtimeo = 1000
+            dish.bind(f"udp://{local_ip}:{local_port}")
+            dish.join("direct")
+            return dish
+
+        return make_radio, make_dish
+
+    return factories
+
+
+class SessionSupervisor:
+    """Runs a callback loop on sockets that get re-pointed at the peer whenever the peer goes silent and comes back.
+
+    Silence is no successful recv on the dish (and no probe through the link_monitor, if there is one) for
+    silence_timeout seconds. Discovery then re-runs on a background thread with a short backoff cap, and once the
+    peer answers the sockets are swapped under the still running callback loop, so streams keep their state.
+
+    Loops that only transmit never recv, so for them the supervisor pings the peer and answers its pings with the
+    link_monitor itself, every check_interval, until the loop first calls recv. That needs a LinkMonitor on the
+    other end too. Until the peer has been heard from at all there's nothing to tell silence by, so a session that
+    can't hear its peer (a transmit-only loop without a link_monitor, say) keeps sending and is never rediscovered.
+    """
+
+    def __init__(self, socket_factories, peer_ip, discover, silence_timeout=2.0, check_interval=0.1,
+                 link_monitor=None, clock=time.monotonic):
+        self.socket_factories = socket_factories
+        self.peer_ip = peer_ip
+        self.discover = discover
+        self.silence_timeout = silence_timeout
+        self.check_interval = check_interval
+        self.link_monitor = link_monitor
+        self.clock = clock
+
+        make_radio, make_dish = socket_factories(peer_ip)
+        self.radio = SwappableSocket(make_radio, clock)
+        self.dish = SwappableSocket(make_dish, clock)
+        self.recoveries = 0
+        self.last_recovery_time = None  # seconds from noticing the silence to sockets being re-pointed
+        self.silent_since = None
+        self._stop = threading.Event()
+        self._session_start = clock()
+
+    def last_heard(self):
+        """When the peer was last heard from, counting the latest re-pointing as hearing it. None if never."""
+        heard = [self.dish.last_recv]
+        if self.link_monitor is not None:
+            heard.append(self.link_monitor.last_heard)
+        heard = [t for t in heard if t is not None]
+        return max(heard + [self._session_start]) if heard else None
+
+    def poll_link(self):
+        """Ping the peer and answer its pings, while the callback loop doesn't recv on the dish itself."""
+        if self.link_monitor is None or self.dish.receiving:
+            return
+        with self.dish.lock:
+            if not self.dish.receiving:
+                self.link_monitor.poll(self.dish._current())
+        self.link_monitor.maybe_ping()
+
+    def check(self):
+        """Recover if the peer has been silent too long. Returns True if it recovered."""
+        last_heard = self.last_heard()
+        if last_heard is None or self.clock() - last_heard < self.silence_timeout:
+            self.silent_since = None
+            return False
+
+        if self.silent_since is None:
+            self.silent_since = self.clock()
+            _log(logging.WARNING, 'silent', "Peer %s silent for %.1fs, rediscovering", self.peer_ip,
+                 self.clock() - last_heard)
+        try:
+            peer_ip = self.discover()
+        except OSError as e:
+            _log(logging.WARNING, 'rediscovery', "Rediscovery failed: %s", e)
+            return False
+        if peer_ip is None:
+            return False
+
+        make_radio, make_dish = self.socket_factories(peer_ip)
+        self.radio.replace(make_radio)
+        self.dish.replace(make_dish)
+        self.peer_ip = peer_ip
+        self.recoveries += 1
+        self.last_recovery_time = self.clock() - self.silent_since
+        self._session_start = self.clock()  # give the new sockets a full silence_timeout
+        self.silent_since = None
+        _log(logging.INFO, 'reconnected', "Reconnected to %s after %.2fs", peer_ip, self.last_recovery_time)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            self.poll_link()
+            self.check()
+
+    def run(self, callback_loop):
+        """Run callback_loop(radio, dish) with supervision until it returns."""
+        if self.link_monitor is not None and self.link_monitor.send is None:
+            self.link_monitor.attach(BurstSender(self.radio))  # shares the radio's lock with the loop's senders
+        watchdog = threading.Thread(target=self._watch, daemon=True)
+        watchdog.start()
+        try:
+            callback_loop(self.radio, self.dish)
+        finally:
+            self._stop.set()
+            watchdog.join()
+            self.dish.close(linger=0)
+            self.radio.close(linger=0)
+
+
+def supervised_server_communication(ctx, local_ip, client_ip, callback_loop, **kwargs):
+    """server_unicast_communication, but it finds the client again if it drops out of range.
+
+    Give it a link_monitor (and the client one too) if callback_loop only transmits, or silence can't be noticed.
+    """
+    discovery = DiscoveryServer(local_ip, cache=PeerCache(), backoff=Backoff(max_interval=0.2), bind_addr=local_ip)
+    discovery.cache.set('client', client_ip)
+    supervisor = SessionSupervisor(unicast_socket_factories(ctx, local_ip, 9998, 9999), client_ip,
+                                   lambda: discovery.discover(timeout=1.0), **kwargs)
+    print(f"Starting supervised unicast communication with client at {client_ip}...")
+    supervisor.run(callback_loop)
+
+
+def supervised_client_communication(ctx, local_ip, server_ip, callback_loop, **kwargs):
+    """client_unicast_communication, but it finds the server again if it drops out of range.
+
+    Give it a link_monitor (and the server one too) if callback_loop only transmits, or silence can't be noticed.
+    """
+    discovery = DiscoveryClient(local_ip, cache=PeerCache(), backoff=Backoff(max_interval=0.2), bind_addr=local_ip)
+    discovery.cache.set('server', server_ip)
+    supervisor = SessionSupervisor(unicast_socket_factories(ctx, local_ip, 9999, 9998), server_ip,
+                                   lambda: discovery.discover(timeout=1.0), **kwargs)
+    print(f"Starting supervised unicast communication with server at {server_ip}...")
+    supervisor.run(callback_loop)
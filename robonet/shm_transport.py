@@ -0,0 +1,231 @@
+"""Shared memory ring buffers standing in for the RADIO/DISH pair when both ends are on the same machine."""
+
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import zmq
+
+WRITING = np.uint64(0xFFFFFFFFFFFFFFFF)  # slot seq while the producer is mid-write
+_ALIGN = 64
+_created_here = set()  # rings this process created, which the resource tracker should keep tracking
+
+
+def _layout(slot_count, slot_size):
+    """Byte offsets of (slot seqs, slot lengths, slot data) and the total size of a ring."""
+    seqs = 3 * 8  # write_seq, slot_count, slot_size
+    lengths = seqs + 8 * slot_count
+    data = -(-(lengths + 8 * slot_count) // _ALIGN) * _ALIGN
+    return seqs, lengths, data, data + slot_count * slot_size
+
+
+class ShmRing:
+    """A single producer, many consumer ring of fixed size slots in a multiprocessing.shared_memory block.
+
+    The producer never waits: message n goes to slot n % slot_count, overwriting whatever was there. Each slot
+    carries the seq of the message in it, set to WRITING while it's being written, so a consumer can tell whether
+    what it read was overwritten under it (a seqlock). Aligned 8 byte stores are atomic on the platforms we run on.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        buf = shm.buf
+        self.control = np.ndarray((3,), np.uint64, buf, 0)
+        self.slot_count, self.slot_size = int(self.control[1]), int(self.control[2])
+        seqs, lengths, data, _ = _layout(self.slot_count, self.slot_size)
+        self.slot_seqs = np.ndarray((self.slot_count,), np.uint64, buf, seqs)
+        self.slot_lengths = np.ndarray((self.slot_count,), np.uint64, buf, lengths)
+        self.data = np.ndarray((self.slot_count, self.slot_size), np.uint8, buf, data)
+
+    @classmethod
+    def create(cls, name, slot_count=8, slot_size=8 * 1024 * 1024):
+        size = _layout(slot_count, slot_size)[3]
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:  # left over from a crashed run
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        _created_here.add(name)
+        control = np.ndarray((3,), np.uint64, shm.buf, 0)
+        control[2] = slot_size
+        np.ndarray((slot_count,), np.uint64, shm.buf, 3 * 8)[:] = WRITING
+        control[1] = slot_count  # last, consumers take a zero slot_count to mean the ring isn't ready yet
+        del control
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Map an existing ring. Raises FileNotFoundError if the producer hasn't created it yet."""
+        try:
+            shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:  # before python 3.13 the resource tracker would unlink it when we exit
+            from multiprocessing import resource_tracker
+            shm = shared_memory.SharedMemory(name)
+            if name not in _created_here:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+        if shm.size < 3 * 8 or not np.ndarray((3,), np.uint64, shm.buf, 0)[1]:
+            shm.close()
+            raise FileNotFoundError(f"Shared memory ring {name} is still being set up")
+        return cls(shm, owner=False)
+
+    @property
+    def write_seq(self):
+        """Seq of the next message to be written."""
+        return int(self.control[0])
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        if len(data) > self.slot_size:
+            raise ValueError(f"{len(data)} byte message doesn't fit in {self.slot_size} byte slots")
+        seq = int(self.control[0])
+        slot = seq % self.slot_count
+        self.slot_seqs[slot] = WRITING
+        self.data[slot, :len(data)] = data
+        self.slot_lengths[slot] = len(data)
+        self.slot_seqs[slot] = seq
+        self.control[0] = seq + 1
+        return seq
+
+    def view(self, seq):
+        """Zero-copy view of message seq, or None if it has already been overwritten."""
+        slot = seq % self.slot_count
+        if int(self.slot_seqs[slot]) != seq:
+            return None
+        return self.data[slot, :int(self.slot_lengths[slot])]
+
+    def intact(self, seq):
+        """Whether message seq is still in its slot, i.e. whatever was read from it isn't torn."""
+        return int(self.slot_seqs[seq % self.slot_count]) == seq
+
+    def close(self):
+        del self.control, self.slot_seqs, self.slot_lengths, self.data  # views keep the mapping alive
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # a ShmFrame is still held somewhere; the mapping goes when it does
+        if self.owner:
+            self.shm.unlink()
+            _created_here.discard(self.shm.name.lstrip('/'))
+
+
+class Overwritten(zmq.Again):
+    """The producer lapped the consumer while it was reading. Loops that retry on zmq.Again just move on."""
+
+
+class ShmFrame:
+    """A received message, still in shared memory. Use it before the producer comes around to its slot again."""
+
+    def __init__(self, ring, seq, view, on_overwritten):
+        self.ring = ring
+        self.seq = seq
+        self.buffer = memoryview(view)
+        self._on_overwritten = on_overwritten
+
+    def valid(self):
+        return self.ring.intact(self.seq)
+
+    def array(self, dtype=np.uint8, shape=None, offset=0):
+        """Zero-copy numpy view of the message."""
+        arr = np.frombuffer(self.buffer, dtype, offset=offset)
+        return arr if shape is None else arr.reshape(shape)
+
+    @property
+    def bytes(self):
+        data = self.buffer.tobytes()
+        if not self.valid():
+            self._on_overwritten()
+            raise Overwritten()
+        return data
+
+    def __len__(self):
+        return len(self.buffer)
+
+
+class ShmRadio:
+    """Sends like a zmq RADIO, into a ShmRing it creates and removes on close."""
+
+    def __init__(self, name, slot_count=8, slot_size=8 * 1024 * 1024):
+        self.ring = ShmRing.create(name, slot_count, slot_size)
+        self.max_part_size = slot_size - 2  # room for send_burst's type and uid bytes
+
+    def send(self, data, group=None, copy=True):
+        self.ring.write(data)
+
+    def close(self, linger=None):
+        self.ring.close()
+
+
+class ShmDish:
+    """Receives like a zmq DISH from the ShmRing called name, mapping it once the producer has created it.
+
+    Only messages written after the first recv are received. A consumer that falls more than a ring behind skips to
+    the oldest message still there, and counts what it missed in dropped.
+    """
+
+    def __init__(self, name, rcvtimeo=-1, spin=0.0005):
+        self.name = name
+        self.rcvtimeo = rcvtimeo  # milliseconds, -1 waits forever
+        self.spin = spin  # seconds to busy wait before sleeping between checks
+        self.ring = None
+        self.next_seq = None
+        self.received = 0
+        self.dropped = 0
+
+    def join(self, group):
+        pass  # one ring per direction, no groups
+
+    def _attach(self):
+        if self.ring is None:
+            try:
+                self.ring = ShmRing.attach(self.name)
+            except FileNotFoundError:
+                return False
+            self.next_seq = self.ring.write_seq
+        return True
+
+    def _count_overwritten(self):
+        self.dropped += 1
+
+    def _wait(self, flags):
+        """Wait for a message to be ready to read. Raises zmq.Again on timeout."""
+        timeout = 0 if flags & zmq.NOBLOCK else self.rcvtimeo
+        start = time.perf_counter()
+        deadline = None if timeout < 0 else start + timeout / 1000
+        while not (self._attach() and self.ring.write_seq > self.next_seq):
+            now = time.perf_counter()
+            if deadline is not None and now >= deadline:
+                raise zmq.Again()
+            if now - start > self.spin:
+                time.sleep(0.0001 if deadline is None else min(0.0001, deadline - now))
+
+    def recv(self, flags=0, copy=True):
+        while True:
+            self._wait(flags)
+            write_seq = self.ring.write_seq
+            oldest = write_seq - self.ring.slot_count
+            if self.next_seq < oldest:
+                self.dropped += oldest - self.next_seq
+                self.next_seq = oldest
+            seq = self.next_seq
+            self.next_seq += 1
+            view = self.ring.view(seq)
+            if view is None:  # lapped while we looked
+                self.dropped += 1
+                continue
+            self.received += 1
+            frame = ShmFrame(self.ring, seq, view, self._count_overwritten)
+            return frame.bytes if copy else frame
+
+    def close(self, linger=None):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+def shm_pair(local_name, peer_name, slot_count=8, slot_size=8 * 1024 * 1024, rcvtimeo=1000):
+    """A (radio, dish) pair: we write the local_name ring and read the peer_name ring."""
+    return ShmRadio(local_name, slot_count, slot_size), ShmDish(peer_name, rcvtimeo)
+
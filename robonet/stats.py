@@ -0,0 +1,75 @@
+"""Small, allocation free statistics for hot paths."""
+
+import bisect
+
+import numpy as np
+
+
+def log_bucket_edges(lowest, highest, per_decade=10):
+    """Logarithmically spaced bucket edges from lowest to highest."""
+    decades = np.log10(highest) - np.log10(lowest)
+    return list(np.logspace(np.log10(lowest), np.log10(highest), int(round(decades * per_decade)) + 1))
+
+
+class Histogram:
+    """Fixed-bucket histogram.
+
+    Edges are set once, so recording a value is a bisect and an increment. counts[i] holds values in
+    [edges[i-1], edges[i]); counts[0] and counts[-1] catch everything below and above the edges.
+    """
+
+    def __init__(self, edges):
+        self.edges = list(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def record(self, value):
+        self.counts[bisect.bisect_right(self.edges, value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Approximate quantile: the upper edge of the bucket the q-th value falls in."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target and c:
+                if i == 0:
+                    return self.min
+                if i == len(self.edges):
+                    return self.max
+                return min(self.edges[i], self.max)
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.mean(),
+            'min': self.min if self.count else 0.0,
+            'max': self.max if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'edges': [float(e) for e in self.edges],
+            'counts': list(self.counts),
+        }
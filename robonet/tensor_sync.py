@@ -0,0 +1,182 @@
+"""Keep a copy of a list of tensors in sync on the other end, sending only the blocks that changed.
+
+    # sender
+    sender = TensorDeltaSender(block_size=256, tolerance=1e-6)
+    send(pack_obj(sender.update(model_weights)))
+
+    # receiver
+    mirror = TensorMirror()
+    receive_objs(mirror.obj_handlers(), ...)
+    mirror.tensors()  # patched in place as deltas arrive
+
+Each update is compared with what the receiver should have, not with the previous update, so changes under
+tolerance can't pile up unseen: once a block has drifted more than tolerance from what was last sent, it's sent.
+Every full_sync_interval updates, and whenever the shapes or dtypes change, every block is sent, which gets a
+receiver that missed a delta back in sync.
+"""
+
+import threading
+
+import numpy as np
+
+from robonet.buffers.buffer_objects import TensorDelta
+
+
+class _Blocks:
+    """One tensor as a zero padded flat array, viewed as (number of blocks, block_size)."""
+
+    def __init__(self, shape, dtype, block_size):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.size = int(np.prod(self.shape, dtype=np.int64))
+        self.flat = np.zeros(-(-self.size // block_size) * block_size, dtype=self.dtype)
+        self.blocks = self.flat.reshape(-1, block_size)
+        self.tensor = self.flat[:self.size].reshape(self.shape)  # a view, so it's patched along with the blocks
+
+    def matches(self, tensor):
+        return tensor.shape == self.shape and tensor.dtype == self.dtype
+
+
+class TensorDeltaSender:
+    """Makes TensorDeltas for one stream of tensor lists.
+
+    A block counts as changed when any element differs from what was last sent by more than tolerance (for
+    integer and bool tensors, when it differs at all).
+    """
+
+    def __init__(self, block_size=256, tolerance=0.0, full_sync_interval=100, stream_id=0):
+        self.block_size = block_size
+        self.tolerance = tolerance
+        self.full_sync_interval = full_sync_interval  # updates between full syncs, None for only when needed
+        self.stream_id = stream_id
+        self.sent = []  # _Blocks of what the receiver should have
+        self.seq = 0
+        self.since_full = 0
+        self.force_full = False
+        self._work = []  # preallocated padded copies of the incoming tensors
+
+    def _needs_full(self, tensors):
+        return (self.force_full or len(tensors) != len(self.sent)
+                or any(not sent.matches(tensor) for sent, tensor in zip(self.sent, tensors))
+                or self.full_sync_interval is not None and self.since_full >= self.full_sync_interval)
+
+    def _changed(self, current, sent):
+        """Indices of the blocks of current that differ from sent."""
+        if self.tolerance and current.dtype.kind in 'fc':
+            # NaN compares False with anything, so becoming NaN or stopping being one is a change of its own
+            changed = ((np.abs(current - sent) > self.tolerance) | (np.isnan(current) != np.isnan(sent))).any(axis=1)
+        else:
+            changed = (current != sent).any(axis=1)
+        return np.flatnonzero(changed).astype(np.uint32)
+
+    def update(self, tensors):
+        """The TensorDelta that brings the receiver from the last update to tensors."""
+        tensors = [np.asarray(tensor) for tensor in tensors]
+        full = self._needs_full(tensors)
+        if full:
+            self.sent = [_Blocks(tensor.shape, tensor.dtype, self.block_size) for tensor in tensors]
+            self._work = [_Blocks(tensor.shape, tensor.dtype, self.block_size) for tensor in tensors]
+            self.since_full = 0
+            self.force_full = False
+        else:
+            self.since_full += 1
+
+        blocks = []
+        for tensor, work, sent in zip(tensors, self._work, self.sent):
+            work.tensor[...] = tensor
+            if full:
+                indices = np.arange(len(work.blocks), dtype=np.uint32)
+                changed = work.blocks.copy()
+            else:
+                indices = self._changed(work.blocks, sent.blocks)
+                changed = work.blocks[indices]
+            sent.blocks[indices] = changed
+            blocks.append((sent.shape, indices, changed))
+
+        delta = TensorDelta(self.stream_id, self.seq, full, self.block_size, blocks)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        return delta
+
+
+class MirroredTensors:
+    """The receiving end of one stream: the tensors as of the last delta applied."""
+
+    def __init__(self):
+        self.tensors = None  # None until the first full sync
+        self.blocks = []
+        self.expected_seq = None
+        self.stale = True  # a delta went missing since the last full sync, so some blocks may be out of date
+        self.full_syncs = 0
+        self.deltas = 0
+        self.missed = 0
+        self.blocks_received = 0
+
+    def apply(self, delta):
+        if delta.full:
+            self.blocks = [_Blocks(shape, changed.dtype, delta.block_size) for shape, _, changed in delta.blocks]
+            self.tensors = [blocks.tensor for blocks in self.blocks]
+            self.stale = False
+            self.full_syncs += 1
+        elif self.tensors is None:
+            return False  # nothing to patch until the first full sync
+        elif (len(delta.blocks) != len(self.blocks)
+              or any(tuple(shape) != mirror.shape or changed.dtype != mirror.dtype
+                     or changed.shape[1:] != mirror.blocks.shape[1:]
+                     for (shape, _, changed), mirror in zip(delta.blocks, self.blocks))):
+            self.stale = True  # missed the full sync that changed the shapes
+            return False
+        else:
+            self.deltas += 1
+            if delta.seq != self.expected_seq:
+                self.missed += (delta.seq - self.expected_seq) & 0xFFFFFFFF
+                self.stale = True
+
+        for (_, indices, changed), mirror in zip(delta.blocks, self.blocks):
+            mirror.blocks[indices] = changed
+            self.blocks_received += len(indices)
+        self.expected_seq = (delta.seq + 1) & 0xFFFFFFFF
+        return True
+
+    def stats(self):
+        return {
+            'full_syncs': self.full_syncs,
+            'deltas': self.deltas,
+            'missed': self.missed,
+            'stale': self.stale,
+            'blocks_received': self.blocks_received,
+        }
+
+
+class TensorMirror:
+    """Applies received TensorDeltas to per-stream copies of the tensors, in place.
+
+    tensors() returns the arrays that get patched, so a reader on another thread can see a delta half applied.
+    copy() takes a consistent copy instead.
+    """
+
+    def __init__(self):
+        self.streams = {}
+        self._lock = threading.Lock()
+
+    def obj_handlers(self):
+        return {'TensorDelta': self.handle}
+
+    def handle(self, delta):
+        with self._lock:
+            stream = self.streams.get(delta.stream_id)
+            if stream is None:
+                stream = self.streams[delta.stream_id] = MirroredTensors()
+            stream.apply(delta)
+
+    def tensors(self, stream_id=0):
+        stream = self.streams.get(stream_id)
+        return None if stream is None else stream.tensors
+
+    def copy(self, stream_id=0):
+        with self._lock:
+            tensors = self.tensors(stream_id)
+            return None if tensors is None else [tensor.copy() for tensor in tensors]
+
+    def stats(self):
+        with self._lock:
+            return {stream_id: stream.stats() for stream_id, stream in self.streams.items()}
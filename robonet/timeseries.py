@@ -0,0 +1,348 @@
+"""The last few seconds of each received stream, indexed by time, for lining streams up with each other.
+
+    store = TimeSeriesStore(seconds=5.0, to_local_time=clock_sync.to_local_time)
+    store.add_numeric('imu', IMU_FIELDS, rate=1000, extract=imu_values)
+    store.add_objects('camera', rate=30)
+    receive_objs({'IMUBuffer': store.handler('imu'), 'MJpegCamFrame': store.handler('camera')}, ...)
+
+    # from any other thread
+    frame_time, frame = store.nearest('camera', t)
+    times, imu = store.range('imu', t - 0.020, t)
+    imu_at_frame = store.interpolate('imu', frame_time)
+
+Numeric streams are kept as one preallocated array per field, so inserts never allocate and a range query is a
+couple of binary searches and a copy. Objects are timestamped with their capture_time when they have one, mapped
+onto our clock by to_local_time, and with the time they arrived otherwise. Timestamps going backwards are dropped
+and counted, so every stream's index stays sorted.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+IMU_FIELDS = {'accel': (3,), 'gyro': (3,), 'mag': (3,)}
+
+
+def imu_values(obj):
+    """IMU_FIELDS values of an IMUBuffer. Missing readings are NaN."""
+    return {name: np.nan if value is None else value
+            for name, value in (('accel', obj.accel_data), ('gyro', obj.gyro_data), ('mag', obj.mag_data))}
+
+
+def object_size(obj):
+    """Rough bytes held by a received object: its bytes and arrays, plus a bit for the object itself."""
+    size = 64
+    for value in vars(obj).values():
+        if isinstance(value, np.ndarray):
+            size += value.nbytes
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            size += len(value)
+        elif isinstance(value, list):
+            size += sum(getattr(item, 'nbytes', 8) for item in value)
+    return size
+
+
+class Series:
+    """Ring of timestamps, the index of one stream.
+
+    Every timestamp is written twice, at i and i + capacity, so the live ones are always one sorted slice of
+    times[first % capacity:] that searchsorted can take as it is, however the ring has wrapped.
+    """
+
+    def __init__(self, capacity, seconds):
+        self.capacity = capacity
+        self.seconds = seconds
+        self.times = np.zeros(2 * capacity)
+        self.first = 0  # oldest sample still kept, counting every sample ever inserted
+        self.count = 0
+        self.inserted = 0
+        self.out_of_order = 0
+        self._lock = threading.Lock()
+
+    def _in_order(self, timestamp):
+        """False, and counted, if timestamp is older than the newest sample. Call with the lock held."""
+        if self.count > self.first and timestamp < self.times[(self.count - 1) % self.capacity]:
+            self.out_of_order += 1
+            return False
+        return True
+
+    def _slot(self, timestamp):
+        """Make room for a sample and index it. Returns its slot, or None to drop it. Call with the lock held."""
+        if not self._in_order(timestamp):
+            return None
+        if self.count - self.first == self.capacity:
+            self._evict()
+        slot = self.count % self.capacity
+        self.times[slot] = self.times[slot + self.capacity] = timestamp
+        return slot
+
+    def _publish(self):
+        self.count += 1
+        self.inserted += 1
+
+    def _evict(self):
+        self.first += 1
+
+    def _window(self):
+        """(start slot, sorted times) of the samples within seconds of the newest. Call with the lock held."""
+        start = self.first % self.capacity
+        times = self.times[start:start + self.count - self.first]
+        if len(times):
+            skip = int(np.searchsorted(times, times[-1] - self.seconds))
+            start, times = start + skip, times[skip:]
+        return start, times
+
+    def _nearest(self, t, max_distance):
+        """Slots and times of the samples nearest each of t. Slots are -1 where there's none within max_distance."""
+        start, times = self._window()
+        if not len(times):
+            return np.full(np.shape(t), -1), np.full(np.shape(t), np.nan)
+        j = np.clip(np.searchsorted(times, t), 1, max(len(times) - 1, 1))
+        if len(times) > 1:
+            j -= np.abs(times[j - 1] - t) <= np.abs(times[j] - t)
+        else:
+            j = np.zeros_like(j)
+        found = times[j]
+        slots = (start + j) % self.capacity
+        if max_distance is not None:
+            slots = np.where(np.abs(found - t) <= max_distance, slots, -1)
+        return slots, found
+
+    def _range(self, t0, t1):
+        """Slots and times of the samples in [t0, t1]."""
+        start, times = self._window()
+        i, j = np.searchsorted(times, t0, side='left'), np.searchsorted(times, t1, side='right')
+        return (start + np.arange(i, j)) % self.capacity, times[i:j].copy()
+
+    def latest_time(self):
+        with self._lock:
+            return self.times[(self.count - 1) % self.capacity] if self.count > self.first else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._window()[1])
+
+    def stats(self):
+        with self._lock:
+            return {'samples': len(self._window()[1]), 'capacity': self.capacity, 'inserted': self.inserted,
+                    'out_of_order': self.out_of_order}
+
+
+class NumericSeries(Series):
+    """Fixed shape numeric samples, one preallocated array per field (shape is per sample)."""
+
+    def __init__(self, capacity, seconds, fields, dtype=np.float32):
+        super().__init__(capacity, seconds)
+        self.fields = {name: np.zeros((capacity,) + tuple(shape), dtype=dtype) for name, shape in fields.items()}
+
+    @staticmethod
+    def sample_bytes(fields, dtype=np.float32):
+        return 16 + sum(int(np.prod(shape)) for shape in fields.values()) * np.dtype(dtype).itemsize
+
+    def insert(self, timestamp, values):
+        """values maps each field to a value for this sample. Missing fields are left as whatever was there."""
+        with self._lock:
+            slot = self._slot(timestamp)
+            if slot is None:
+                return False
+            for name, value in values.items():
+                self.fields[name][slot] = value
+            self._publish()
+            return True
+
+    def nearest(self, t, max_distance=None):
+        """(time, {field: value}) of the sample nearest t, or None if there's none within max_distance.
+
+        With an array of times, (times, {field: values}) with NaN where there's nothing near enough.
+        """
+        scalar = np.ndim(t) == 0
+        with self._lock:
+            slots, found = self._nearest(np.atleast_1d(np.asarray(t, dtype=float)), max_distance)
+            missing = slots < 0
+            if scalar and missing[0]:
+                return None
+            values = {name: array[slots].astype(float) for name, array in self.fields.items()}
+        for array in values.values():
+            array[missing] = np.nan
+        found[missing] = np.nan
+        if scalar:
+            return found[0], {name: array[0] for name, array in values.items()}
+        return found, values
+
+    def range(self, t0, t1):
+        """(times, {field: values}) of every sample with t0 <= time <= t1, oldest first."""
+        with self._lock:
+            slots, times = self._range(t0, t1)
+            return times, {name: array[slots] for name, array in self.fields.items()}
+
+    def interpolate(self, t):
+        """{field: value} linearly interpolated at t, or at each of an array of times. NaN outside the samples."""
+        scalar = np.ndim(t) == 0
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        with self._lock:
+            start, times = self._window()
+            if len(times) < 2:
+                values = {name: np.full((len(t),) + array.shape[1:], np.nan) for name, array in self.fields.items()}
+            else:
+                j = np.clip(np.searchsorted(times, t, side='right'), 1, len(times) - 1)
+                before, after = times[j - 1], times[j]
+                span = after - before
+                weight = np.divide(t - before, span, out=np.zeros_like(t), where=span > 0)
+                outside = (t < times[0]) | (t > times[-1])
+                lo, hi = (start + j - 1) % self.capacity, (start + j) % self.capacity
+                values = {}
+                for name, array in self.fields.items():
+                    a, b = array[lo].astype(float), array[hi].astype(float)
+                    w = weight.reshape((-1,) + (1,) * (a.ndim - 1))
+                    value = a + w * (b - a)
+                    value[outside] = np.nan
+                    values[name] = value
+        if scalar:
+            return {name: value[0] for name, value in values.items()}
+        return values
+
+
+class ObjectSeries(Series):
+    """Any received objects, up to capacity of them and max_bytes of them by object_size."""
+
+    def __init__(self, capacity, seconds, max_bytes, size=object_size):
+        super().__init__(capacity, seconds)
+        self.objects = [None] * capacity
+        self.sizes = np.zeros(capacity, dtype=np.int64)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.size = size
+        self.evicted_for_size = 0
+
+    def _evict(self):
+        slot = self.first % self.capacity
+        self.objects[slot] = None
+        self.bytes -= self.sizes[slot]
+        self.first += 1
+
+    def insert(self, timestamp, obj):
+        size = self.size(obj)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if not self._in_order(timestamp):
+                return False
+            while self.count > self.first and self.bytes + size > self.max_bytes:
+                self._evict()
+                self.evicted_for_size += 1
+            slot = self._slot(timestamp)
+            if slot is None:
+                return False
+            self.objects[slot] = obj
+            self.sizes[slot] = size
+            self.bytes += size
+            self._publish()
+            return True
+
+    def nearest(self, t, max_distance=None):
+        """(time, obj) of the object nearest t, or None if there's none within max_distance."""
+        with self._lock:
+            slots, found = self._nearest(np.array([t], dtype=float), max_distance)
+            if slots[0] < 0:
+                return None
+            return found[0], self.objects[slots[0]]
+
+    def range(self, t0, t1):
+        """(times, objects) of every object with t0 <= time <= t1, oldest first."""
+        with self._lock:
+            slots, times = self._range(t0, t1)
+            return times, [self.objects[slot] for slot in slots]
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(bytes=int(self.bytes), max_bytes=self.max_bytes, evicted_for_size=self.evicted_for_size)
+        return stats
+
+
+class TimeSeriesStore:
+    """Named streams of the last seconds of samples, within max_bytes of memory altogether.
+
+    Each stream reserves its share of max_bytes when it's added: numeric streams their preallocated arrays, sized
+    for rate samples a second (with some headroom), object streams however many bytes they're given, by default
+    a tenth of what's left. A stream that doesn't fit raises a MemoryError right away, rather than later.
+    One thread can insert into a stream while any number of others query it.
+    """
+
+    def __init__(self, seconds=10.0, max_bytes=256 * 1024 * 1024, clock=time.monotonic, to_local_time=None,
+                 headroom=1.25):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.to_local_time = to_local_time  # maps sender timestamps onto our clock, like LatencyMonitor's
+        self.headroom = headroom
+        self.streams = {}
+        self.reserved = 0
+        self.extractors = {}
+
+    def _capacity(self, rate):
+        return max(int(np.ceil(self.seconds * rate * self.headroom)), 2)
+
+    def _reserve(self, name, size):
+        if name in self.streams:
+            raise ValueError(f"there's already a stream called {name}")
+        if self.reserved + size > self.max_bytes:
+            raise MemoryError(f"{name} needs {size} bytes, but only {self.max_bytes - self.reserved} of the store's "
+                              f"{self.max_bytes} are left")
+        self.reserved += size
+
+    def add_numeric(self, name, fields, rate, extract=None, dtype=np.float32):
+        """A stream of fields (names to per-sample shapes) arriving at about rate samples a second.
+
+        extract turns a received object into {field: value}, for handler(). By default it's the object's own
+        attributes with the fields' names.
+        """
+        capacity = self._capacity(rate)
+        self._reserve(name, capacity * NumericSeries.sample_bytes(fields, dtype))
+        self.streams[name] = NumericSeries(capacity, self.seconds, fields, dtype)
+        self.extractors[name] = extract or (lambda obj: {field: getattr(obj, field) for field in fields})
+        return self.streams[name]
+
+    def add_objects(self, name, rate, max_bytes=None, size=object_size):
+        capacity = self._capacity(rate)
+        if max_bytes is None:
+            max_bytes = (self.max_bytes - self.reserved) // 10
+        self._reserve(name, max_bytes + capacity * 24)
+        self.streams[name] = ObjectSeries(capacity, self.seconds, max_bytes, size)
+        self.extractors[name] = None
+        return self.streams[name]
+
+    def timestamp(self, obj):
+        """Our time for a received object: its capture_time if it has one, else now."""
+        capture_time = getattr(obj, 'capture_time', 0.0)
+        if not capture_time:
+            return self.clock()
+        return capture_time if self.to_local_time is None else self.to_local_time(capture_time)
+
+    def insert(self, name, timestamp, value):
+        """value is {field: value} for numeric streams, anything for object streams. False if it was dropped."""
+        return self.streams[name].insert(timestamp, value)
+
+    def handler(self, name):
+        """An obj handler for receive_objs that inserts what it's given into the stream."""
+        series, extract = self.streams[name], self.extractors[name]
+        timestamp = self.timestamp
+        if extract is None:
+            return lambda obj: series.insert(timestamp(obj), obj)
+        return lambda obj: series.insert(timestamp(obj), extract(obj))
+
+    def nearest(self, name, t, max_distance=None):
+        return self.streams[name].nearest(t, max_distance)
+
+    def range(self, name, t0, t1):
+        return self.streams[name].range(t0, t1)
+
+    def interpolate(self, name, t):
+        series = self.streams[name]
+        if not isinstance(series, NumericSeries):
+            raise TypeError(f"{name} holds objects, only numeric streams interpolate")
+        return series.interpolate(t)
+
+    def stats(self):
+        return {name: series.stats() for name, series in self.streams.items()}
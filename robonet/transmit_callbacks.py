@@ -1,11 +1,17 @@
 from robonet import camera
+import logging
 import zmq
 import time
-from robonet.buffers.buffer_objects import MJpegCamFrame, AudioBuffer
+from robonet.buffers.buffer_objects import MJpegCamFrame, AudioBuffer, CVCamFrame
 from robonet.buffers.buffer_handling import pack_obj
+from robonet.audio import MicFftStreamer
+from robonet.multi_camera import MultiCameraSender, open_cameras
+from robonet.frame_encoding import FrameEncoderPool
+from robonet.util import BurstSender
+from robonet.instrumentation import sampled_logger
 import sounddevice as sd
-from scipy import fft
-import numpy as np
+
+_log = sampled_logger(__name__)
 
 def transmit_cam_mjpg(unicast_radio, unicast_dish):
     cam = camera.CameraPack()
@@ -15,9 +21,9 @@ def transmit_cam_mjpg(unicast_radio, unicast_dish):
                 # Receive direct messages from the server
                 msg = unicast_dish.recv(copy=False)
                 direct_message = msg.bytes.decode('utf-8')
-                print(f"Received direct message: {direct_message}")
+                _log(logging.DEBUG, 'received', "Received direct message: %s", direct_message)
             except zmq.Again:
-                print('No direct message yet')
+                _log(logging.DEBUG, 'waiting', "No direct message yet")
                 # time.sleep(1)
 
             # Send direct messages to the server
@@ -28,7 +34,7 @@ def transmit_cam_mjpg(unicast_radio, unicast_dish):
             for p in parts[:-1]:
                 unicast_radio.send(b'm' + p, group='direct')  # send more doesn't work either I guess
             unicast_radio.send(b'd' + parts[-1], group='direct')
-            print(f"Sent frame")
+            _log(logging.DEBUG, 'sent', "Sent frame")
             time.sleep(1.0 / 120)  # limit 120 fps
         except KeyboardInterrupt:
             break
@@ -46,33 +52,49 @@ def transmit_cam_mjpg_async(unicast_radio):
         for p in parts[:-1]:
             unicast_radio.send(b'm' + p, group='direct')  # send more doesn't work either I guess
         unicast_radio.send(b'd' + parts[-1], group='direct')
-        print(f"Sent frame")
+        _log(logging.DEBUG, 'sent', "Sent frame")
         time.sleep(1.0 / 120)  # limit 120 fps
 
 
-def transmit_mic_fft_async(unicast_radio, unicast_dish, sample_rate=44800, sends_per_sec=24, fft_size=1536, channels=1):
-    block_size = sample_rate//sends_per_sec
-    def audio_callback(indata, outdata, frames, time, status):
-        nonlocal fft_size, unicast_radio
+def transmit_multi_cam_mjpg(devices=('/dev/video0', '/dev/video1'), weights=None, width=320, height=240):
+    """Send several cameras over one channel. Each device's frames get the stream_id of its index in devices."""
+    def transmit(unicast_radio, unicast_dish):
+        sender = MultiCameraSender(open_cameras(devices, width, height), weights)
+        sender.run(unicast_radio, unicast_dish)
 
-        x = fft.rfft(indata, n=block_size, axis=0)
+    return transmit
 
-        fft_size = min(len(indata) * 2, fft_size)
-        fft_transmit = x[:fft_size // 2]
 
-        direct_message = AudioBuffer(sample_rate, sends_per_sec, fft_transmit)
-        direct_message = pack_obj(direct_message)
-        parts = []
-        for i in range(0, len(direct_message), 4096):
-            parts.append(direct_message[i:i + 4096])
-        for p in parts[:-1]:
-            unicast_radio.send(b'm' + p, group='direct')  # send more doesn't work either I guess
-        unicast_radio.send(b'd' + parts[-1], group='direct')
-        print(f"Sent fft")
+def transmit_cv_frames(get_image, encoding=CVCamFrame.JPEG, quality=80, processes=None, fps=30):
+    """Send processed images (overlays, depth maps...) from get_image() as CVCamFrames, encoded in a process pool."""
+    def transmit(unicast_radio, unicast_dish):
+        send = BurstSender(unicast_radio)
+        with FrameEncoderPool(processes) as pool:
+            while True:
+                try:
+                    frame = CVCamFrame(get_image(), 0, 0, encoding, quality)
+                    for message in pool.submit(frame):
+                        send(message)
+                    time.sleep(1.0 / fps)
+                except KeyboardInterrupt:
+                    break
+
+    return transmit
 
-    with sd.Stream(channels=channels, samplerate=sample_rate, blocksize=block_size, callback=audio_callback):
-        print("Audio streaming started.")
-        while True:
-            time.sleep(0) # leave thread while mic works
 
+def transmit_mic_fft_async(unicast_radio, unicast_dish, sample_rate=44800, sends_per_sec=24, fft_size=1536, channels=1,
+                           encoding=AudioBuffer.COMPLEX64, max_freq=0):
+    """Stream microphone FFTs. The sounddevice callback only copies samples; this thread does the FFTs and sends.
 
+    encoding=AudioBuffer.LOG_U8 sends a quarter of the bytes, at the cost of quantizing the spectrum.
+    """
+    streamer = MicFftStreamer(BurstSender(unicast_radio), sample_rate, sends_per_sec, channels, fft_size=fft_size,
+                              encoding=encoding, max_freq=max_freq)
+    with sd.InputStream(channels=channels, samplerate=sample_rate, blocksize=streamer.hop_size,
+                        callback=streamer.audio_callback):
+        print("Audio streaming started.")
+        try:
+            streamer.run()
+        except KeyboardInterrupt:
+            streamer.stop()
+        print(f"Audio streaming stopped: {streamer.stats()}")
@@ -0,0 +1,133 @@
+"""Transport backends behind the (radio, dish) pair that callback loops are written against.
+
+A callback loop only uses radio.send(data, group=...), dish.recv(flags, copy) (with .bytes on the copy=False
+result), dish.rcvtimeo and close(), and BurstSender reads radio.max_part_size. Datagram transports need
+fragmenting into max_part_size parts, while stream and in-process transports have max_part_size None, so each
+message goes out whole.
+"""
+
+import os
+import tempfile
+
+import zmq
+
+SERVER_PORT = 9998
+CLIENT_PORT = 9999
+
+
+class PairSocket:
+    """A zmq PAIR socket that takes and ignores RADIO/DISH groups, for tcp://, ipc:// and inproc:// endpoints."""
+
+    max_part_size = None  # stream transport, messages are never split
+
+    def __init__(self, sock, zero_copy=False):
+        self.sock = sock
+        self.zero_copy = zero_copy  # hand buffers to zmq instead of copying them, worth it within a process
+
+    def send(self, data, group=None, copy=True):
+        self.sock.send(data, copy=copy and not self.zero_copy)
+
+    def recv(self, flags=0, copy=True):
+        return self.sock.recv(flags, copy=copy)
+
+    def join(self, group):
+        pass
+
+    @property
+    def rcvtimeo(self):
+        return self.sock.rcvtimeo
+
+    @rcvtimeo.setter
+    def rcvtimeo(self, value):
+        self.sock.rcvtimeo = value
+
+    def close(self, linger=None):
+        self.sock.close(linger=linger)
+
+
+def _udp_pair(ctx, local_ip, peer_ip, local_port, peer_port):
+    radio = ctx.socket(zmq.RADIO)
+    radio.setsockopt(zmq.LINGER, 0)
+    radio.setsockopt(zmq.CONFLATE, 1)
+    dish = ctx.socket(zmq.DISH)
+    dish.setsockopt(zmq.LINGER, 0)
+    dish.setsockopt(zmq.CONFLATE, 1)
+    dish.rcvtimeo = 1000
+
+    dish.bind(f"udp://{local_ip}:{local_port}")
+    dish.join("direct")
+    radio.connect(f"udp://{peer_ip}:{peer_port}")
+    return radio, dish
+
+
+def _zmq_pair(ctx, dish_endpoint, radio_endpoint, zero_copy=False):
+    radio = ctx.socket(zmq.PAIR)
+    radio.setsockopt(zmq.LINGER, 0)
+    dish = ctx.socket(zmq.PAIR)
+    dish.setsockopt(zmq.LINGER, 0)
+    dish.rcvtimeo = 1000
+
+    dish.bind(dish_endpoint)
+    radio.connect(radio_endpoint)
+    return PairSocket(radio, zero_copy), PairSocket(dish, zero_copy)
+
+
+def _tcp_pair(ctx, local_ip, peer_ip, local_port, peer_port):
+    return _zmq_pair(ctx, f"tcp://{local_ip}:{local_port}", f"tcp://{peer_ip}:{peer_port}")
+
+
+def _ipc_pair(ctx, local_ip, peer_ip, local_port, peer_port):
+    path = os.path.join(tempfile.gettempdir(), "robonet-")
+    return _zmq_pair(ctx, f"ipc://{path}{local_port}", f"ipc://{path}{peer_port}")
+
+
+def _inproc_pair(ctx, local_ip, peer_ip, local_port, peer_port):
+    return _zmq_pair(ctx, f"inproc://robonet-{local_port}", f"inproc://robonet-{peer_port}", zero_copy=True)
+
+
+def _raw_udp_pair(ctx, local_ip, peer_ip, local_port, peer_port):
+    from robonet.udp_transport import udp_pair
+    return udp_pair(local_ip, peer_ip, local_port, peer_port)
+
+
+def _shm_pair(ctx, local_ip, peer_ip, local_port, peer_port):
+    from robonet.shm_transport import shm_pair
+    return shm_pair(f"robonet_{peer_port}", f"robonet_{local_port}")
+
+
+# name -> open(ctx, local_ip, peer_ip, local_port, peer_port) returning (radio, dish)
+TRANSPORTS = {
+    'udp': _udp_pair,
+    'rawudp': _raw_udp_pair,  # same datagrams as udp, without zmq, and a receive path that doesn't allocate
+    'tcp': _tcp_pair,
+    'ipc': _ipc_pair,
+    'inproc': _inproc_pair,
+    'shm': _shm_pair,
+}
+
+
+def open_pair(ctx, transport, role, local_ip, peer_ip, port_offset=0):
+    """(radio, dish) for the 'server' or 'client' end of a link. ipc, inproc and shm ignore the IPs.
+
+    The server receives on SERVER_PORT and the client on CLIENT_PORT, shifted by port_offset so several pairs can
+    run side by side.
+    """
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport {transport}, expected one of {', '.join(TRANSPORTS)}")
+    if role == 'server':
+        local_port, peer_port = SERVER_PORT, CLIENT_PORT
+    elif role == 'client':
+        local_port, peer_port = CLIENT_PORT, SERVER_PORT
+    else:
+        raise ValueError(f"role should be 'server' or 'client', not {role}")
+    return TRANSPORTS[transport](ctx, local_ip, peer_ip, local_port + port_offset, peer_port + port_offset)
+
+
+def open_streams(ctx, streams, role, local_ip, peer_ip):
+    """Open one pair per stream, each on its own transport. streams maps stream name -> transport name.
+
+    Pairs get consecutive port offsets in the order given, so both ends must list the streams in the same order.
+    Returns stream name -> (radio, dish).
+    """
+    return {name: open_pair(ctx, transport, role, local_ip, peer_ip, port_offset=2 * i)
+            for i, (name, transport) in enumerate(streams.items())}
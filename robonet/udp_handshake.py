@@ -1,135 +1,169 @@
-import time
 import struct
+import time
+import zlib
+
 import zmq
 
+from robonet.buffers.buffer_objects import WifiSetupInfo, Capabilities
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj
+
+# frame kinds. Every frame is kind + body + crc32(kind + body).
+OBJ = b'O'  # body: packed object length, packed object, packed Capabilities
+ACK = b'A'  # body: packed Capabilities
+NACK = b'N'  # body: nothing
+
+
+def frame(kind, body=b''):
+    message = kind + body
+    return message + struct.pack('!I', zlib.crc32(message))
+
+
+def unframe(message):
+    """Check the crc and split a frame into (kind, body). Raises ValueError on corruption."""
+    if len(message) < 5:
+        raise ValueError("Handshake frame too short")
+    crc = struct.unpack_from('!I', message, len(message) - 4)[0]
+    if zlib.crc32(message[:-4]) != crc:
+        raise ValueError("Handshake frame failed its checksum")
+    return message[0:1], message[1:-4]
+
 
-class WifiSetupInfo:
-    def __init__(self, ssid, server_ip, client_ip):
-        self.ssid = ssid
-        self.server_ip = server_ip
-        self.client_ip = client_ip
+class RetryPolicy:
+    """How long to wait for an answer before resending, and how many times to resend."""
+
+    def __init__(self, timeout=0.05, backoff=2.0, max_timeout=1.0, max_retries=20):
+        self.timeout = timeout  # seconds. A bit over one round trip on a busy Wi-Fi link.
+        self.backoff = backoff
+        self.max_timeout = max_timeout
+        # None retries forever. The default gives up after about 17s: the client stops listening once it has
+        # ACKed, so if that ACK is lost, resending would go on for ever.
+        self.max_retries = max_retries
+
+    def timeouts(self):
+        """Seconds to wait after each send."""
+        timeout = self.timeout
+        retries = 0
+        while self.max_retries is None or retries <= self.max_retries:
+            yield timeout
+            timeout = min(timeout * self.backoff, self.max_timeout)
+            retries += 1
 
 
 class TinyHandshakeStateMachine:
-    """Handshake class for sending small objects without crc"""
+    """Handshake for sending small objects, packed with the buffer codec and checked with a crc32.
+
+    Waits happen in zmq.Poller, so every transition happens as soon as its message arrives, and a handshake takes
+    about one round trip. Capabilities ride along with the object and the ACK, and both ends end up with the same
+    negotiated settings in self.capabilities.
+    """
 
-    def __init__(self, radio, dish, timeout=10):
+    def __init__(self, radio, dish, timeout=10, capabilities=None, retry_policy=None, group=None):
         self.radio = radio
         self.dish = dish
         self.obj = None
         self.state = "INIT"
         self.handshake_complete = False
-        self.timeout = timeout
+        self.timeout = timeout  # seconds to wait for the other side at all
+        self.local_capabilities = capabilities or Capabilities()
+        self.capabilities = None  # negotiated
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.group = group  # needed when radio is a RADIO socket
+        self.poller = zmq.Poller()
+        self.poller.register(self.dish, zmq.POLLIN)
+        self._timeouts = self.retry_policy.timeouts()
+        self._wait = None
+
+    def send(self, message):
+        if self.group is None:
+            self.radio.send(message)
+        else:
+            self.radio.send(message, group=self.group)
+
+    def recv(self, timeout):
+        """Next message, or None if nothing arrives within timeout seconds."""
+        if self.poller.poll(timeout * 1000):
+            return self.dish.recv()
+        return None
 
     def send_obj(self):
-        class_name = self.obj.__class__.__name__
-        obj_dict = self.obj.__dict__
-
-        # Prepare the message
-        message = struct.pack('!I', len(class_name))
-        message += class_name.encode('utf-8')
-        for key, value in obj_dict.items():
-            key_encoded = key.encode('utf-8')
-            value_encoded = str(value).encode('utf-8')
-            message += struct.pack('!I', len(key_encoded))
-            message += key_encoded
-            message += struct.pack('!I', len(value_encoded))
-            message += value_encoded
-
-        # Send the entire message at once
-        self.radio.send(message)
+        packed_obj = pack_obj(self.obj)
+        self.send(frame(OBJ, struct.pack('!I', len(packed_obj)) + packed_obj + pack_obj(self.local_capabilities)))
         print(f"Sent object: {self.obj.__class__.__name__}")
+        try:
+            self._wait = next(self._timeouts)
+        except StopIteration:
+            raise TimeoutError(f"No ACK after {self.retry_policy.max_retries} retries")
         self.state = "WAIT_FOR_ACK"
 
     def wait_for_obj(self):
-        start_time = time.time()
-        while True:
-            try:
-                message = self.dish.recv(flags=zmq.NOBLOCK)
-                try:
-                    # Unpack the message
-                    offset = 0
-                    class_name_len = struct.unpack_from('!I', message, offset)[0]
-                    offset += 4
-                    class_name = message[offset:offset + class_name_len].decode('utf-8')
-                    offset += class_name_len
-
-                    obj_dict = {}
-                    while offset < len(message):
-                        key_len = struct.unpack_from('!I', message, offset)[0]
-                        offset += 4
-                        key = message[offset:offset + key_len].decode('utf-8')
-                        offset += key_len
-                        value_len = struct.unpack_from('!I', message, offset)[0]
-                        offset += 4
-                        value = message[offset:offset + value_len].decode('utf-8')
-                        offset += value_len
-                        obj_dict[key] = value
-
-                    if offset != len(message):  # offsets weren't correct or we receveid more data than we should've
-                        self.state = "SEND_NACK"
-                    else:
-                        # Create object
-                        received_obj = type(class_name, (), {})()
-                        for key, value in obj_dict.items():
-                            setattr(received_obj, key, value)
-
-                        print(f"Received object: {class_name}")
-
-                        if self.verify_obj(received_obj):
-                            self.obj = received_obj
-                            self.state = "SEND_ACK"
-                        else:
-                            self.state = "SEND_NACK"
-                except (struct.error, IndexError):
-                    print("Error unpacking message, sending NACK")
-                    self.state = "SEND_NACK"
-                return
-            except zmq.Again:
-                if time.time() - start_time > self.timeout and isinstance(self, ServerTinyHandshakeStateMachine):
-                    print("Timeout waiting for object, going back to SEND_OBJ")
-                    self.state = "SEND_OBJ"
-                    return
-                time.sleep(0.01)
+        message = self.recv(self.timeout)
+        if message is None:
+            if isinstance(self, ServerTinyHandshakeStateMachine):
+                print("Timeout waiting for object, going back to SEND_OBJ")
+                self.state = "SEND_OBJ"
+            return
+        try:
+            kind, body = unframe(message)
+            if kind != OBJ:
+                return  # a stray ACK or NACK from an earlier round
+            obj_len = struct.unpack_from('!I', body, 0)[0]
+            received_obj = unpack_obj(body[4:4 + obj_len])
+            their_capabilities = unpack_obj(body[4 + obj_len:])
+        except (ValueError, TypeError, struct.error, IndexError, UnicodeDecodeError) as e:
+            print(f"Error unpacking message ({e}), sending NACK")
+            self.state = "SEND_NACK"
+            return
+
+        print(f"Received object: {received_obj.__class__.__name__}")
+        if self.verify_obj(received_obj):
+            self.obj = received_obj
+            self.capabilities = self.local_capabilities.negotiate(their_capabilities)
+            self.state = "SEND_ACK"
+        else:
+            self.state = "SEND_NACK"
 
     def verify_obj(self, received_obj):
         # Base implementation always returns True
         return True
 
     def send_ack(self):
-        self.radio.send("ACK".encode('utf-8'))
+        self.send(frame(ACK, pack_obj(self.local_capabilities)))
         print("Sent ACK")
         self.state = "HANDSHAKE_COMPLETE"
 
     def send_nack(self):
-        self.radio.send("NACK".encode('utf-8'))
+        self.send(frame(NACK))
         print("Sent NACK")
         self.state = "WAIT_FOR_OBJ"
 
     def wait_for_ack(self):
-        start_time = time.time()
+        deadline = time.monotonic() + self._wait
         while True:
+            message = self.recv(max(deadline - time.monotonic(), 0))
+            if message is None:
+                print(f"Timeout waiting for ACK after {self._wait * 1000:.0f}ms, resending")
+                self.state = "SEND_OBJ"
+                return
             try:
-                msg = self.dish.recv(flags=zmq.NOBLOCK)
-                response = msg.decode('utf-8')
-                if response == "ACK":
-                    print("Received ACK")
-                    self.state = "HANDSHAKE_COMPLETE"
-                elif response == "NACK":
-                    print("Received NACK")
-                    self.state = "SEND_OBJ"
+                kind, body = unframe(message)
+            except ValueError as e:
+                print(f"{e}, resending")
+                self.state = "SEND_OBJ"
+                return
+            if kind == ACK:
+                print("Received ACK")
+                self.capabilities = self.local_capabilities.negotiate(unpack_obj(body))
+                self.state = "HANDSHAKE_COMPLETE"
+                return
+            elif kind == NACK:
+                print("Received NACK")
+                self.state = "SEND_OBJ"
                 return
-            except zmq.Again:
-                if time.time() - start_time > self.timeout:
-                    print("Timeout waiting for ACK, going back to SEND_OBJ")
-                    self.state = "SEND_OBJ"
-                    return
-                time.sleep(0.01)
 
 
 class ServerTinyHandshakeStateMachine(TinyHandshakeStateMachine):
-    def __init__(self, radio, dish, obj, timeout=10):
-        super().__init__(radio, dish, timeout)
+    def __init__(self, radio, dish, obj, timeout=10, **kwargs):
+        super().__init__(radio, dish, timeout, **kwargs)
         self.obj = obj
 
     def verify_obj(self, received_obj):
@@ -178,7 +212,6 @@ class ClientTinyHandshakeStateMachine(TinyHandshakeStateMachine):
 def run_handshake(state_machine):
     while not state_machine.handshake_complete:
         state_machine.transition()
-        time.sleep(0.01)
     return state_machine.obj
 
 
@@ -190,19 +223,21 @@ if __name__ == '__main__':
     server_radio = ctx.socket(zmq.RADIO)
     server_dish = ctx.socket(zmq.DISH)
     server_dish.bind('udp://192.168.1.1:9998')
+    server_dish.join('handshake')
     server_radio.connect('udp://192.168.1.2:9999')
 
     wifi_setup_info = WifiSetupInfo("test_network", "192.168.1.1", "192.168.1.2")
-    server = ServerTinyHandshakeStateMachine(server_radio, server_dish, wifi_setup_info)
+    server = ServerTinyHandshakeStateMachine(server_radio, server_dish, wifi_setup_info, group='handshake')
     server_result = run_handshake(server)
-    print(f"Server handshake complete. Result: {server_result.__dict__}")
+    print(f"Server handshake complete. Result: {server_result.__dict__}, {server.capabilities.__dict__}")
 
     # For client
     client_radio = ctx.socket(zmq.RADIO)
     client_dish = ctx.socket(zmq.DISH)
     client_dish.bind('udp://192.168.1.2:9999')
+    client_dish.join('handshake')
     client_radio.connect('udp://192.168.1.1:9998')
 
-    client = ClientTinyHandshakeStateMachine(client_radio, client_dish)
+    client = ClientTinyHandshakeStateMachine(client_radio, client_dish, group='handshake')
     client_result = run_handshake(client)
-    print(f"Client handshake complete. Result: {client_result.__dict__}")
+    print(f"Client handshake complete. Result: {client_result.__dict__}, {client.capabilities.__dict__}")
@@ -0,0 +1,147 @@
+"""Plain UDP sockets standing in for the ZMQ RADIO/DISH pair, with a receive path that doesn't allocate per datagram.
+
+Datagrams are framed like a ZMQ udp RADIO frames them (group length, group, payload), so either end can talk to a
+zmq udp socket. UdpDish reads with recv_into into a pool of preallocated buffers, and drain() reads everything
+waiting in one go and hands each part to a callback as a region of those buffers, which
+util.BufferedMessageHandler.feed reassembles without slicing anything out. recv() still works like a DISH's, for
+code that wants one datagram at a time, at the cost of a copy.
+"""
+
+import select
+import socket
+import time
+
+import zmq
+
+
+def group_header(group):
+    group = group.encode('utf-8')
+    return bytes([len(group)]) + group
+
+
+class UdpFrame:
+    """What recv(copy=False) returns, like a zmq Frame."""
+
+    def __init__(self, data):
+        self.bytes = data
+
+    def __len__(self):
+        return len(self.bytes)
+
+
+class UdpRadio:
+    """Sends to one peer like a connected zmq udp RADIO. The group header and data go out without being joined."""
+
+    def __init__(self, peer_ip, peer_port, max_part_size=4096):
+        self.max_part_size = max_part_size
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect((peer_ip, peer_port))
+        self.headers = {}
+        self.send_errors = 0
+
+    def send(self, data, group='direct'):
+        header = self.headers.get(group)
+        if header is None:
+            header = self.headers[group] = group_header(group)
+        try:
+            self.sock.sendmsg([header, data])
+        except ConnectionRefusedError:  # an ICMP from an earlier datagram, nobody was listening yet. Still UDP.
+            self.send_errors += 1
+
+    def close(self, linger=None):
+        self.sock.close()
+
+
+class UdpDish:
+    """Receives datagrams for one group on local_ip:port into buffer_count preallocated buffer_size buffers.
+
+    rcvbuf asks the kernel for a bigger socket buffer, which is what absorbs bursts while the receiver is busy.
+    Datagrams for other groups are dropped and counted in foreign.
+    """
+
+    def __init__(self, local_ip, port, group='direct', buffer_count=32, buffer_size=65536, rcvbuf=4 * 1024 * 1024,
+                 rcvtimeo=-1):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.sock.bind((local_ip, port))
+        self.sock.setblocking(False)
+        self.rcvtimeo = rcvtimeo  # milliseconds, -1 waits forever
+        self.header = group_header(group)
+        self.pool = bytearray(buffer_count * buffer_size)
+        pool = memoryview(self.pool)
+        self.buffers = [pool[i * buffer_size:(i + 1) * buffer_size] for i in range(buffer_count)]
+        self.lengths = [0] * buffer_count
+        self.received = 0
+        self.foreign = 0
+
+    def fileno(self):
+        """The socket's, for waiting on in an event loop or select."""
+        return self.sock.fileno()
+
+    def join(self, group):
+        self.header = group_header(group)
+
+    def _wait(self, timeout):
+        """Wait up to timeout seconds (None for ever) for the socket to be readable."""
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        return bool(readable)
+
+    def _read(self):
+        """recv_into as many buffers as there are datagrams waiting. Returns how many were filled."""
+        count = 0
+        recv_into = self.sock.recv_into
+        try:
+            for buffer in self.buffers:
+                self.lengths[count] = recv_into(buffer)
+                count += 1
+        except BlockingIOError:
+            pass
+        return count
+
+    def _is_ours(self, buffer, length):
+        header = self.header
+        if length < len(header) or buffer[0] != header[0] or buffer[1:len(header)] != header[1:]:
+            self.foreign += 1
+            return False
+        return True
+
+    def drain(self, feed, timeout=0.0):
+        """Read every waiting datagram, waiting up to timeout seconds for the first, and feed(buffer, start, end) each.
+
+        The buffer is only valid during the call: it gets reused for the next datagrams. Returns how many were read.
+        """
+        count = self._read()
+        if not count and timeout != 0 and self._wait(timeout):
+            count = self._read()
+        header_length = len(self.header)
+        for i in range(count):
+            buffer, length = self.buffers[i], self.lengths[i]
+            if self._is_ours(buffer, length):
+                feed(buffer, header_length, length)
+        self.received += count
+        return count
+
+    def recv(self, flags=0, copy=True):
+        timeout = 0 if flags & zmq.NOBLOCK else self.rcvtimeo
+        deadline = None if timeout < 0 else time.monotonic() + timeout / 1000
+        buffer = self.buffers[0]
+        while True:
+            try:
+                length = self.sock.recv_into(buffer)
+            except BlockingIOError:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0 or not self._wait(remaining):
+                    raise zmq.Again()
+                continue
+            self.received += 1
+            if self._is_ours(buffer, length):
+                data = bytes(buffer[len(self.header):length])
+                return data if copy else UdpFrame(data)
+
+    def close(self, linger=None):
+        self.sock.close()
+
+
+def udp_pair(local_ip, peer_ip, local_port, peer_port, **dish_kwargs):
+    """(radio, dish) sending to peer_ip:peer_port and receiving on local_ip:local_port."""
+    return UdpRadio(peer_ip, peer_port), UdpDish(local_ip, local_port, rcvtimeo=1000, **dish_kwargs)
@@ -1,8 +1,40 @@
+import itertools
+import logging
 import socket
+import struct
 import subprocess
+import threading
 import time
+import zlib
 import zmq
 
+from robonet import instrumentation
+from robonet.transport import open_pair
+
+_log = instrumentation.sampled_logger(__name__)
+_send_stage = instrumentation.stage('send')
+_reassemble_stage = instrumentation.stage('reassemble')
+_sent_messages = instrumentation.counter('send.messages')
+_sent_bytes = instrumentation.counter('send.bytes')
+_received_parts = instrumentation.counter('receive.parts')
+_broken_messages = instrumentation.counter('receive.broken')
+_bad_checksums = instrumentation.counter('receive.bad_checksum')
+
+# Set on a part's type byte when the part ends with a CRC32 of its type, uid and payload, and an end part's payload
+# also ends with a CRC32 of the whole message. Receivers check it when it's there, so senders can turn it on alone.
+CHECKSUM_FLAG = 0x80
+CHECKSUM_OVERHEAD = 8  # bytes per part to leave room for, the part's CRC and an end part's message CRC
+
+
+def part_checksum_ok(buffer, start, end):
+    """Whether the part in buffer[start:end] matches its trailing CRC32. buffer should be a memoryview."""
+    return end - start >= 6 and zlib.crc32(buffer[start:end - 4]) == struct.unpack_from('!I', buffer, end - 4)[0]
+
+
+def _drop_bad_part():
+    _bad_checksums.add()
+    _log(logging.WARNING, 'checksum', "Part failed its checksum. Dropping it and the message it belongs to.")
+
 def get_local_ip():
     """Get the local IPv4 address of the server."""
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -120,65 +152,94 @@ def client_udp_discovery(ctx, local_ip):
 
     return server_ip
 
-def server_unicast_communication(ctx, local_ip, client_ip, callback_loop):
-        """Start unicast communication between server and client."""
-        unicast_radio = ctx.socket(zmq.RADIO)
-        unicast_radio.setsockopt(zmq.LINGER, 0)
-        unicast_radio.setsockopt(zmq.CONFLATE, 1)
-        unicast_dish = ctx.socket(zmq.DISH)
-        unicast_dish.setsockopt(zmq.LINGER, 0)
-        unicast_dish.setsockopt(zmq.CONFLATE, 1)
-        unicast_dish.rcvtimeo = 1000
-
-        unicast_dish.bind(f"udp://{local_ip}:9998")
-        unicast_dish.join("direct")
-        unicast_radio.connect(f"udp://{client_ip}:9999")
-
-        print(f"Starting unicast communication with client at {client_ip}...")
-        callback_loop(unicast_radio, unicast_dish)
-
-        unicast_dish.close()
-        unicast_radio.close()
-
-def client_unicast_communication(ctx, local_ip, server_ip, callback_loop):
-    """Start unicast communication between client and server."""
-    unicast_radio = ctx.socket(zmq.RADIO)
-    unicast_radio.setsockopt(zmq.LINGER, 0)
-    unicast_radio.setsockopt(zmq.CONFLATE, 1)
-    unicast_dish = ctx.socket(zmq.DISH)
-    unicast_dish.setsockopt(zmq.LINGER, 0)
-    unicast_dish.setsockopt(zmq.CONFLATE, 1)
-    unicast_dish.rcvtimeo = 1000
-
-    unicast_dish.bind(f'udp://{local_ip}:9999')
-    unicast_dish.join('direct')
-    unicast_radio.connect(f'udp://{server_ip}:9998')
-
-    print(f"Starting unicast communication with server at {server_ip}...")
+def server_unicast_communication(ctx, local_ip, client_ip, callback_loop, transport='udp'):
+    """Start unicast communication between server and client, over any transport in transport.TRANSPORTS."""
+    unicast_radio, unicast_dish = open_pair(ctx, transport, 'server', local_ip, client_ip)
+
+    print(f"Starting {transport} unicast communication with client at {client_ip}...")
+    callback_loop(unicast_radio, unicast_dish)
+
+    unicast_dish.close()
+    unicast_radio.close()
+
+def client_unicast_communication(ctx, local_ip, server_ip, callback_loop, transport='udp'):
+    """Start unicast communication between client and server, over any transport in transport.TRANSPORTS."""
+    unicast_radio, unicast_dish = open_pair(ctx, transport, 'client', local_ip, server_ip)
+
+    print(f"Starting {transport} unicast communication with server at {server_ip}...")
     callback_loop(unicast_radio, unicast_dish)
 
     unicast_dish.close()
     unicast_radio.close()
 
 
-def send_burst(critical_section_lock, radio_socket, message_uid, message_parts, group='direct'):
+def chunk_message(message, part_size=4096):
+    """Split a packed message into parts that each fit in one datagram. A part_size of None doesn't split."""
+    if part_size is None:
+        return [message]
+    return [message[i:i + part_size] for i in range(0, len(message), part_size)] or [b'']
+
+
+def _checksummed(part):
+    """Flag a part as checksummed and append its CRC32."""
+    part = bytes([part[0] | CHECKSUM_FLAG]) + part[1:]
+    return part + struct.pack('!I', zlib.crc32(part))
+
+
+def send_burst(critical_section_lock, radio_socket, message_uid, message_parts, group='direct', checksum=False):
+    frame = _checksummed if checksum else (lambda part: part)
     with critical_section_lock:  # threads + asyncio...
         if len(message_parts)>1:
             # Send start part
             start_part = b"\x01" + message_uid + message_parts[0]  # start_byte, uid_byte, rest_of_bytes
-            radio_socket.send(start_part, group=group)
+            radio_socket.send(frame(start_part), group=group)
 
             # Send middle parts
             for part in message_parts[1:-1]:
                 middle_part = b"\x02" + message_uid + part  # middle_byte, uid_byte, rest_of_bytes
-                radio_socket.send(middle_part, group=group)
+                radio_socket.send(frame(middle_part), group=group)
 
             # Send end part
             end_part = b"\x03" + message_uid + message_parts[-1]  # end_byte, uid_byte, rest_of_bytes
-            radio_socket.send(end_part, group=group)
+            if checksum:  # the whole message's CRC, so parts of different messages can't be put together
+                message_crc = 0
+                for part in message_parts:
+                    message_crc = zlib.crc32(part, message_crc)
+                end_part += struct.pack('!I', message_crc)
+            radio_socket.send(frame(end_part), group=group)
         else:
             full_part = b"\x04" + message_uid + message_parts[-1]  # end_byte, uid_byte, rest_of_bytes
-            radio_socket.send(full_part, group=group)
+            radio_socket.send(frame(full_part), group=group)
+
+class BurstSender:
+    """Callable that sends packed messages through a radio with send_burst, numbering them with a rolling uid.
+
+    Parts are part_size bytes, or the radio's max_part_size if it has one and part_size isn't given. Stream
+    transports have a max_part_size of None, and their messages go out in one part. With checksum, every part
+    carries a CRC32, and the receiving MessageHandler drops corrupted parts before anything is decoded.
+    Likewise, if the radio has a lock (session.SwappableSocket does) and no critical_section_lock is given, bursts
+    hold that, so every BurstSender on the radio takes turns.
+    """
+
+    def __init__(self, radio_socket, critical_section_lock=None, group='direct', part_size=None, checksum=False):
+        self.radio_socket = radio_socket
+        self.critical_section_lock = critical_section_lock or getattr(radio_socket, 'lock', None) or threading.Lock()
+        self.group = group
+        self.part_size = part_size if part_size is not None else getattr(radio_socket, 'max_part_size', 4096)
+        if checksum and self.part_size is not None:
+            self.part_size -= CHECKSUM_OVERHEAD
+        self.checksum = checksum
+        self.message_uids = itertools.count()
+
+    def __call__(self, message):
+        start = _send_stage.begin()
+        uid = bytes([next(self.message_uids) % 256])
+        send_burst(self.critical_section_lock, self.radio_socket, uid, chunk_message(message, self.part_size),
+                   self.group, self.checksum)
+        _sent_messages.add()
+        _sent_bytes.add(len(message))
+        _send_stage.end(start)
+
 
 async def receive_burst(critical_section_lock, dish_socket):
     message_parts = []
@@ -202,7 +263,8 @@ async def receive_burst(critical_section_lock, dish_socket):
                     message_parts.append(payload)
                     # Reconstruct and process full message
                     full_message = b''.join(message_parts)
-                    print(f"Received complete message with UID {message_uid}: {full_message}")
+                    _log(logging.DEBUG, 'complete', "Received complete message with UID %r: %d bytes", message_uid,
+                         len(full_message))
                     return full_message, 0
                 elif part_type == b'\x04':
                     message_uid = uid_byte
@@ -210,13 +272,251 @@ async def receive_burst(critical_section_lock, dish_socket):
                     full_message = b''.join(message_parts)
                     return full_message, 0
                 elif uid_byte != message_uid:
-                    print("message corrupted or alternative message interleaved. part will be appended to broken message output for error handling.")
+                    _log(logging.WARNING, 'interleaved', "Message corrupted or another message interleaved. The part "
+                         "will be appended to the broken message output for error handling.")
                     full_message = b''.join(message_parts)
                     return full_message, part
                 else:
-                    print('start byte corrupted. Exiting.')
+                    _log(logging.WARNING, 'start', "Start byte corrupted. Exiting.")
                     full_message = b''.join(message_parts)
                     return full_message, part
         except zmq.error.Again:
-            print("No message received (timeout).")
+            _log(logging.DEBUG, 'timeout', "No message received (timeout).")
             await asyncio.sleep(0.01)
+
+
+class MessageHandler:
+    def __init__(self, handle_byte_obj):
+        self.state = self.wait_for_start  # Set initial state as the wait_for_start function
+        self.message_uid = None
+        self.message_parts = []
+        self.handle_byte_obj = handle_byte_obj
+        self.checksummed = False  # whether the message being received has checksums
+        self.part_checksummed = False
+
+    def reset(self):
+        """Reset the state machine to the initial state."""
+        self.state = self.wait_for_start
+        self.message_uid = None
+        self.message_parts = []
+        self.checksummed = False
+
+    def transition(self, msg):
+        """Call the current state's handler."""
+        start = _reassemble_stage.begin()
+        _received_parts.add()
+        self.part_checksummed = bool(msg[:1] and msg[0] & CHECKSUM_FLAG)
+        if self.part_checksummed:
+            if part_checksum_ok(memoryview(msg), 0, len(msg)):
+                self.state(bytes([msg[0] & ~CHECKSUM_FLAG]) + msg[1:-4])
+            else:
+                _drop_bad_part()
+                self.reset()
+        else:
+            self.state(msg)
+        _reassemble_stage.end(start)
+
+    def _handle_partial(self, full_message):
+        """Pass on what we have of a broken message, for error handling. Unless it's checksummed: then we know
+        it's no good, so it's dropped here."""
+        if not self.checksummed:
+            self.handle_byte_obj(full_message)
+
+    def _handle_complete(self, last_payload):
+        if self.part_checksummed != self.checksummed or self.checksummed and len(last_payload) < 4:
+            _drop_bad_part()  # the end of some other message, or too short to carry the message's CRC
+            return
+        if self.checksummed:
+            message_crc = struct.unpack_from('!I', last_payload, len(last_payload) - 4)[0]
+            self.message_parts.append(last_payload[:-4])
+            full_message = b''.join(self.message_parts)
+            if zlib.crc32(full_message) != message_crc:
+                _drop_bad_part()
+                return
+        else:
+            self.message_parts.append(last_payload)
+            full_message = b''.join(self.message_parts)
+        self.handle_byte_obj(full_message)
+
+    def wait_for_start(self, msg):
+        """Handles the initial state waiting for the start part."""
+        part_type = msg[0:1]
+        uid_byte = msg[1:2]
+        payload = msg[2:]
+
+        if part_type == b'\x01':  # Start part
+            self.message_uid = uid_byte
+            self.message_parts = [payload]
+            self.checksummed = self.part_checksummed
+            self.state = self.receive_parts  # Transition to RECEIVE_PARTS state
+            return True  # block
+        elif part_type == b'\x04':  # Tiny message
+            self.handle_byte_obj(msg[2:])
+            self.reset()
+            return False  # non-block
+        else:
+            _broken_messages.add()
+            _log(logging.WARNING, 'start', "Start byte corrupted or missing. Dropping message.")
+            self.reset()
+            return False  # non-block
+
+    def receive_parts(self, msg):
+        """Handles receiving parts of a message."""
+        part_type = msg[0:1]
+        uid_byte = msg[1:2]
+        payload = msg[2:]
+
+        if uid_byte == self.message_uid:
+            if part_type == b'\x02':  # Middle part
+                self.message_parts.append(payload)
+                return True  # block
+            elif part_type == b'\x03':  # End part
+                self._handle_complete(payload)
+                self.reset()
+                return False  # non-block
+            elif part_type == b'\x01':  # New message, part missed
+                _broken_messages.add()
+                _log(logging.WARNING, 'missed end', "New multi-part message received in the middle of another. "
+                     "Handling what we have.")
+                full_message = b''.join(self.message_parts)
+                self._handle_partial(full_message)
+                self.message_uid = uid_byte
+                self.message_parts = [payload]
+                self.checksummed = self.part_checksummed
+                return True  # block
+            elif part_type == b'\x04':  # Tiny message (end missed)
+                _broken_messages.add()
+                _log(logging.WARNING, 'missed end', "New single-part message received in the middle of another. "
+                     "Handling what we have.")
+                full_message = b''.join(self.message_parts)
+                self._handle_partial(full_message)
+                self.handle_byte_obj(msg[2:])
+                self.reset()
+                return False  # non-block
+        else:
+            _broken_messages.add()
+            _log(logging.WARNING, 'interleaved', "Messages corrupted or interleaved. Handling what we have.")
+            self.handle_message_corruption()
+
+    def handle_message_corruption(self):
+        """Handles corrupted messages."""
+        full_message = b''.join(self.message_parts)
+        self._handle_partial(full_message)
+        self.reset()
+        return False  # non-block
+
+
+class BufferedMessageHandler:
+    """MessageHandler that reassembles into one preallocated buffer, reading parts through memoryviews.
+
+    feed(buffer, start, end) takes a part as a region of a buffer the caller reuses, like UdpDish.drain's, so parts
+    are never sliced into new bytes: the header is read by indexing and the payload copied straight into the
+    reassembly buffer. The buffer doubles when a message doesn't fit. Whole messages are handed on as bytes, since
+    unpacked objects keep references into them. Broken and checksummed messages are handled exactly as
+    MessageHandler handles them.
+    """
+
+    START, MIDDLE, END, SINGLE = 1, 2, 3, 4
+
+    def __init__(self, handle_byte_obj, initial_size=1024 * 1024):
+        self.handle_byte_obj = handle_byte_obj
+        self.buffer = bytearray(initial_size)
+        self.view = memoryview(self.buffer)
+        self.used = 0
+        self.message_uid = None
+        self.receiving = False
+        self.checksummed = False
+
+    def reset(self):
+        self.used = 0
+        self.message_uid = None
+        self.receiving = False
+        self.checksummed = False
+
+    def _append(self, buffer, start, end):
+        length = end - start
+        if self.used + length > len(self.buffer):
+            size = len(self.buffer)
+            while self.used + length > size:
+                size *= 2
+            grown = bytearray(size)
+            grown[:self.used] = self.view[:self.used]
+            self.view.release()
+            self.buffer, self.view = grown, memoryview(grown)
+        self.view[self.used:self.used + length] = buffer[start:end]
+        self.used += length
+
+    def _handle_partial(self):
+        if not self.checksummed:  # a checksummed one can't be any good
+            self.handle_byte_obj(bytes(self.view[:self.used]))
+
+    def _handle_complete(self, checksummed):
+        used = self.used
+        if checksummed != self.checksummed:
+            _drop_bad_part()
+            return
+        if self.checksummed:
+            used -= 4
+            if used < 0 or zlib.crc32(self.view[:used]) != struct.unpack_from('!I', self.view, used)[0]:
+                _drop_bad_part()
+                return
+        self.handle_byte_obj(bytes(self.view[:used]))
+
+    def _start(self, uid, checksummed, buffer, start, end):
+        self.message_uid = uid
+        self.checksummed = checksummed
+        self.used = 0
+        self._append(buffer, start + 2, end)
+        self.receiving = True
+
+    def transition(self, msg):
+        self.feed(memoryview(msg), 0, len(msg))
+
+    def feed(self, buffer, start, end):
+        begin = _reassemble_stage.begin()
+        _received_parts.add()
+        part_type = buffer[start] if end > start else 0
+        checksummed = bool(part_type & CHECKSUM_FLAG)
+        if checksummed:
+            if not part_checksum_ok(buffer, start, end):
+                _drop_bad_part()
+                self.reset()
+                _reassemble_stage.end(begin)
+                return
+            part_type &= ~CHECKSUM_FLAG
+            end -= 4
+        uid = buffer[start + 1] if end > start + 1 else None
+        if not self.receiving:
+            if part_type == self.START and uid is not None:
+                self._start(uid, checksummed, buffer, start, end)
+            elif part_type == self.SINGLE and uid is not None:
+                self.handle_byte_obj(bytes(buffer[start + 2:end]))
+            else:
+                _broken_messages.add()
+                _log(logging.WARNING, 'start', "Start byte corrupted or missing. Dropping message.")
+        elif uid == self.message_uid:
+            if part_type == self.MIDDLE:
+                self._append(buffer, start + 2, end)
+            elif part_type == self.END:
+                self._append(buffer, start + 2, end)
+                self._handle_complete(checksummed)
+                self.reset()
+            elif part_type == self.START:
+                _broken_messages.add()
+                _log(logging.WARNING, 'missed end', "New multi-part message received in the middle of another. "
+                     "Handling what we have.")
+                self._handle_partial()
+                self._start(uid, checksummed, buffer, start, end)
+            elif part_type == self.SINGLE:
+                _broken_messages.add()
+                _log(logging.WARNING, 'missed end', "New single-part message received in the middle of another. "
+                     "Handling what we have.")
+                self._handle_partial()
+                self.handle_byte_obj(bytes(buffer[start + 2:end]))
+                self.reset()
+        else:
+            _broken_messages.add()
+            _log(logging.WARNING, 'interleaved', "Messages corrupted or interleaved. Handling what we have.")
+            self._handle_partial()
+            self.reset()
+        _reassemble_stage.end(begin)
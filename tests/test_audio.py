@@ -0,0 +1,105 @@
+import unittest
+import numpy as np
+from robonet.audio import SampleRingBuffer, StftFramer, MicFftStreamer
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import AudioBuffer
+
+
+class TestSampleRingBuffer(unittest.TestCase):
+
+    def test_wraparound(self):
+        ring = SampleRingBuffer(8, 1)
+        ring.write(np.arange(6, dtype=np.float32)[:, np.newaxis])
+        ring.advance(4)
+        ring.write(np.arange(6, 11, dtype=np.float32)[:, np.newaxis])
+
+        out = np.zeros((7, 1), dtype=np.float32)
+        ring.peek(out)
+        np.testing.assert_array_equal(out[:, 0], np.arange(4, 11))
+        self.assertEqual(ring.available(), 7)
+
+    def test_overflow_is_dropped_and_counted(self):
+        ring = SampleRingBuffer(8, 2)
+        self.assertTrue(ring.write(np.ones((6, 2), dtype=np.float32)))
+        self.assertFalse(ring.write(np.ones((6, 2), dtype=np.float32)))
+        self.assertEqual(ring.overflows, 1)
+        self.assertEqual(ring.dropped_samples, 6)
+        self.assertEqual(ring.available(), 6)
+
+
+class TestStft(unittest.TestCase):
+
+    def test_framer_finds_tone(self):
+        framer = StftFramer(1024, 1)
+        framer.frame[:, 0] = np.sin(2 * np.pi * 64 * np.arange(1024) / 1024)
+        spectrum = framer.transform()
+        self.assertEqual(spectrum.shape, (512, 1))
+        self.assertEqual(spectrum.dtype, np.complex64)
+        self.assertEqual(np.argmax(np.abs(spectrum[:, 0])), 64)
+
+    def test_streamer_overlaps_frames(self):
+        sent = []
+        streamer = MicFftStreamer(sent.append, sample_rate=4800, sends_per_sec=24, channels=2, fft_size=None,
+                                  max_backlog_frames=4)
+        block = np.zeros((streamer.hop_size, 2), dtype=np.float32)
+        for _ in range(5):
+            streamer.audio_callback(block, len(block), None, None)
+
+        self.assertEqual(streamer.process_available(), 4)  # 5 hops of audio, 2 hop frames
+        obj = unpack_obj(sent[0])
+        self.assertEqual(obj.fft_data.shape, (streamer.hop_size, 2))
+        self.assertEqual(obj.sample_rate, 4800)
+
+    def test_streamer_sends_768_bins_by_default(self):
+        sent = []
+        streamer = MicFftStreamer(sent.append)
+        streamer.audio_callback(np.zeros((streamer.frame_size, 1), dtype=np.float32), streamer.frame_size, None, None)
+        streamer.process_available()
+        self.assertEqual(unpack_obj(sent[0]).fft_data.shape, (768, 1))
+
+    def test_streamer_skips_stale_frames(self):
+        sent = []
+        streamer = MicFftStreamer(sent.append, sample_rate=4800, sends_per_sec=24, max_backlog_frames=1)
+        for _ in range(10):
+            streamer.audio_callback(np.zeros((streamer.hop_size, 1), dtype=np.float32), streamer.hop_size, None, None)
+
+        self.assertEqual(streamer.process_available(), 2)
+        self.assertEqual(streamer.stats()['frames_skipped'], 7)
+
+
+class TestSpectrumEncoding(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.fft_data = (rng.normal(size=(512, 2)) + 1j * rng.normal(size=(512, 2))).astype(np.complex64)
+
+    def round_trip(self, **kwargs):
+        packed = pack_obj(AudioBuffer(44800, 24, self.fft_data, **kwargs))
+        return packed, unpack_obj(packed)
+
+    def test_complex64_is_lossless(self):
+        _, unpacked = self.round_trip()
+        np.testing.assert_array_equal(self.fft_data, unpacked.fft_data)
+
+    def test_quantized_encodings_are_smaller_and_close(self):
+        raw_size = len(self.round_trip()[0])
+        for encoding, max_ratio, rtol in [(AudioBuffer.COMPLEX32, 0.55, 1e-3),
+                                          (AudioBuffer.LOG_U16, 0.55, 1e-3),
+                                          (AudioBuffer.LOG_U8, 0.3, 0.05)]:
+            packed, unpacked = self.round_trip(encoding=encoding)
+            self.assertLess(len(packed), raw_size * max_ratio)
+            self.assertEqual(unpacked.fft_data.dtype, np.complex64)
+            np.testing.assert_allclose(np.abs(unpacked.fft_data), np.abs(self.fft_data), rtol=rtol, atol=1e-3)
+            phase_error = np.angle(unpacked.fft_data * np.conj(self.fft_data))
+            self.assertLess(np.abs(phase_error).max(), 0.02)
+
+    def test_max_freq_cuts_and_pads_bins(self):
+        packed, unpacked = self.round_trip(max_freq=5600)  # bins are 43.75Hz apart
+        self.assertLess(len(packed), len(self.round_trip()[0]) / 3)
+        self.assertEqual(unpacked.fft_data.shape, self.fft_data.shape)
+        np.testing.assert_array_equal(unpacked.fft_data[:128], self.fft_data[:128])
+        self.assertFalse(unpacked.fft_data[128:].any())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+from robonet.benchmark import StageTimer, SyntheticAudio, SyntheticImu, SyntheticMjpeg, run_benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_stage_timer_excludes_nested_stages(self):
+        timer = StageTimer()
+        timer.start('outer')
+        for _ in range(10):
+            timer.start('inner')
+            sum(range(100000))
+            timer.stop()
+        timer.stop()
+        self.assertEqual(timer.calls, {'inner': 10, 'outer': 1})
+        self.assertLess(timer.cpu['outer'], timer.cpu['inner'])
+
+    def test_inproc_loopback(self):
+        sources = [SyntheticMjpeg(fps=20, width=160, height=120, sequence_length=4), SyntheticAudio(sends_per_sec=10),
+                   SyntheticImu(hz=50)]
+        report = run_benchmark(sources, seconds=0.5, transport='inproc', drain_seconds=0.2)
+        streams = report['streams']
+        self.assertEqual(set(streams), {'MJpegCamFrame/0', 'AudioBuffer/0', 'IMUBuffer/0'})
+        self.assertEqual(streams['MJpegCamFrame/0']['received'], report['sent']['mjpeg']['messages'])
+        self.assertEqual(streams['IMUBuffer/0']['received'], report['sent']['imu']['messages'])
+        for stream in streams.values():
+            self.assertEqual(stream['lost'], 0)
+            self.assertGreaterEqual(stream['p99_ms'], stream['p50_ms'])
+        self.assertGreater(report['received_mb_per_s'], 0)
+        self.assertIn('send', report['stages'])
+        self.assertIn('receive.recv', report['stages'])
+
+    def test_receiver_failure_is_raised(self):
+        def broken_receive_objs(*args, **kwargs):
+            async def receive_some_obj(radio, dish):
+                raise ValueError('receiver broke')
+            return receive_some_obj
+
+        with mock.patch('robonet.benchmark.receive_objs', broken_receive_objs):
+            with self.assertRaisesRegex(ValueError, 'receiver broke'):
+                run_benchmark([SyntheticImu(hz=50)], seconds=0.1, transport='inproc', drain_seconds=0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import struct
+import unittest
+
+import numpy as np
+
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import AudioBuffer, MJpegCamFrame, TensorBuffer
+from robonet.util import BufferedMessageHandler, BurstSender, MessageHandler, _checksummed
+
+
+class _Radio:
+    max_part_size = 1000
+
+    def __init__(self):
+        self.parts = []
+
+    def send(self, data, group=None):
+        self.parts.append(bytes(data))
+
+
+def handlers(received):
+    return [MessageHandler(received.append), BufferedMessageHandler(received.append)]
+
+
+class TestChecksums(unittest.TestCase):
+
+    def sent(self, *messages, checksum=True):
+        radio = _Radio()
+        send = BurstSender(radio, checksum=checksum)
+        for message in messages:
+            send(message)
+        return radio.parts
+
+    def test_round_trip(self):
+        messages = [os.urandom(5000), b'tiny', os.urandom(992)]
+        parts = self.sent(*messages)
+        self.assertTrue(all(len(part) <= _Radio.max_part_size + 2 for part in parts))
+        for received_by in ('MessageHandler', 'BufferedMessageHandler'):
+            received = []
+            handler = handlers(received)[received_by == 'BufferedMessageHandler']
+            for part in parts:
+                handler.transition(part)
+            self.assertEqual(received, messages, received_by)
+
+    def test_corrupted_part_drops_the_message(self):
+        parts = self.sent(os.urandom(5000), b'next')
+        corrupted = bytearray(parts[2])
+        corrupted[100] ^= 0x01
+        parts[2] = bytes(corrupted)
+        for i in range(2):
+            received = []
+            handler = handlers(received)[i]
+            for part in parts:
+                handler.transition(part)
+            self.assertEqual(received, [b'next'])
+
+    def test_parts_of_different_messages_dont_combine(self):
+        first = self.sent(os.urandom(3000))
+        second = self.sent(os.urandom(3000))  # same uids, since each BurstSender starts at 0
+        spliced = first[:-1] + second[-1:]
+        for i in range(2):
+            received = []
+            handler = handlers(received)[i]
+            for part in spliced:
+                handler.transition(part)
+            self.assertEqual(received, [])
+
+    def test_lost_end_isnt_handed_on(self):
+        parts = self.sent(os.urandom(3000), os.urandom(3000))
+        del parts[3]  # end of the first message
+        for i in range(2):
+            received = []
+            handler = handlers(received)[i]
+            for part in parts:
+                handler.transition(part)
+            self.assertEqual(received, [])  # what arrived of the first is known to be incomplete, so it's dropped
+
+    def test_end_without_checksum_is_dropped(self):
+        for sequence in ([_checksummed(b'\x01\x05abc'), b'\x03\x05'],
+                         [_checksummed(b'\x01\x05abc'), b'\x03\x05defghijk'],
+                         [b'\x01\x05abc', _checksummed(b'\x03\x05defghijk')]):
+            for i in range(2):
+                received = []
+                handler = handlers(received)[i]
+                for part in sequence + [b'\x04\x06next']:
+                    handler.transition(part)
+                self.assertEqual(received, [b'next'])
+
+
+class TestBounds(unittest.TestCase):
+
+    def test_huge_spectrum(self):
+        message = bytearray(pack_obj(AudioBuffer(fft_data=np.zeros(16, np.complex64))))
+        header = message.index(struct.pack('!BII', AudioBuffer.COMPLEX64, 16, 1))
+        struct.pack_into('!I', message, header + 1, 0xFFFFFFFF)  # total_bins
+        with self.assertRaises(ValueError):
+            unpack_obj(bytes(message))
+
+    def test_huge_tensor(self):
+        message = bytearray(pack_obj(TensorBuffer([np.zeros((4, 4), np.float32)])))
+        shape_at = message.index(struct.pack('!III', 2, 4, 4))
+        struct.pack_into('!II', message, shape_at + 4, 0xFFFFFFFF, 0xFFFFFFFF)
+        with self.assertRaises(ValueError):
+            unpack_obj(bytes(message))
+
+    def test_truncated(self):
+        message = pack_obj(MJpegCamFrame(0, 0, os.urandom(1000)))
+        with self.assertRaises(ValueError):
+            unpack_obj(message[:600])
+
+    def test_only_buffer_classes(self):
+        with self.assertRaises(TypeError):
+            unpack_obj(struct.pack('!I', 2) + b'np')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import random
+import unittest
+
+from robonet.clock_sync import ClockSync
+from robonet.link_monitor import LinkMonitor
+from robonet.util import BurstSender
+from tests.test_link_monitor import Pipe
+
+
+class RemoteClock:
+    def __init__(self, offset, drift):
+        self.offset = offset
+        self.drift = drift
+
+    def at(self, local_time):
+        return local_time * (1 + self.drift) + self.offset
+
+
+class TestClockSync(unittest.TestCase):
+
+    def exchanges(self, sync, remote, count, interval, rng, start=0.0):
+        """Wi-Fi ish: a couple of ms each way, sometimes much more, one way or the other."""
+        t = start
+        for _ in range(count):
+            out = 0.001 + rng.expovariate(1 / 0.002)
+            back = 0.001 + rng.expovariate(1 / 0.002)
+            sync.add_exchange(t, remote.at(t + out), t + out + back)
+            t += interval
+        return t
+
+    def test_unsynced_passes_through(self):
+        sync = ClockSync()
+        self.assertFalse(sync.synced)
+        self.assertEqual(sync.to_local_time(12.5), 12.5)
+        self.assertEqual(sync.to_local_time_with_error(12.5)[1], float('inf'))
+
+    def test_offset_within_a_millisecond(self):
+        rng = random.Random(1)
+        remote = RemoteClock(1234.5, 0.0)
+        sync = ClockSync()
+        self.exchanges(sync, remote, 8, 0.05, rng)
+        offset, error = sync.offset_at(0.5)
+        self.assertLess(abs(offset - 1234.5), 0.001)
+        self.assertLessEqual(abs(offset - 1234.5), error)
+        self.assertAlmostEqual(sync.to_local_time(remote.at(0.3)), 0.3, delta=0.001)
+
+    def test_drift(self):
+        rng = random.Random(2)
+        remote = RemoteClock(-50.0, 40e-6)
+        sync = ClockSync()
+        end = self.exchanges(sync, remote, 60, 0.5, rng)
+        self.assertLess(sync.drift_error, 100e-6)
+        self.assertLessEqual(abs(sync.drift - 40e-6), sync.drift_error)
+        for local_time in (end, end + 10.0):
+            remote_time = remote.at(local_time)
+            local, error = sync.to_local_time_with_error(remote_time)
+            self.assertLess(abs(local - local_time), 0.001)
+            self.assertLessEqual(abs(local - local_time), error)
+            self.assertAlmostEqual(sync.to_remote_time(local_time), remote_time, delta=0.001)
+
+    def test_restart_starts_over(self):
+        rng = random.Random(3)
+        sync = ClockSync()
+        end = self.exchanges(sync, RemoteClock(100.0, 0.0), 10, 0.5, rng)
+        end = self.exchanges(sync, RemoteClock(-5.0, 0.0), 1, 0.5, rng, end)
+        self.assertAlmostEqual(sync.offset_at(end)[0], 100.0, delta=0.01)  # one odd exchange isn't a jump
+        self.exchanges(sync, RemoteClock(-5.0, 0.0), 5, 0.5, rng, end)
+        self.assertEqual(sync.resets, 1)
+        self.assertAlmostEqual(sync.offset_at(end)[0], -5.0, delta=0.01)
+
+    def test_link_monitor_startup_burst(self):
+        self.now = 0.0
+        sync = ClockSync(startup_samples=4, startup_interval=0.05)
+        base = LinkMonitor(interval=0.5, clock=lambda: self.now, dump_interval=None, clock_sync=sync)
+        robot = LinkMonitor(clock=lambda: self.now + 77.0, dump_interval=None)
+        to_robot, to_base = Pipe(), Pipe()
+        base.attach(BurstSender(to_robot))
+        robot.attach(BurstSender(to_base))
+        pings = []
+        while self.now < 1.0:
+            before = base.pings_sent
+            base.maybe_ping()
+            if base.pings_sent > before:
+                pings.append(self.now)
+            self.now += 0.002
+            robot.poll(to_robot)
+            self.now += 0.002
+            base.poll(to_base)
+            self.now += 0.006
+        self.assertTrue(all(b - a < 0.1 for a, b in zip(pings, pings[1:4])))
+        self.assertGreater(pings[5] - pings[4], 0.4)
+        self.assertAlmostEqual(sync.to_local_time(robot.clock()), self.now, delta=0.001)
+        self.assertTrue(base.snapshot()['clock']['synced'])
+
+
+if __name__ == '__main__':
+    unittest.main()
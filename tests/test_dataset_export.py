@@ -0,0 +1,92 @@
+import os
+import tempfile
+import time
+import unittest
+
+import cv2
+import numpy as np
+
+from robonet.buffers.buffer_handling import MessageMeta, pack_obj
+from robonet.buffers.buffer_objects import AudioBuffer, MJpegCamFrame
+from robonet.dataset_export import export, load_manifest, load_stream
+from robonet.recording import Recorder
+
+
+def jpeg(value, width=32, height=24):
+    ok, data = cv2.imencode('.jpg', np.full((height, width, 3), value, np.uint8))
+    return data.tobytes()
+
+
+class TestDatasetExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.recording_dir = os.path.join(self.tmp.name, 'recording')
+        self.out_dir = os.path.join(self.tmp.name, 'dataset')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def record(self, start, count):
+        with Recorder(self.recording_dir, segment_size=4000) as recorder:
+            for i in range(start, start + count):
+                frame = MJpegCamFrame(0, 0, jpeg(i * 10), 0, float(i))
+                recorder.record(pack_obj(frame, MessageMeta(0, i, float(i), float(i))), timestamp=100.0 + i)
+                audio = AudioBuffer(fft_data=np.full(16, i, np.complex64))
+                recorder.record(pack_obj(audio), timestamp=100.5 + i)
+
+    def test_export_and_resume(self):
+        self.record(0, 10)
+        manifest = export(self.recording_dir, self.out_dir, processes=2)
+        first_segments = set(manifest['segments'])
+
+        frames, frame_times = load_stream(self.out_dir, 'MJpegCamFrame/0')
+        frames = np.concatenate(frames)
+        self.assertEqual(frames.shape, (10, 24, 32, 3))
+        np.testing.assert_array_equal(frame_times, 100.0 + np.arange(10))
+        self.assertLess(abs(int(frames[3].mean()) - 30), 3)
+
+        spectra, spectrum_times = load_stream(self.out_dir, 'AudioBuffer/0')
+        spectra = np.concatenate(spectra)
+        self.assertEqual(spectra.dtype, np.complex64)
+        np.testing.assert_array_equal(spectra[:, 0].real, np.arange(10))
+        np.testing.assert_array_equal(spectrum_times, 100.5 + np.arange(10))
+
+        # a second recording session adds segments, and only those get decoded
+        self.record(10, 5)
+        first_file = os.path.join(self.out_dir, 'MJpegCamFrame_0', '000000.npy')
+        os.utime(first_file, (0, 0))
+        manifest = export(self.recording_dir, self.out_dir, processes=2)
+        self.assertTrue(first_segments < set(manifest['segments']))
+        self.assertEqual(load_manifest(self.out_dir), manifest)
+        self.assertEqual(os.path.getmtime(first_file), 0)
+        frames, frame_times = load_stream(self.out_dir, 'MJpegCamFrame/0')
+        self.assertEqual(sum(len(array) for array in frames), 15)
+        np.testing.assert_array_equal(frame_times, 100.0 + np.arange(15))
+
+    def test_skips_live_segment_and_corrupt_frames(self):
+        recorder = Recorder(self.recording_dir, segment_size=1 << 20, fsync='always')
+        recorder.record(pack_obj(MJpegCamFrame(0, 0, jpeg(50), 0, 0.0)), timestamp=1.0)
+        recorder.close()
+        recorder = Recorder(self.recording_dir, segment_size=1 << 20, fsync='always')
+        recorder.record(pack_obj(MJpegCamFrame(0, 0, jpeg(60), 0, 0.0)), timestamp=2.0)
+        recorder.record(pack_obj(MJpegCamFrame(0, 0, b'not a jpeg', 0, 0.0)), timestamp=3.0)
+        recorder.record(pack_obj(MJpegCamFrame(0, 0, jpeg(70, 16, 16), 0, 0.0)), timestamp=4.0)
+        while recorder.recorded < 3:
+            time.sleep(0.001)
+        recorder._segment.sync()
+
+        manifest = export(self.recording_dir, self.out_dir, processes=1)
+        self.assertEqual(list(manifest['segments']), ['0'])  # segment 1 is still being written
+
+        recorder.close()
+        manifest = export(self.recording_dir, self.out_dir, processes=1)
+        self.assertEqual(manifest['segments']['1']['MJpegCamFrame/0']['count'], 1)
+        self.assertEqual(manifest['segments']['1']['MJpegCamFrame/0']['skipped'], 2)
+        frames, frame_times = load_stream(self.out_dir, 'MJpegCamFrame/0')
+        self.assertEqual([len(array) for array in frames], [1, 1])
+        np.testing.assert_array_equal(frame_times, [1.0, 2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import socket
+import threading
+import time
+import unittest
+from robonet.discovery import DiscoveryServer, DiscoveryClient, PeerCache, pack_udp_group, unpack_udp_group
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class TestDiscovery(unittest.TestCase):
+    """Everything over loopback, so no multicast capable network is needed."""
+
+    def setUp(self):
+        server_port, client_port = free_port(), free_port()
+        self.server = DiscoveryServer('127.0.0.1', server_port, client_port, group_addr='127.0.0.1',
+                                      cache=PeerCache(None))
+        self.client = DiscoveryClient('127.0.0.1', client_port, server_port, group_addr='127.0.0.1',
+                                      cache=PeerCache(None))
+
+    def run_server(self, results):
+        results['client_ip'] = self.server.discover(timeout=5)
+        results['server_done'] = time.monotonic()
+
+    def test_group_framing(self):
+        self.assertEqual(unpack_udp_group(pack_udp_group('discovery', b'hi')), ('discovery', b'hi'))
+
+    def test_both_up(self):
+        results = {}
+        server_thread = threading.Thread(target=self.run_server, args=(results,))
+        server_thread.start()
+        self.assertEqual(self.client.discover(timeout=5), '127.0.0.1')
+        server_thread.join()
+
+        self.assertEqual(results['client_ip'], '127.0.0.1')
+        self.assertLess(self.server.last_duration, 0.1)
+
+    def test_reconnect_fast_path(self):
+        self.client.cache.set('server', '127.0.0.1')
+        self.server.backoff.initial_interval = 0.5  # without the fast path, the client would wait ~0.5s for a ping
+
+        results = {}
+        server_thread = threading.Thread(target=self.run_server, args=(results,))
+        server_thread.start()
+        time.sleep(0.1)  # server pinged once already, and is backing off
+
+        client_start = time.monotonic()
+        self.assertEqual(self.client.discover(timeout=5), '127.0.0.1')
+        server_thread.join()
+
+        self.assertLess(results['server_done'] - client_start, 0.1)
+        self.assertLess(self.client.last_duration, 0.1)
+        self.assertTrue(self.client.peer_was_cached)
+
+    def test_rediscovery_next_to_a_dish(self):
+        # a session's DISH, bound to local_ip on the server's port, gets unicast sent to a wildcard bound socket
+        dish = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        dish.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        dish.bind(('127.0.0.1', self.server.listen_port))
+        self.server.bind_addr = '127.0.0.1'
+        try:
+            self.client.cache.set('server', '127.0.0.1')
+            results = {}
+            server_thread = threading.Thread(target=self.run_server, args=(results,))
+            server_thread.start()
+            self.assertEqual(self.client.discover(timeout=5), '127.0.0.1')
+            server_thread.join()
+            self.assertEqual(results['client_ip'], '127.0.0.1')
+        finally:
+            dish.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import numpy as np
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import CVCamFrame
+from robonet.frame_encoding import FrameEncoderPool
+
+
+def gradient_image(shape=(240, 320, 3), offset=0):
+    y, x = np.mgrid[0:shape[0], 0:shape[1]]
+    image = ((x + y + offset) % 256).astype(np.uint8)
+    return np.repeat(image[..., np.newaxis], shape[2], axis=2) if len(shape) == 3 else image
+
+
+class TestCVCamFrameEncoding(unittest.TestCase):
+
+    def test_raw_round_trip(self):
+        image = gradient_image()
+        unpacked = unpack_obj(pack_obj(CVCamFrame(image, 50, 100)))
+        np.testing.assert_array_equal(image, unpacked.cv_image)
+        self.assertEqual((unpacked.brightness, unpacked.exposure), (50, 100))
+
+    def test_lossy_encodings_are_smaller(self):
+        image = gradient_image()
+        raw_size = len(pack_obj(CVCamFrame(image, 0, 0)))
+        for encoding in (CVCamFrame.JPEG, CVCamFrame.WEBP):
+            packed = pack_obj(CVCamFrame(image, 0, 0, encoding, quality=80))
+            unpacked = unpack_obj(packed)
+            self.assertLess(len(packed), raw_size / 10)
+            self.assertEqual(unpacked.cv_image.shape, image.shape)
+            self.assertLess(np.abs(unpacked.cv_image.astype(int) - image).mean(), 4)
+
+    def test_png_keeps_depth_maps(self):
+        depth = (np.arange(240 * 320).reshape(240, 320, 1) % 4000).astype(np.uint16)
+        frame = CVCamFrame(depth, 0, 0, CVCamFrame.PNG)
+        unpacked = unpack_obj(pack_obj(frame))
+        np.testing.assert_array_equal(depth, unpacked.cv_image)
+
+    def test_pool_keeps_order(self):
+        frames = [CVCamFrame(gradient_image(offset=i), i, 0, CVCamFrame.JPEG) for i in range(12)]
+        with FrameEncoderPool(processes=2, max_pending=4) as pool:
+            packed = []
+            for frame in frames:
+                packed.extend(pool.submit(frame))
+            packed.extend(pool.drain())
+
+        self.assertEqual([unpack_obj(p).brightness for p in packed], list(range(12)))
+
+
+if __name__ == '__main__':
+    unittest.main()
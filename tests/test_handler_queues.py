@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from robonet.handler_queues import HandlerQueue, QueuedHandlers
+from robonet.receive_callbacks import receive_objs
+
+
+class TestHandlerQueues(unittest.TestCase):
+
+    def blocked_queue(self, policy, maxsize=2, batch_size=1):
+        """A queue whose handler waits on self.release, with its first object already taken by the worker."""
+        self.release = threading.Event()
+        self.handled = []
+
+        def handler(obj):
+            self.release.wait()
+            self.handled.append(obj)
+        queue = HandlerQueue(handler, 'test', maxsize, policy, batch_size)
+        queue(0)
+        while queue.depth():
+            time.sleep(0.001)
+        return queue
+
+    def test_drop_oldest(self):
+        queue = self.blocked_queue('drop-oldest')
+        for i in range(1, 6):
+            queue(i)
+        self.release.set()
+        queue.close()
+        self.assertEqual(self.handled, [0, 4, 5])
+        self.assertEqual(queue.stats()['dropped'], 3)
+        self.assertEqual(queue.stats()['max_depth'], 2)
+
+    def test_drop_newest(self):
+        queue = self.blocked_queue('drop-newest')
+        for i in range(1, 6):
+            queue(i)
+        self.release.set()
+        queue.close()
+        self.assertEqual(self.handled, [0, 1, 2])
+        self.assertEqual(queue.stats()['dropped'], 3)
+
+    def test_block(self):
+        queue = self.blocked_queue('block', maxsize=1)
+        queue(1)
+        producer = threading.Thread(target=queue, args=(2,))
+        producer.start()
+        producer.join(0.05)
+        self.assertTrue(producer.is_alive())  # waiting for room
+        self.release.set()
+        producer.join()
+        queue.close()
+        self.assertEqual(self.handled, [0, 1, 2])
+        self.assertEqual(queue.stats()['dropped'], 0)
+        self.assertGreater(queue.stats()['lag_ms']['max'], 40)
+
+    def test_close_drops_blocked_producer(self):
+        queue = self.blocked_queue('block', maxsize=1)
+        queue(1)
+        producer = threading.Thread(target=queue, args=(2,))
+        producer.start()
+        closer = threading.Thread(target=queue.close)
+        closer.start()
+        producer.join(5.0)
+        self.assertFalse(producer.is_alive())  # woken by close(), not by room in the queue
+        self.release.set()
+        closer.join(5.0)
+        queue(3)
+        self.assertEqual(self.handled, [0, 1])
+        self.assertEqual((queue.stats()['queued'], queue.stats()['dropped']), (2, 2))
+
+    def test_receive_objs_closes_its_queues_on_error(self):
+        class BrokenDish:
+            def recv(self, flags=0, copy=True):
+                raise RuntimeError('socket gone')
+
+        receive = receive_objs({'Probe': lambda obj: None}, queue_handlers=True)
+        with self.assertRaises(RuntimeError):
+            asyncio.run(receive(None, BrokenDish()))
+        self.assertNotIn('Probe worker', [thread.name for thread in threading.enumerate()])
+
+    def test_batches_and_errors(self):
+        release, slow_release = threading.Event(), threading.Event()
+        batches = []
+
+        def handler(objs):
+            release.wait()
+            batches.append(objs)
+            if 'bad' in objs:
+                raise ValueError('bad')
+        handlers = QueuedHandlers({'IMUBuffer': handler, 'Slow': lambda obj: slow_release.wait()}, maxsize=10,
+                                  batch_sizes={'IMUBuffer': 4})
+        handlers['Slow'](None)  # a stuck handler doesn't hold up the others
+        handlers['IMUBuffer']('first')
+        while handlers['IMUBuffer'].depth():
+            time.sleep(0.001)
+        for obj in [0, 1, 2, 3, 4, 'bad']:
+            handlers['IMUBuffer'](obj)
+        release.set()
+        while handlers['IMUBuffer'].stats()['handled'] < 7:
+            time.sleep(0.001)
+        slow_release.set()
+        handlers.close()
+        self.assertEqual(batches, [['first'], [0, 1, 2, 3], [4, 'bad']])
+        self.assertEqual(handlers.stats()['IMUBuffer']['errors'], 1)
+        self.assertEqual(handlers.stats()['Slow']['handled'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
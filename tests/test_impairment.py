@@ -0,0 +1,116 @@
+import socket
+import time
+import unittest
+import zmq
+from robonet.impairment import ImpairedDish, ImpairedLink, Impairment, UdpImpairmentRelay
+from robonet.transport import open_pair
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_link(impairment, count=10000, size=100, spacing=0.001):
+    """Push count numbered datagrams, and return the numbers in the order they come out."""
+    link = ImpairedLink(impairment)
+    for i in range(count):
+        link.push(i.to_bytes(4, 'big') + bytes(size - 4), now=i * spacing)
+    out = []
+    while link.in_flight:
+        out.append(int.from_bytes(link.pop_due(float('inf'))[:4], 'big'))
+    return link, out
+
+
+class TestImpairedLink(unittest.TestCase):
+
+    def test_no_impairment(self):
+        _, out = run_link(Impairment(), count=100)
+        self.assertEqual(out, list(range(100)))
+
+    def test_random_loss(self):
+        link, out = run_link(Impairment(loss=0.1, seed=1))
+        self.assertAlmostEqual(len(out) / 10000, 0.9, delta=0.02)
+        self.assertEqual(out, sorted(out))
+        self.assertEqual(link.stats['lost'], 10000 - len(out))
+
+    def test_bursty_loss(self):
+        link, out = run_link(Impairment(p_bad=0.01, p_good=0.25, seed=2))
+        missing = sorted(set(range(10000)) - set(out))
+        bursts = 1 + sum(1 for a, b in zip(missing, missing[1:]) if b != a + 1)
+        self.assertAlmostEqual(len(missing) / bursts, 4, delta=1)
+        self.assertEqual(link.stats['burst_lost'], len(missing))
+
+    def test_reorder_and_duplicate(self):
+        link, out = run_link(Impairment(reorder=0.05, reorder_delay=0.003, duplicate=0.05, seed=3))
+        self.assertEqual(len(out), 10000 + link.stats['duplicated'])
+        self.assertGreater(link.stats['duplicated'], 0)
+        self.assertNotEqual(out, sorted(out))
+        self.assertEqual(set(out), set(range(10000)))
+
+    def test_bandwidth_cap(self):
+        link = ImpairedLink(Impairment(bandwidth=8e6, max_queue_delay=0.0105))  # 1 MB/s
+        for _ in range(20):
+            link.push(bytes(1000), now=0.0)  # 1ms each on the wire
+        due = []
+        while link.in_flight:
+            due.append(link.next_due())
+            link.pop_due(float('inf'))
+        self.assertAlmostEqual(due[0], 0.001)
+        self.assertAlmostEqual(due[9], 0.010)
+        self.assertEqual(len(due), 11)  # the rest would have queued for more than 10ms
+        self.assertEqual(link.stats['queue_dropped'], 9)
+
+
+class TestImpairedDish(unittest.TestCase):
+
+    def test_delay_over_inproc(self):
+        ctx = zmq.Context()
+        radio, raw_dish = open_pair(ctx, 'inproc', 'client', '', '')
+        peer_radio, peer_dish = open_pair(ctx, 'inproc', 'server', '', '')
+        dish = ImpairedDish(peer_dish, Impairment(delay=0.05))
+        try:
+            start = time.monotonic()
+            radio.send(b'late')
+            dish.rcvtimeo = 0
+            with self.assertRaises(zmq.Again):
+                dish.recv()
+            dish.rcvtimeo = 1000
+            self.assertEqual(dish.recv(copy=False).bytes, b'late')
+            self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        finally:
+            for sock in (radio, raw_dish, peer_radio, dish):
+                sock.close(linger=0)
+            ctx.term()
+
+
+class TestUdpImpairmentRelay(unittest.TestCase):
+
+    def test_relay_drops_and_forwards(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(1.0)
+        relay_port = free_port()
+        relay = UdpImpairmentRelay(relay_port, receiver.getsockname(), Impairment(loss=0.5, seed=4)).start()
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for i in range(100):
+                sender.sendto(bytes([i]), ('127.0.0.1', relay_port))
+            received = []
+            while True:
+                try:
+                    received.append(receiver.recv(10)[0])
+                except socket.timeout:
+                    break
+        finally:
+            relay.stop()
+            sender.close()
+            receiver.close()
+        self.assertEqual(relay.link.stats['pushed'], 100)
+        self.assertEqual(len(received), 100 - relay.link.stats['lost'])
+        self.assertTrue(30 < len(received) < 70)
+
+
+if __name__ == '__main__':
+    unittest.main()
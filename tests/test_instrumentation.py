@@ -0,0 +1,98 @@
+import logging
+import unittest
+
+from robonet.buffers.buffer_handling import pack_obj
+from robonet.buffers.buffer_objects import IMUBuffer
+from robonet.instrumentation import Registry, SampledLog, SnapshotExporter
+from robonet import instrumentation
+from robonet.receive_callbacks import make_byte_handler
+from robonet.util import BurstSender, MessageHandler
+
+
+class _ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_disabled_records_nothing(self):
+        registry = Registry()
+        stage = registry.stage('work')
+        counter = registry.counter('things')
+        start = stage.begin()
+        stage.end(start)
+        counter.add(3)
+        self.assertEqual(start, 0)
+        self.assertEqual(registry.snapshot()['stages_us']['work']['count'], 0)
+        self.assertEqual(registry.snapshot()['counters']['things'], 0)
+
+    def test_enabled_stages_and_counters(self):
+        registry = Registry(enabled=True)
+        timed = registry.stage('work').wrap(lambda x: x * 2)
+        self.assertEqual(timed(4), 8)
+        registry.counter('things').add(3)
+        self.assertIs(registry.stage('work'), registry.stage('work'))
+        snap = registry.snapshot()
+        self.assertEqual(snap['stages_us']['work']['count'], 1)
+        self.assertEqual(snap['counters']['things'], 3)
+
+        exported = []
+        exporter = SnapshotExporter(60, sink=exported.append, registry=registry, reset=True)
+        exporter.export()
+        self.assertEqual(exported[0]['counters']['things'], 3)
+        self.assertEqual(registry.snapshot()['counters']['things'], 0)
+
+    def test_send_and_receive_paths(self):
+        class Radio:
+            max_part_size = 64
+
+            def __init__(self):
+                self.parts = []
+
+            def send(self, data, group=None):
+                self.parts.append(data)
+
+        instrumentation.enable()
+        instrumentation.reset()
+        try:
+            radio = Radio()
+            received = []
+            send = BurstSender(radio)
+            handler = MessageHandler(make_byte_handler({'IMUBuffer': received.append}))
+            for _ in range(3):
+                send(pack_obj(IMUBuffer((1.0, 2.0, 3.0), (4.0, 5.0, 6.0), (7.0, 8.0, 9.0))))
+            for part in radio.parts:
+                handler.transition(part)
+            snap = instrumentation.snapshot()
+        finally:
+            instrumentation.disable()
+        self.assertEqual(len(received), 3)
+        for name in ('pack', 'send', 'unpack', 'handler.IMUBuffer'):
+            self.assertEqual(snap['stages_us'][name]['count'], 3, name)
+        self.assertEqual(snap['stages_us']['reassemble']['count'], len(radio.parts))
+        self.assertEqual(snap['counters']['send.messages'], 3)
+        self.assertEqual(snap['counters']['receive.messages'], 3)
+
+    def test_sampled_log(self):
+        now = [0.0]
+        logger = logging.getLogger('robonet.test_sampled_log')
+        logger.propagate = False
+        handler = _ListHandler()
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        log = SampledLog(logger, interval=1.0, clock=lambda: now[0])
+        for i in range(5):
+            log(logging.WARNING, 'corrupt', "corrupt %d", i)
+            log(logging.DEBUG, 'debug', "not at this level")
+            now[0] += 0.3
+        self.assertEqual(handler.messages, ["corrupt 0", "corrupt 4 (3 more since the last one)"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import unittest
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj, unpack_obj_with_meta
+from robonet.buffers.buffer_objects import IMUBuffer
+from robonet.latency import MetaStamper, LatencyMonitor
+from robonet.stats import Histogram
+
+
+class TestLatency(unittest.TestCase):
+
+    def test_meta_is_optional_on_the_wire(self):
+        obj = IMUBuffer(accel_data=(1.0, 2.0, 3.0))
+        meta = MetaStamper(clock=lambda: 5.0).stamp(obj, stream_id=3, capture_time=4.5)
+        packed = pack_obj(obj, meta)
+
+        unpacked, unpacked_meta = unpack_obj_with_meta(packed)
+        self.assertEqual((unpacked_meta.stream_id, unpacked_meta.seq), (3, 0))
+        self.assertEqual((unpacked_meta.capture_time, unpacked_meta.send_time), (4.5, 5.0))
+        self.assertNotIn('meta', unpacked.__dict__)
+        self.assertEqual(unpack_obj(packed).accel_data, unpacked.accel_data)
+        self.assertIsNone(unpack_obj_with_meta(pack_obj(obj))[1])
+
+    def test_monitor_tracks_latency_and_loss(self):
+        now = [0.0]
+        stamper = MetaStamper(clock=lambda: now[0])
+        monitor = LatencyMonitor(clock=lambda: now[0] + 0.02)
+        obj = IMUBuffer()
+        for i in range(20):
+            now[0] = i / 10
+            meta = stamper.stamp(obj, capture_time=now[0] - 0.01)
+            if i not in (5, 6, 12):
+                monitor.record('IMUBuffer', meta)
+
+        stream = monitor.snapshot()['IMUBuffer/0']
+        self.assertEqual((stream['received'], stream['lost']), (17, 3))
+        self.assertEqual(stream['loss_gaps']['count'], 2)
+        self.assertAlmostEqual(stream['capture_to_receive_ms']['mean'], 30, places=3)
+        self.assertAlmostEqual(stream['send_to_receive_ms']['mean'], 20, places=3)
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'latency.json')
+            monitor.dump(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f)['IMUBuffer/0']['lost'], 3)
+
+    def test_late_and_duplicate(self):
+        stamper = MetaStamper(clock=lambda: 1.0)
+        monitor = LatencyMonitor(clock=lambda: 1.0)
+        metas = [stamper.stamp(IMUBuffer()) for _ in range(6)]
+        for i in (0, 1, 3, 4, 1, 2, 2, 4, 5):  # 2 arrives late, then again, 1 and 4 are repeated
+            monitor.record('IMUBuffer', metas[i])
+        stream = monitor.snapshot()['IMUBuffer/0']
+        self.assertEqual((stream['lost'], stream['late'], stream['duplicates']), (0, 1, 3))
+
+    def test_histogram_quantiles(self):
+        hist = Histogram([1, 2, 5, 10])
+        for v in [0.5, 1.5, 1.5, 3, 3, 3, 7, 7, 7, 20]:
+            hist.record(v)
+        self.assertEqual(hist.counts, [1, 2, 3, 3, 1])
+        self.assertEqual(hist.quantile(0.5), 5)
+        self.assertEqual(hist.quantile(1.0), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import subprocess
+import unittest
+from robonet.buffers.buffer_objects import WifiSetupInfo
+from robonet.link_manager import LinkManager
+
+
+class FakeNmcli:
+    """Just enough of nmcli's connection handling to test against."""
+
+    def __init__(self):
+        self.profiles = {}
+        self.active = 'home_wifi'
+        self.calls = []
+
+    def __call__(self, args):
+        self.calls.append(args)
+        assert args[0] == 'nmcli'
+        if args[1:] == ['-t', '-f', 'DEVICE,TYPE', 'device']:
+            return 'eth0:ethernet\nwlan0:wifi\nlo:loopback\n'
+        if args[1:4] == ['-t', '-g', 'GENERAL.CONNECTION']:
+            return (self.active or '') + '\n'
+        if args[1:3] == ['-t', '-g'] and args[4:6] == ['connection', 'show']:
+            if args[6] not in self.profiles:
+                raise subprocess.CalledProcessError(10, args, stderr='no such connection')
+            return ''.join(self.profiles[args[6]].get(key, '') + '\n' for key in args[3].split(','))
+        if args[1:3] == ['connection', 'add']:
+            name = args[args.index('con-name') + 1]
+            settings = dict(zip(args[9::2], args[10::2]))
+            self.profiles[name] = settings
+            return ''
+        if args[1:3] == ['connection', 'modify']:
+            self.profiles[args[3]].update(zip(args[4::2], args[5::2]))
+            return ''
+        if args[1:3] == ['connection', 'up']:
+            self.active = args[3]
+            return ''
+        if args[1:3] == ['connection', 'down']:
+            assert self.active == args[3]
+            self.active = None
+            return ''
+        raise AssertionError(f'unexpected nmcli call {args}')
+
+
+class TestLinkManager(unittest.TestCase):
+
+    def setUp(self):
+        self.nmcli = FakeNmcli()
+        self.link = LinkManager(runner=self.nmcli)
+        self.wifi = WifiSetupInfo("robot_wifi", "192.168.2.1", "192.168.2.2")
+
+    def test_finds_wifi_device(self):
+        self.assertEqual(self.link.device, 'wlan0')
+        self.assertEqual(self.link.active_connection(), 'home_wifi')
+
+    def test_profile_is_created_once_then_reused(self):
+        self.assertEqual(self.link.connect(self.wifi, self.wifi.server_ip), 'created')
+        self.assertEqual(self.nmcli.profiles['robot_wifi']['802-11-wireless.mode'], 'adhoc')
+        self.assertEqual(self.nmcli.active, 'robot_wifi')
+        self.assertEqual(set(self.link.timings), {'check', 'create', 'up'})
+
+        self.link.restore('home_wifi')
+        self.nmcli.calls.clear()
+        self.assertEqual(self.link.connect(self.wifi, self.wifi.server_ip), 'reused')
+        self.assertEqual([c[1:3] for c in self.nmcli.calls], [['-t', '-g'], ['connection', 'up']])
+
+    def test_drifted_profile_is_modified_in_one_call(self):
+        self.link.connect(self.wifi, self.wifi.server_ip)
+        self.nmcli.calls.clear()
+        self.assertEqual(self.link.connect(self.wifi, self.wifi.client_ip), 'modified')
+        modify_calls = [c for c in self.nmcli.calls if c[1:3] == ['connection', 'modify']]
+        self.assertEqual(modify_calls, [['nmcli', 'connection', 'modify', 'robot_wifi', 'ipv4.addresses',
+                                         '192.168.2.2/24']])
+
+    def test_restore_without_previous_connection_takes_the_link_down(self):
+        self.nmcli.active = None
+        previous = self.link.active_connection()
+        self.assertIsNone(previous)
+        self.link.connect(self.wifi, self.wifi.client_ip)
+        self.link.restore(previous)
+        self.assertIsNone(self.nmcli.active)
+        self.assertEqual(self.nmcli.calls[-1], ['nmcli', 'connection', 'down', 'robot_wifi'])
+
+
+if __name__ == '__main__':
+    unittest.main()
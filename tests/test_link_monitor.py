@@ -0,0 +1,96 @@
+import threading
+import unittest
+from collections import deque
+import zmq
+from robonet.buffers.buffer_handling import pack_obj
+from robonet.buffers.buffer_objects import LinkProbe
+from robonet.link_monitor import LinkMonitor
+from robonet.util import BurstSender, chunk_message
+
+
+class Frame:
+    def __init__(self, data):
+        self.bytes = data
+
+
+class Pipe:
+    """A radio on one end and a dish on the other, that can be told to drop what's sent."""
+
+    def __init__(self):
+        self.queue = deque()
+        self.drop = False
+
+    def send(self, data, group=None):
+        if not self.drop:
+            self.queue.append(data)
+
+    def recv(self, flags=0, copy=True):
+        if not self.queue:
+            raise zmq.Again()
+        return Frame(self.queue.popleft())
+
+
+class TestLinkMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        clock = lambda: self.now
+        self.base = LinkMonitor(interval=0.5, loss_timeout=1.0, clock=clock, dump_interval=None)
+        self.robot = LinkMonitor(clock=clock, dump_interval=None)
+        self.to_robot, self.to_base = Pipe(), Pipe()
+        self.base.attach(BurstSender(self.to_robot))
+        self.robot.attach(BurstSender(self.to_base))
+
+    def step(self, one_way_delay):
+        self.base.maybe_ping()
+        self.now += one_way_delay
+        self.robot.poll(self.to_robot)
+        self.now += one_way_delay
+        self.base.poll(self.to_base)
+
+    def test_rtt_and_jitter(self):
+        for i in range(20):
+            self.step(0.010 if i % 2 else 0.020)
+            self.now += 0.5
+        stats = self.base.snapshot()
+        self.assertEqual(stats['pongs_received'], 20)
+        self.assertAlmostEqual(stats['srtt_ms'], 30, delta=3)
+        self.assertGreater(stats['jitter_ms'], 10)
+        self.assertEqual(stats['loss'], 0.0)
+        self.assertIsNotNone(self.robot.last_heard)
+
+    def test_loss(self):
+        for i in range(10):
+            self.to_robot.drop = i < 4
+            self.step(0.005)
+            self.now += 0.5
+        self.base.maybe_ping()
+        stats = self.base.snapshot()
+        self.assertEqual((stats['pings_lost'], stats['pongs_received']), (4, 6))
+        self.assertGreater(stats['loss'], 0.1)
+
+    def test_corrupted_probe_is_dropped(self):
+        probe = pack_obj(LinkProbe(7, 0.0)) + bytes(200)
+        start, *_ = chunk_message(probe, 64)
+        self.to_robot.send(b'\x01\x00' + start)  # the rest is lost, so the next start passes on this one
+        self.to_robot.send(b'\x04\x01' + b'\xff' * 16)
+        self.robot.poll(self.to_robot)
+        self.step(0.005)
+        self.assertEqual(self.base.snapshot()['pongs_received'], 1)
+
+    def test_probes_share_the_data_path_lock(self):
+        send = BurstSender(self.to_base)
+        self.robot.attach(send)
+        with send.critical_section_lock:  # a data message is going out
+            self.to_robot.send(b'\x04\x00' + pack_obj(LinkProbe(0, 0.0)))
+            answered = threading.Thread(target=self.robot.poll, args=(self.to_robot,))
+            answered.start()
+            answered.join(0.05)
+            self.assertTrue(answered.is_alive())
+            self.assertEqual(len(self.to_base.queue), 0)
+        answered.join()
+        self.assertEqual(len(self.to_base.queue), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import MJpegCamFrame
+from robonet.multi_camera import MultiCameraSender, route_by_stream
+
+
+class FakeCamera:
+    """Stands in for CameraPack, so tests don't need /dev/video devices."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+
+    def get_jpeg(self):
+        self.count += 1
+        return b'\xff\xd8' + f'{self.name} {self.count}'.encode() + b'\xff\xd9'
+
+
+class FlakyCamera(FakeCamera):
+    """Raises on its first grabs, like a camera that's still coming back after being replugged."""
+
+    def __init__(self, name, failures):
+        super().__init__(name)
+        self.failures = failures
+
+    def get_jpeg(self):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('VIDIOC_DQBUF: No such device')
+        return super().get_jpeg()
+
+
+class FakeRadio:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data, group=None):
+        self.sent.append(data)
+
+
+class TestMultiCamera(unittest.TestCase):
+
+    def test_frames_keep_stream_and_capture_time(self):
+        clock_ticks = iter([10.0, 10.5])
+        sender = MultiCameraSender([FakeCamera('left'), FakeCamera('right')], clock=lambda: next(clock_ticks))
+        for stream in sender.streams:
+            sender.capture_once(stream)
+
+        frames = [unpack_obj(pack_obj(sender.next_frame(timeout=0))) for _ in range(2)]
+        self.assertEqual(sorted((f.stream_id, f.capture_time) for f in frames), [(0, 10.0), (1, 10.5)])
+        self.assertIsNone(sender.next_frame(timeout=0))
+
+    def test_weighted_schedule(self):
+        sender = MultiCameraSender([FakeCamera('a'), FakeCamera('b')], weights=[3, 1])
+        sent = []
+        for _ in range(40):
+            for stream in sender.streams:
+                sender.capture_once(stream)
+            sent.append(sender.next_frame(timeout=0).stream_id)
+
+        self.assertEqual(sent.count(0), 30)
+        self.assertEqual(sent.count(1), 10)
+        self.assertEqual(sender.stats()[1]['replaced'], 29)  # the last one is still waiting
+
+    def test_run_sends_bursts(self):
+        radio = FakeRadio()
+        sender = MultiCameraSender([FakeCamera('a'), FakeCamera('b')])
+        thread = threading.Thread(target=sender.run, args=(radio,))
+        thread.start()
+        deadline = time.monotonic() + 5.0
+        try:
+            while len(radio.sent) < 10:
+                self.assertLess(time.monotonic(), deadline, "the sender stopped sending")
+                time.sleep(0.001)
+        finally:
+            sender.stop()
+            thread.join(5.0)
+        self.assertFalse(thread.is_alive())
+
+        self.assertEqual(radio.sent[0][0:1], b'\x04')  # tiny frames fit in one part
+        self.assertEqual({unpack_obj(m[2:]).stream_id for m in radio.sent}, {0, 1})
+
+    def test_capture_errors_dont_end_the_stream(self):
+        sender = MultiCameraSender([FlakyCamera('a', failures=3)], retry_interval=0.001)
+        sender.start()
+        try:
+            frame = sender.next_frame(timeout=5.0)
+        finally:
+            sender.stop()
+        self.assertIsNotNone(frame)
+        self.assertEqual(sender.stats()[0]['capture_errors'], 3)
+
+    def test_route_by_stream(self):
+        left, right = [], []
+        handle = route_by_stream({0: left.append, 1: right.append})
+        handle(MJpegCamFrame(0, 0, b'', stream_id=1))
+        handle(MJpegCamFrame(0, 0, b'', stream_id=0))
+        handle(MJpegCamFrame(0, 0, b'', stream_id=1))
+        self.assertEqual((len(left), len(right)), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
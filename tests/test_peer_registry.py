@@ -0,0 +1,110 @@
+import socket
+import threading
+import time
+import unittest
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import TemperatureMonitorBuffer, WifiSetupInfo
+from robonet.discovery import PING_RESPONSE, pack_udp_group, unpack_udp_group
+from robonet.peer_registry import PeerRegistry
+from robonet.util import chunk_message, send_burst
+
+
+class FakeRobot:
+    """A robot's RADIO and DISH as one raw socket on its own loopback address."""
+
+    def __init__(self, ip, port, server_port):
+        self.ip = ip
+        self.server = ('127.0.0.1', server_port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((ip, port))
+        self.sock.settimeout(2)
+
+    def send(self, data, group='direct'):
+        self.sock.sendto(pack_udp_group(group, data), self.server)
+
+    def announce(self):
+        self.send(f"{PING_RESPONSE}: {self.ip}".encode(), group='discovery')
+
+    def recv_direct(self):
+        while True:
+            group, payload = unpack_udp_group(self.sock.recv(65535))
+            if group == 'direct':
+                return payload
+
+
+class TestPeerRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.received = {}
+        self.registry = PeerRegistry('127.0.0.1', self.make_handlers, port=0, group_addr='127.0.0.1')
+        server_port = self.registry.sock.getsockname()[1]
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        probe.bind(('127.0.0.2', 0))
+        robot_port = probe.getsockname()[1]
+        probe.close()
+        self.registry.robot_port = robot_port
+        self.robots = [FakeRobot(f'127.0.0.{i}', robot_port, server_port) for i in range(2, 6)]
+        self.registry.start()
+
+    def tearDown(self):
+        self.registry.stop()
+        for robot in self.robots:
+            robot.sock.close()
+
+    def make_handlers(self, peer):
+        readings = self.received.setdefault(peer.namespace, [])
+        return {'TemperatureMonitorBuffer': lambda obj: readings.append(obj.temperature_readings[0])}
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 2
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertTrue(condition())
+
+    def test_many_robots_share_one_socket(self):
+        for robot in self.robots:
+            robot.announce()
+        self.wait_for(lambda: len(self.registry.peers) == 4)
+
+        lock = threading.Lock()
+        big = [float(i) for i in range(3000)]  # several fragments per message
+        for i, robot in enumerate(self.robots):
+            for j in range(3):
+                readings = [float(10 * i + j)] + big
+                send_burst(lock, robot, bytes([j]), chunk_message(pack_obj(TemperatureMonitorBuffer(readings))))
+        self.wait_for(lambda: sum(len(r) for r in self.received.values()) == 12)
+
+        namespaces = {p.ip: p.namespace for p in self.registry.peers.values()}
+        for i, robot in enumerate(self.robots):
+            self.assertEqual(self.received[namespaces[robot.ip]], [10 * i, 10 * i + 1, 10 * i + 2])
+
+    def test_lost_part_does_not_stop_the_registry(self):
+        robot = self.robots[0]
+        robot.announce()
+        self.wait_for(lambda: len(self.registry.peers) == 1)
+
+        lock = threading.Lock()
+        big = [float(i) for i in range(3000)]
+        first = chunk_message(pack_obj(TemperatureMonitorBuffer([1.0] + big)))
+        send_burst(lock, robot, b'\x00', first[:1])  # the rest of it is lost
+        send_burst(lock, robot, b'\x01', chunk_message(pack_obj(TemperatureMonitorBuffer([2.0] + big))))
+        send_burst(lock, robot, b'\x02', chunk_message(pack_obj(TemperatureMonitorBuffer([3.0] + big))))
+
+        self.wait_for(lambda: 3.0 in self.received.get('robot0', []))
+        self.assertTrue(self.registry._thread.is_alive())
+
+    def test_send_to_subset(self):
+        for robot in self.robots[:2]:
+            robot.announce()
+        self.wait_for(lambda: len(self.registry.peers) == 2)
+        target = self.registry.peers['127.0.0.3']
+
+        self.registry.send_obj(WifiSetupInfo('net', '1', '2'), peer_ids=[target.peer_id])
+        self.assertEqual(unpack_obj(self.robots[1].recv_direct()[2:]).ssid, 'net')
+        self.robots[0].sock.settimeout(0.05)
+        with self.assertRaises(socket.timeout):
+            self.robots[0].recv_direct()
+
+
+if __name__ == '__main__':
+    unittest.main()
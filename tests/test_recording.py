@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from robonet.buffers.buffer_handling import MessageMeta, pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import IMUBuffer, MJpegCamFrame
+from robonet.receive_callbacks import make_byte_handler
+from robonet.recording import UNKNOWN_STREAM, Recorder, Recording
+
+
+def frame(i, stream_id=0):
+    obj = MJpegCamFrame(0, 0, bytes([i % 256]) * 1000, stream_id, float(i))
+    return pack_obj(obj, MessageMeta(stream_id, i, float(i), float(i)))
+
+
+class TestRecording(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, 'rec')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_segments_and_lookup(self):
+        with Recorder(self.directory, segment_size=10000, fsync='always') as recorder:
+            for i in range(50):
+                recorder.record(frame(i, i % 2), timestamp=100.0 + i)
+            recorder.record(pack_obj(IMUBuffer((1.0, 2.0, 3.0))), timestamp=200.0)
+        self.assertEqual(recorder.recorded, 51)
+
+        recording = Recording(self.directory)
+        self.assertEqual(len(recording), 51)
+        self.assertGreater(len(recording.segments), 5)
+        self.assertEqual(recording.streams, {'MJpegCamFrame/0': 0, 'MJpegCamFrame/1': 1, 'IMUBuffer/0': 2})
+
+        segment, i = recording.find(123.5)
+        obj = unpack_obj(bytes(recording.segments[segment].message(i)))
+        self.assertEqual(obj.capture_time, 24.0)
+        self.assertEqual(recording.segments[segment].index['stream'][i], 0)
+
+        segment, i = recording.find(150.0)
+        self.assertEqual(recording.segments[segment].index['timestamp'][i], 200.0)
+        self.assertEqual(recording.find(1000.0), (len(recording.segments), 0))
+        self.assertEqual(os.path.getsize(recording.segments[0].log_path), int(recording.segments[0].index['length'].sum()))
+        recording.close()
+
+    def test_timestamps_never_go_backwards(self):
+        now = [1000.0]
+        with Recorder(self.directory, clock=lambda: now[0]) as recorder:
+            recorder.record(frame(0))
+            now[0] = 1001.0
+            recorder.record(frame(1))
+            now[0] = 10.0  # the clock got stepped back
+            recorder.record(frame(2))
+            now[0] = 10.5
+            recorder.record(frame(3))
+            recorder.record(frame(4), timestamp=5.0)
+        with Recorder(self.directory, clock=lambda: 20.0) as recorder:  # and it's still behind after a restart
+            recorder.record(frame(5))
+
+        recording = Recording(self.directory)
+        timestamps = [t for segment in recording.segments for t in segment.index['timestamp']]
+        self.assertEqual(timestamps, [1000.0, 1001.0, 1001.0, 1001.5, 1001.5, 1001.5])
+        self.assertEqual(recorder.clamped, 1)
+        segment, i = recording.find(1001.2)
+        self.assertEqual(unpack_obj(bytes(recording.segments[segment].message(i))).capture_time, 3.0)
+        recording.close()
+
+    def test_reads_while_recording(self):
+        recorder = Recorder(self.directory, fsync='always')
+        recorder.record(frame(0), timestamp=1.0)
+        deadline = time.monotonic() + 5.0
+        while recorder.recorded < 1:
+            self.assertLess(time.monotonic(), deadline, "the writer never wrote the first message")
+            time.sleep(0.001)
+        recording = Recording(self.directory)
+        self.assertEqual(len(recording), 1)
+        recorder.record(frame(1), timestamp=2.0)
+        recorder.close()
+        recording.refresh()
+        self.assertEqual(len(recording), 2)
+        self.assertEqual(unpack_obj(bytes(recording.segments[0].message(1))).capture_time, 1.0)
+        recording.close()
+
+    def test_resumes_in_a_new_segment(self):
+        for start in (0, 10):
+            with Recorder(self.directory) as recorder:
+                for i in range(start, start + 10):
+                    recorder.record(frame(i), timestamp=float(i))
+        recording = Recording(self.directory)
+        self.assertEqual([s.number for s in recording.segments], [0, 1])
+        self.assertEqual(len(recording), 20)
+        recording.close()
+
+    def test_drops_instead_of_blocking(self):
+        recorder = Recorder(self.directory, max_pending_bytes=0)
+        recorder.record(frame(0))
+        recorder.close()
+        self.assertEqual((recorder.recorded, recorder.dropped), (0, 1))
+
+    def test_undecodable_headers(self):
+        with Recorder(self.directory) as recorder:
+            recorder.record(b'\x00\x01', timestamp=1.0)
+            recorder.record(b'\x00\x00\x00\x05ab', timestamp=2.0)
+        self.assertEqual(recorder.streams, {UNKNOWN_STREAM: 0})
+        self.assertEqual(recorder.recorded, 2)
+
+    def test_corrupted_messages_dont_reach_sinks(self):
+        with Recorder(self.directory) as recorder:
+            handle = make_byte_handler({}, message_sinks=[recorder.record])
+            for message in (b'\x00\x01', b'\x00\x00\x00\x05ab', frame(0)[:-10]):
+                handle(message)  # dropped, not raised
+            handle(frame(1))
+        self.assertEqual(recorder.recorded, 1)
+
+    def test_write_failure(self):
+        recorder = Recorder(self.directory)
+        shutil.rmtree(self.directory)  # nowhere to create the first segment
+        recorder.record(frame(0))
+        deadline = time.monotonic() + 5.0
+        while recorder.error is None:
+            self.assertLess(time.monotonic(), deadline, "the write error never surfaced")
+            time.sleep(0.001)
+        recorder.record(frame(1))
+        self.assertEqual(recorder.dropped, 1)
+        with self.assertRaises(RuntimeError):
+            recorder.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+from robonet.buffers.buffer_handling import MessageMeta, pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import IMUBuffer, MJpegCamFrame
+from robonet.recording import Recorder
+from robonet.replay import Replayer, handler_sink
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        with Recorder(self.tmp.name, segment_size=4000) as recorder:
+            for i in range(20):
+                frame = MJpegCamFrame(0, 0, bytes(500), i % 2, float(i))
+                recorder.record(pack_obj(frame, MessageMeta(i % 2, i, float(i), float(i))), timestamp=10.0 + i)
+                recorder.record(pack_obj(IMUBuffer((float(i), 0.0, 0.0))), timestamp=10.5 + i)
+        self.now = 0.0
+        self.sleeps = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def test_paced_playback(self):
+        replayer = Replayer(self.tmp.name, speed=2.0, streams=['IMUBuffer/0'], clock=self.clock, sleep=self.sleep)
+        received = []
+        self.assertEqual(replayer.play(lambda msg: received.append(unpack_obj(msg))), 20)
+        self.assertEqual([obj.accel_data[0] for obj in received], [float(i) for i in range(20)])
+        self.assertEqual(self.sleeps, [0.5] * 19)  # a second apart, at twice the speed
+
+    def test_seek_and_end(self):
+        replayer = Replayer(self.tmp.name, speed=0, streams=['MJpegCamFrame/1'])
+        replayer.seek(15.0)
+        received = []
+        replayer.play(lambda msg: received.append(unpack_obj(msg).capture_time), end=25.0)
+        self.assertEqual(received, [5.0, 7.0, 9.0, 11.0, 13.0])
+
+    def test_into_handlers(self):
+        counts = {'MJpegCamFrame': 0, 'IMUBuffer': 0}
+
+        def count(obj):
+            counts[obj.__class__.__name__] += 1
+        replayer = Replayer(self.tmp.name, speed=0)
+        replayer.play(handler_sink({'MJpegCamFrame': count, 'IMUBuffer': count}))
+        self.assertEqual(counts, {'MJpegCamFrame': 20, 'IMUBuffer': 20})
+        self.assertEqual(replayer.position, (len(replayer.recording.segments), 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import zmq
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import LinkProbe
+from robonet.link_monitor import LinkMonitor
+from robonet.session import SessionSupervisor, SwappableSocket
+from tests.test_link_monitor import Frame
+
+
+class FakeSocket:
+    def __init__(self, peer_ip, kind):
+        self.peer_ip = peer_ip
+        self.kind = kind
+        self.sent = []
+        self.inbox = []
+        self.closed = False
+        self.rcvtimeo = -1
+
+    def send(self, data, group=None):
+        self.sent.append(data)
+
+    def recv(self, flags=0, copy=True):
+        if not self.inbox:
+            raise zmq.Again()
+        return self.inbox.pop(0)
+
+    def close(self, linger=None):
+        self.closed = True
+
+
+class TestSessionSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.sockets = []
+        self.peer_ips = []  # what discovery finds, one per call
+
+        def factories(peer_ip):
+            def make(kind):
+                def make_socket():
+                    sock = FakeSocket(peer_ip, kind)
+                    self.sockets.append(sock)
+                    return sock
+                return make_socket
+            return make('radio'), make('dish')
+
+        def discover():
+            return self.peer_ips.pop(0) if self.peer_ips else None
+
+        self.supervisor = SessionSupervisor(factories, '10.0.0.2', discover, silence_timeout=2.0,
+                                            clock=lambda: self.now)
+
+    def test_recv_keeps_session(self):
+        dish = self.supervisor.dish
+        for _ in range(10):
+            self.now += 1.0
+            dish._sock.inbox.append(b'data')
+            dish.recv()
+            self.assertFalse(self.supervisor.check())
+        self.assertEqual(self.supervisor.recoveries, 0)
+
+    def test_rediscovers_and_swaps_on_next_use(self):
+        radio, dish = self.supervisor.radio, self.supervisor.dish
+        dish.rcvtimeo = 10
+        old_radio, old_dish = radio._sock, dish._sock
+        dish._sock.inbox.append(b'data')
+        dish.recv()  # heard at 0
+
+        self.now = 2.5
+        self.assertFalse(self.supervisor.check())  # peer still gone
+        self.peer_ips.append('10.0.0.7')
+        self.now = 2.8
+        self.assertTrue(self.supervisor.check())
+        self.assertEqual(self.supervisor.peer_ip, '10.0.0.7')
+        self.assertAlmostEqual(self.supervisor.last_recovery_time, 0.3)
+
+        # the loop's thread does the swap, on its next call
+        self.assertFalse(old_radio.closed)
+        radio.send(b'frame', group='direct')
+        with self.assertRaises(zmq.Again):
+            dish.recv()
+        self.assertTrue(old_radio.closed and old_dish.closed)
+        self.assertEqual(radio._sock.peer_ip, '10.0.0.7')
+        self.assertEqual(radio._sock.sent, [b'frame'])
+        self.assertEqual(dish._sock.rcvtimeo, 10)
+        self.assertFalse(self.supervisor.check())  # new sockets get a full timeout
+
+    def test_never_heard_is_not_silent(self):
+        self.peer_ips.append('10.0.0.7')
+        self.now = 60.0
+        self.assertFalse(self.supervisor.check())  # a transmit-only loop with nobody answering keeps sending
+        self.assertEqual(self.supervisor.peer_ip, '10.0.0.2')
+
+    def test_polls_link_for_transmit_only_loops(self):
+        monitor = LinkMonitor(clock=lambda: self.now, dump_interval=None)
+        self.supervisor.link_monitor = monitor
+        self.supervisor.check_interval = 60  # the test polls and checks by itself
+        seen = []
+
+        def transmit(radio, dish):
+            dish._sock.inbox.append(Frame(b'\x04\x00' + pack_obj(LinkProbe(3, 0.0))))
+            self.now = 1.0
+            self.supervisor.poll_link()
+            seen.extend(radio._sock.sent)
+            self.assertEqual(monitor.last_heard, 1.0)
+            self.assertFalse(dish.receiving)
+
+            self.now = 2.5
+            self.assertFalse(self.supervisor.check())
+            self.now = 3.5
+            self.peer_ips.append('10.0.0.7')
+            self.assertTrue(self.supervisor.check())
+
+            dish.rcvtimeo = 0
+            with self.assertRaises(zmq.Again):
+                dish.recv()  # the loop receives now, so the probes are its to handle
+            dish._sock.inbox.append(Frame(b'\x04\x00' + pack_obj(LinkProbe(4, 0.0))))
+            self.supervisor.poll_link()
+            self.assertEqual(len(dish._sock.inbox), 1)
+
+        self.supervisor.run(transmit)
+        probes = [unpack_obj(part[2:]) for part in seen]
+        self.assertEqual([(p.seq, p.is_pong) for p in probes], [(3, True), (0, False)])
+
+    def test_link_monitor_counts_as_heard(self):
+        class Monitor:
+            last_heard = None
+        self.supervisor.link_monitor = Monitor()
+        self.now = 1.9
+        Monitor.last_heard = 1.9
+        self.now = 3.0
+        self.assertFalse(self.supervisor.check())
+
+    def test_run_closes_sockets(self):
+        seen = []
+        self.supervisor.run(lambda radio, dish: seen.append((radio, dish)))
+        self.assertEqual(seen, [(self.supervisor.radio, self.supervisor.dish)])
+        self.assertTrue(all(s.closed for s in self.sockets))
+
+
+if __name__ == '__main__':
+    unittest.main()
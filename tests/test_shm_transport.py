@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import unittest
+import numpy as np
+import zmq
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import MJpegCamFrame
+from robonet.shm_transport import Overwritten, ShmDish, ShmRadio
+from robonet.util import BurstSender, MessageHandler
+
+
+def produce(name, count):
+    dish = ShmDish(name + '_ready', rcvtimeo=5000)
+    radio = ShmRadio(name, slot_count=4, slot_size=1 << 16)
+    dish.recv()  # consumer is attached
+    for i in range(count):
+        radio.send(np.full(1000, i, np.int32).tobytes())
+    dish.recv()  # consumer is done
+    radio.close()
+    dish.close()
+
+
+class TestShmTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.name = f"robonet_test_{os.getpid()}"
+        self.radio = ShmRadio(self.name, slot_count=4, slot_size=1024)
+        self.dish = ShmDish(self.name, rcvtimeo=0)
+        with self.assertRaises(zmq.Again):
+            self.dish.recv()  # attaches, starting after what's already there
+
+    def tearDown(self):
+        self.dish.close()
+        self.radio.close()
+
+    def test_zero_copy_frame(self):
+        self.radio.send(np.arange(16, dtype=np.float32).tobytes())
+        frame = self.dish.recv(copy=False)
+        np.testing.assert_array_equal(frame.array(np.float32, (4, 4)).ravel(), np.arange(16))
+        self.assertTrue(frame.valid())
+
+    def test_slow_consumer_skips_ahead(self):
+        for i in range(10):
+            self.radio.send(bytes([i]) * 10)
+        received = [self.dish.recv()[0] for _ in range(4)]
+        self.assertEqual(received, [6, 7, 8, 9])
+        self.assertEqual(self.dish.dropped, 6)
+        with self.assertRaises(zmq.Again):
+            self.dish.recv()
+
+    def test_overwritten_frame(self):
+        self.radio.send(b'first')
+        frame = self.dish.recv(copy=False)
+        for _ in range(4):
+            self.radio.send(b'lapped')
+        self.assertFalse(frame.valid())
+        with self.assertRaises(Overwritten):
+            frame.bytes
+        self.assertEqual(self.dish.dropped, 1)
+
+    def test_burst_uses_whole_slots(self):
+        received = []
+        handler = MessageHandler(lambda msg: received.append(unpack_obj(msg)))
+        send = BurstSender(self.radio)
+        send(pack_obj(MJpegCamFrame(1, 2, b'\xff' * 1500)))
+        while True:
+            try:
+                handler.transition(self.dish.recv(copy=False).bytes)
+            except zmq.Again:
+                break
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0].mjpeg, b'\xff' * 1500)
+        self.assertEqual(self.dish.received, 2)  # 1022 byte parts rather than 4096 ones that wouldn't fit
+
+    def test_across_processes(self):
+        name = self.name + '_mp'
+        ready = ShmRadio(name + '_ready', slot_count=2, slot_size=16)
+        producer = multiprocessing.get_context('spawn').Process(target=produce, args=(name, 3))
+        producer.start()
+        dish = ShmDish(name, rcvtimeo=10)
+        while dish.ring is None:  # attach before the producer sends anything
+            try:
+                dish.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                pass
+        while True:
+            ready.send(b'ready')
+            try:
+                values = [dish.recv(copy=False).array(np.int32)[0]]
+                break
+            except zmq.Again:
+                pass
+        dish.rcvtimeo = 5000
+        values += [dish.recv(copy=False).array(np.int32)[0] for _ in range(2)]
+        ready.send(b'done')
+        producer.join(10)
+        dish.close()
+        ready.close()
+        self.assertEqual(values, [0, 1, 2])
+        self.assertEqual(producer.exitcode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import struct
+import unittest
+
+import numpy as np
+
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import TensorBuffer, TensorDelta
+from robonet.tensor_sync import TensorDeltaSender, TensorMirror
+
+
+class TestTensorBufferDtypes(unittest.TestCase):
+
+    def test_round_trip(self):
+        tensors = [np.random.rand(3, 4).astype(np.float16), np.arange(10, dtype=np.int64),
+                   np.array([[True, False]]), np.random.rand(2, 2, 2), np.zeros((0, 3), np.float32)]
+        unpacked = unpack_obj(pack_obj(TensorBuffer(tensors)))
+        for original, received in zip(tensors, unpacked.tensors):
+            self.assertEqual(received.dtype, original.dtype)
+            np.testing.assert_array_equal(received, original)
+
+    def test_unsupported_dtype(self):
+        with self.assertRaises(TypeError):
+            pack_obj(TensorBuffer([np.zeros(3, dtype=np.complex128)]))
+
+
+class TestTensorSync(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.weights = [rng.standard_normal((256, 256)).astype(np.float32), rng.standard_normal(1000)]
+        self.sender = TensorDeltaSender(block_size=256, tolerance=1e-4, full_sync_interval=10)
+        self.mirror = TensorMirror()
+
+    def send(self, drop=False):
+        message = pack_obj(self.sender.update(self.weights))
+        if not drop:
+            self.mirror.handle(unpack_obj(message))
+        return len(message)
+
+    def assert_in_sync(self, atol=0.0):
+        for original, mirrored in zip(self.weights, self.mirror.tensors()):
+            self.assertEqual(mirrored.dtype, original.dtype)
+            np.testing.assert_allclose(mirrored, original, rtol=0, atol=atol)
+
+    def test_only_changed_blocks_are_sent(self):
+        full_size = self.send()
+        self.assert_in_sync()
+        self.weights[0][10, 3] += 0.5
+        self.weights[1][999] -= 1.0
+        delta_size = self.send()
+        self.assert_in_sync()
+        self.assertLess(delta_size * 50, full_size)
+        self.assertEqual(self.mirror.stats()[0]['blocks_received'], 256 + 4 + 2)
+
+    def test_tolerance_doesnt_let_changes_pile_up(self):
+        self.send()
+        for _ in range(5):
+            self.weights[0] += 3e-5
+            self.send()
+            self.assert_in_sync(atol=1e-4)
+        self.assertGreater(self.mirror.stats()[0]['blocks_received'], 256 + 4)
+
+    def test_nan_changes_are_sent(self):
+        self.send()
+        self.weights[0][5, 5] = np.nan
+        self.send()
+        self.assert_in_sync()  # assert_allclose counts NaN matching NaN as equal
+        self.assertTrue(np.isnan(self.mirror.tensors()[0][5, 5]))
+        self.weights[0][5, 5] = 1.0
+        self.send()
+        self.assert_in_sync()
+
+    def test_full_sync_recovers_from_loss(self):
+        self.send()
+        self.weights[0][0, 0] = 7.0
+        self.send(drop=True)
+        self.weights[1][0] = 7.0
+        self.send()
+        stats = self.mirror.stats()[0]
+        self.assertTrue(stats['stale'])
+        self.assertEqual(stats['missed'], 1)
+        self.assertNotEqual(self.mirror.tensors()[0][0, 0], 7.0)
+        for _ in range(10):
+            self.send()
+        self.assertFalse(self.mirror.stats()[0]['stale'])
+        self.assert_in_sync()
+
+    def test_shape_change_sends_everything(self):
+        self.send()
+        mirrored = self.mirror.tensors()[0]
+        self.weights[0][5, 5] = 3.0
+        self.send()
+        self.assertIs(self.mirror.tensors()[0], mirrored)  # patched in place
+        self.assertEqual(mirrored[5, 5], 3.0)
+        self.weights[1] = np.arange(7, dtype=np.int32)
+        self.send()
+        self.assertEqual(self.mirror.stats()[0]['full_syncs'], 2)
+        self.assert_in_sync()
+
+    def test_bad_block_index(self):
+        self.send()
+        self.weights[1][0] = 1.0
+        message = bytearray(pack_obj(self.sender.update(self.weights)))
+        header_at = message.index(struct.pack('!BIIII', 2, 1, 1000, 1, 0))  # float64, shape (1000,), block 0
+        struct.pack_into('<I', message, header_at + 13, 4)  # the tensor only has blocks 0 to 3
+        with self.assertRaises(ValueError):
+            unpack_obj(bytes(message))
+
+    def test_empty_delta(self):
+        self.send()
+        delta = unpack_obj(pack_obj(self.sender.update(self.weights)))
+        self.assertIsInstance(delta, TensorDelta)
+        self.assertFalse(delta.full)
+        self.assertEqual([len(indices) for _, indices, _ in delta.blocks], [0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import threading
+import unittest
+
+import numpy as np
+
+from robonet.buffers.buffer_objects import IMUBuffer, MJpegCamFrame
+from robonet.timeseries import IMU_FIELDS, TimeSeriesStore, imu_values
+
+
+class TestTimeSeriesStore(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.store = TimeSeriesStore(seconds=1.0, max_bytes=1 << 20, clock=lambda: self.now)
+        self.imu = self.store.add_numeric('imu', IMU_FIELDS, rate=100, extract=imu_values)
+
+    def fill_imu(self, count, rate=100.0):
+        for i in range(count):
+            t = i / rate
+            self.store.insert('imu', t, {'accel': (t, 2 * t, 0.0), 'gyro': (0.0, 0.0, 1.0), 'mag': (1.0, 0.0, 0.0)})
+
+    def test_nearest_and_range_after_wrapping(self):
+        self.fill_imu(1000)  # ten times the ring
+        t, values = self.store.nearest('imu', 9.5012)
+        self.assertAlmostEqual(t, 9.50)
+        np.testing.assert_allclose(values['accel'], [9.5, 19.0, 0.0], rtol=1e-6)
+
+        times, values = self.store.range('imu', 9.88, 9.905)
+        np.testing.assert_allclose(times, [9.88, 9.89, 9.90])
+        np.testing.assert_allclose(values['accel'][:, 0], times, rtol=1e-6)
+        self.assertIsNone(self.store.nearest('imu', 20.0, max_distance=0.1))
+        self.assertEqual(len(self.imu), 101)  # the last second only, though the ring has room for more
+
+    def test_nearest_many(self):
+        self.fill_imu(50)
+        times, values = self.store.nearest('imu', np.array([0.104, 0.106, 5.0]), max_distance=0.01)
+        np.testing.assert_allclose(times[:2], [0.10, 0.11])
+        self.assertTrue(np.isnan(times[2]) and np.isnan(values['accel'][2]).all())
+
+    def test_interpolate(self):
+        self.fill_imu(300)
+        values = self.store.interpolate('imu', np.array([2.505, 2.99, 3.5]))
+        np.testing.assert_allclose(values['accel'][:2, 1], [5.01, 5.98], rtol=1e-5)
+        self.assertTrue(np.isnan(values['accel'][2]).all())
+        np.testing.assert_allclose(self.store.interpolate('imu', 2.5)['gyro'], [0.0, 0.0, 1.0])
+
+    def test_out_of_order_dropped(self):
+        self.fill_imu(10)
+        self.assertFalse(self.store.insert('imu', 0.01, {'accel': (0.0, 0.0, 0.0)}))
+        self.assertEqual(self.imu.stats()['out_of_order'], 1)
+
+    def test_handlers(self):
+        self.now = 5.0
+        self.store.handler('imu')(IMUBuffer((1.0, 2.0, 3.0), None, (4.0, 5.0, 6.0)))
+        t, values = self.store.nearest('imu', 5.0)
+        self.assertEqual(t, 5.0)
+        self.assertTrue(np.isnan(values['gyro']).all())
+
+        self.store.to_local_time = lambda remote: remote - 100.0
+        self.store.add_objects('camera', rate=30)
+        self.store.handler('camera')(MJpegCamFrame(0, 0, b'jpeg', capture_time=104.9))
+        t, frame = self.store.nearest('camera', 5.0)
+        self.assertAlmostEqual(t, 4.9)
+        self.assertEqual(frame.mjpeg, b'jpeg')
+
+    def test_memory_cap(self):
+        with self.assertRaises(MemoryError):
+            self.store.add_numeric('big', {'x': (1000,)}, rate=1000)
+        camera = self.store.add_objects('camera', rate=30, max_bytes=1000)
+        for i in range(10):
+            self.store.insert('camera', i / 30, MJpegCamFrame(0, 0, bytes(300)))
+        stats = camera.stats()
+        self.assertLessEqual(stats['bytes'], 1000)
+        self.assertEqual(stats['samples'], 2)
+        times, frames = self.store.range('camera', 0, 1)
+        self.assertEqual(len(frames), 2)
+        np.testing.assert_allclose(times, [8 / 30, 9 / 30])
+
+    def test_queries_while_inserting(self):
+        stop = threading.Event()
+        errors = []
+
+        def query():
+            while not stop.is_set():
+                times, values = self.store.range('imu', 0, 1e9)
+                if len(times) and not (np.all(np.diff(times) >= 0)
+                                       and np.allclose(values['accel'][:, 0], times, rtol=1e-5)):
+                    errors.append(times)
+
+        readers = [threading.Thread(target=query) for _ in range(2)]
+        for reader in readers:
+            reader.start()
+        self.fill_imu(5000, rate=1000.0)
+        stop.set()
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import unittest
+import zmq
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import MJpegCamFrame
+from robonet.transport import open_pair, open_streams
+from robonet.util import BurstSender, MessageHandler
+
+
+class TestTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.sockets = []
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close(linger=0)
+        self.ctx.term()
+
+    def open(self, transport, port_offset=0):
+        server = open_pair(self.ctx, transport, 'server', '127.0.0.1', '127.0.0.1', port_offset)
+        client = open_pair(self.ctx, transport, 'client', '127.0.0.1', '127.0.0.1', port_offset)
+        self.sockets.extend(server + client)
+        return server, client
+
+    def round_trip(self, transport, port_offset=0):
+        (server_radio, server_dish), (client_radio, client_dish) = self.open(transport, port_offset)
+        received = []
+        handler = MessageHandler(lambda msg: received.append(unpack_obj(msg)))
+        frame = MJpegCamFrame(1, 2, os.urandom(100000))
+
+        BurstSender(client_radio)(pack_obj(frame))
+        parts = 0
+        while not received:
+            handler.transition(server_dish.recv(copy=False).bytes)
+            parts += 1
+        self.assertEqual(received[0].mjpeg, frame.mjpeg)
+
+        BurstSender(server_radio)(pack_obj(frame))
+        self.assertIsNotNone(client_dish.recv())
+        return parts
+
+    def test_stream_transports_skip_fragmentation(self):
+        for transport, offset in [('inproc', 0), ('ipc', 10), ('tcp', 20)]:
+            with self.subTest(transport=transport):
+                self.assertEqual(self.round_trip(transport, offset), 1)
+
+    def test_rcvtimeo(self):
+        (_, server_dish), _ = self.open('inproc')
+        server_dish.rcvtimeo = 0
+        with self.assertRaises(zmq.Again):
+            server_dish.recv()
+
+    def test_streams_on_different_transports(self):
+        streams = {'control': 'inproc', 'bulk': 'tcp'}
+        server = open_streams(self.ctx, streams, 'server', '127.0.0.1', '127.0.0.1')
+        client = open_streams(self.ctx, streams, 'client', '127.0.0.1', '127.0.0.1')
+        for pairs in (server, client):
+            for pair in pairs.values():
+                self.sockets.extend(pair)
+        client['control'][0].send(b'\x04\x00stop', group='direct')
+        client['bulk'][0].send(b'\x04\x00' + b'x' * 10, group='direct')
+        self.assertEqual(server['control'][1].recv(), b'\x04\x00stop')
+        self.assertEqual(server['bulk'][1].recv(), b'\x04\x00' + b'x' * 10)
+
+    def test_unknown_transport(self):
+        with self.assertRaises(ValueError):
+            open_pair(self.ctx, 'carrier_pigeon', 'server', '127.0.0.1', '127.0.0.1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+import zmq
+from robonet.buffers.buffer_objects import Capabilities, WifiSetupInfo
+from robonet.udp_handshake import (ServerTinyHandshakeStateMachine, ClientTinyHandshakeStateMachine, RetryPolicy,
+                                   run_handshake)
+
+
+class CorruptFirstSend:
+    """Wraps a socket and flips a byte in the first message sent through it."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.corrupted = False
+
+    def send(self, message):
+        if not self.corrupted:
+            self.corrupted = True
+            message = message[:-6] + bytes([message[-6] ^ 0xFF]) + message[-5:]
+        self.sock.send(message)
+
+
+class TestTinyHandshake(unittest.TestCase):
+    """PAIR sockets over inproc stand in for the RADIO/DISH pairs."""
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.server_sock = self.ctx.socket(zmq.PAIR)
+        self.server_sock.bind('inproc://handshake')
+        self.client_sock = self.ctx.socket(zmq.PAIR)
+        self.client_sock.connect('inproc://handshake')
+
+    def tearDown(self):
+        self.server_sock.close(0)
+        self.client_sock.close(0)
+        self.ctx.term()
+
+    def handshake(self, server, client):
+        results = {}
+        client_thread = threading.Thread(target=lambda: results.update(client=run_handshake(client)))
+        client_thread.start()
+        start = time.monotonic()
+        results['server'] = run_handshake(server)
+        results['elapsed'] = time.monotonic() - start
+        client_thread.join()
+        return results
+
+    def test_handshake_negotiates(self):
+        wifi = WifiSetupInfo("robot_wifi", "192.168.2.1", "192.168.2.2", "pw")
+        server = ServerTinyHandshakeStateMachine(self.server_sock, self.server_sock, wifi,
+                                                 capabilities=Capabilities(2, 8000, 2, "zlib,none"))
+        client = ClientTinyHandshakeStateMachine(self.client_sock, self.client_sock,
+                                                 capabilities=Capabilities(1, 1400, 1, "lz4,zlib,none"))
+        results = self.handshake(server, client)
+
+        self.assertEqual(results['client'].__dict__, wifi.__dict__)
+        self.assertIsInstance(results['client'], WifiSetupInfo)
+        self.assertEqual(server.capabilities.__dict__, client.capabilities.__dict__)
+        self.assertEqual(server.capabilities.__dict__,
+                         {'codec_version': 1, 'mtu': 1400, 'fec': 1, 'compression': 'zlib'})
+        self.assertLess(results['elapsed'], 0.05)
+
+    def test_corrupted_object_is_nacked_and_resent(self):
+        wifi = WifiSetupInfo("robot_wifi", "192.168.2.1", "192.168.2.2")
+        server = ServerTinyHandshakeStateMachine(CorruptFirstSend(self.server_sock), self.server_sock, wifi)
+        client = ClientTinyHandshakeStateMachine(self.client_sock, self.client_sock)
+        results = self.handshake(server, client)
+        self.assertEqual(results['client'].ssid, "robot_wifi")
+
+    def test_negotiation_is_symmetric(self):
+        server, client = Capabilities(compression="zlib,lz4"), Capabilities(compression="lz4,zlib")
+        self.assertEqual(server.negotiate(client).compression, client.negotiate(server).compression)
+        server, client = Capabilities(compression="zlib,lz4,none"), Capabilities(compression="none,lz4")
+        self.assertEqual(server.negotiate(client).compression, "lz4")
+        self.assertEqual(client.negotiate(server).compression, "lz4")
+        self.assertEqual(Capabilities(compression="lz4").negotiate(Capabilities(compression="zlib")).compression,
+                         "none")
+
+    def test_handshake_with_reversed_preferences(self):
+        wifi = WifiSetupInfo("robot_wifi", "192.168.2.1", "192.168.2.2")
+        server = ServerTinyHandshakeStateMachine(self.server_sock, self.server_sock, wifi,
+                                                 capabilities=Capabilities(compression="zlib,lz4"))
+        client = ClientTinyHandshakeStateMachine(self.client_sock, self.client_sock,
+                                                 capabilities=Capabilities(compression="lz4,zlib"))
+        self.handshake(server, client)
+        self.assertEqual(server.capabilities.compression, client.capabilities.compression)
+
+    def test_retries_are_finite_by_default(self):
+        self.assertLess(sum(RetryPolicy().timeouts()), 60)
+
+    def test_gives_up_after_max_retries(self):
+        wifi = WifiSetupInfo("robot_wifi", "192.168.2.1", "192.168.2.2")
+        server = ServerTinyHandshakeStateMachine(self.server_sock, self.server_sock, wifi,
+                                                 retry_policy=RetryPolicy(timeout=0.001, max_retries=2))
+        with self.assertRaises(TimeoutError):
+            run_handshake(server)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import threading
+import unittest
+import zmq
+from robonet.buffers.buffer_handling import pack_obj, unpack_obj
+from robonet.buffers.buffer_objects import IMUBuffer, MJpegCamFrame
+from robonet.receive_callbacks import receive_objs
+from robonet.transport import open_pair
+from robonet.udp_transport import UdpRadio
+from robonet.util import BufferedMessageHandler, BurstSender, MessageHandler, _checksummed
+
+
+class TestUdpTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.server = open_pair(self.ctx, 'rawudp', 'server', '127.0.0.1', '127.0.0.1', port_offset=40)
+        self.client = open_pair(self.ctx, 'rawudp', 'client', '127.0.0.1', '127.0.0.1', port_offset=40)
+
+    def tearDown(self):
+        for sock in self.server + self.client:
+            sock.close()
+        self.ctx.term()
+
+    def test_drain_reassembles(self):
+        radio, dish = self.client[0], self.server[1]
+        messages = [os.urandom(size) for size in (10, 4094, 4095, 100000, 3)]
+        send = BurstSender(radio)
+        for message in messages:
+            send(message)
+        received = []
+        handler = BufferedMessageHandler(received.append, initial_size=1024)  # has to grow for the big one
+        while len(received) < len(messages):
+            self.assertGreater(dish.drain(handler.feed, 1.0), 0)
+        self.assertEqual(received, messages)
+
+    def test_recv_and_groups(self):
+        radio, dish = self.client[0], self.server[1]
+        radio.send(b'elsewhere', group='other')
+        radio.send(b'hello')
+        self.assertEqual(dish.recv(), b'hello')
+        self.assertEqual(dish.foreign, 1)
+        dish.rcvtimeo = 0
+        with self.assertRaises(zmq.Again):
+            dish.recv()
+
+    def test_receive_objs_drains(self):
+        radio, dish = self.client[0], self.server[1]
+        received = []
+        stop = threading.Event()
+
+        def handle(obj):
+            received.append(obj)
+            if len(received) == 2:
+                stop.set()
+        receiver = threading.Thread(target=asyncio.run, args=(receive_objs(
+            {'MJpegCamFrame': handle, 'IMUBuffer': handle}, stop=stop)(self.server[0], dish),))
+        receiver.start()
+        send = BurstSender(radio)
+        frame = MJpegCamFrame(1, 2, os.urandom(20000))
+        send(pack_obj(frame))
+        send(pack_obj(IMUBuffer((1.0, 2.0, 3.0))))
+        receiver.join(5)
+        self.assertFalse(receiver.is_alive())
+        self.assertEqual(received[0].mjpeg, frame.mjpeg)
+        self.assertEqual(received[1].accel_data, (1.0, 2.0, 3.0))
+
+    def test_idle_drain_doesnt_block_the_event_loop(self):
+        stop = threading.Event()
+
+        async def ticks():
+            start = asyncio.get_running_loop().time()
+            for _ in range(50):
+                await asyncio.sleep(0.001)
+            stop.set()
+            return asyncio.get_running_loop().time() - start
+
+        async def main():
+            receive = asyncio.ensure_future(receive_objs({}, stop=stop)(self.server[0], self.server[1]))
+            elapsed = await ticks()
+            await receive
+            return elapsed
+
+        self.assertLess(asyncio.run(main()), 0.3)  # 50 ticks would take 0.5s behind a 10ms select
+
+
+class TestBufferedMessageHandler(unittest.TestCase):
+
+    def test_same_as_message_handler(self):
+        sequences = [
+            [b'\x04\x00one'],
+            [b'\x01\x01ab', b'\x02\x01cd', b'\x03\x01ef'],
+            [b'\x01\x01ab', b'\x01\x02cd', b'\x03\x02ef'],  # end lost
+            [b'\x01\x01ab', b'\x03\x02ef', b'\x04\x03gh'],  # interleaved
+            [b'\x02\x01cd', b'\x04\x01gh'],  # start lost
+            [b'\x01\x01ab', b'\x04\x01gh'],
+            [b''],
+            [_checksummed(b'\x01\x05abc'), b'\x03\x05'],  # checksummed start, short unflagged end
+            [_checksummed(b'\x01\x05abc'), b'\x03\x05defghijk'],
+            [b'\x01\x05abc', _checksummed(b'\x03\x05defghijk')],
+        ]
+        for sequence in sequences:
+            with self.subTest(sequence=sequence):
+                expected, received = [], []
+                reference = MessageHandler(expected.append)
+                buffered = BufferedMessageHandler(received.append)
+                for part in sequence:
+                    reference.transition(part)
+                    buffer = bytearray(b'xx' + part + b'yy')  # parts arrive as regions of a reused buffer
+                    buffered.feed(memoryview(buffer), 2, 2 + len(part))
+                self.assertEqual(received, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()